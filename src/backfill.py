@@ -0,0 +1,250 @@
+"""Rebuild sink output from bounded input with the streaming transformations.
+
+Three sources are supported:
+
+* ``csv PATH``: a batch job over a file or directory of transaction CSVs in
+  the sample layout
+* ``kafka``: a batch job over an explicit offset (or producer timestamp)
+  range of the transactions topic
+* ``kafka --available-now``: the streaming queries themselves, on their own
+  ``backfill_*`` checkpoints, stopped once the data available at start has
+  been processed
+
+Every source goes through ``enrich_transactions``, ``build_pipeline`` and the
+per-batch ``enrich_batch`` and is written by the sink writers of
+``process_stream``, so the rows match what the stream wrote for the same
+input. Only ``processed_at`` and ``processing_date`` differ, and the batch
+``user_stats`` keep windows the stream would have dropped as later than
+``STATS_WATERMARK``. Alerts are never replayed. To rebuild a day next to the
+live output, point ``OUTPUT_URI`` at a separate location.
+"""
+import argparse
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from pyspark.sql.functions import col, concat, current_timestamp, element_at, input_file_name, lit, split, xxhash64
+from pyspark.sql.types import StringType, StructField, StructType
+
+from . import fs_utils
+from .batch_commit import scoped_commits
+from .spark_streaming_consumer import (
+    SINK_WRITERS,
+    VELOCITY_FEATURES,
+    build_pipeline,
+    build_user_stats,
+    checkpoint_path,
+    create_spark_session,
+    enrich_transactions,
+    kafka_source_options,
+    make_fanout_writer,
+    make_user_stats_writer,
+    parse_kafka_events,
+    start_pipeline_query,
+    start_user_stats_query,
+    with_typed_fields,
+)
+
+
+BACKFILL_SINKS = sorted(SINK_WRITERS) + ["user_stats"]
+DEFAULT_SINKS = ["transactions", "user_stats"]
+# batch_id of the batch-mode sink writes; each backfill commits it under a scope of its own
+BACKFILL_BATCH_ID = 0
+
+CSV_COLUMNS = [
+    "User", "Card", "Year", "Month", "Day", "Time", "Amount", "Use Chip", "Merchant Name",
+    "Merchant City", "Merchant State", "Zip", "MCC", "Errors?", "Is Fraud?",
+]
+
+
+def read_csv_transactions(spark, path: str, streaming: bool = False, max_files_per_trigger: int = 0):
+    """Read transaction CSVs (sample layout) into the typed rows the Kafka parsers produce.
+
+    The files carry no ``processing_timestamp`` or ``record_id``: the read time
+    stands in for the former and the latter is left null. ``event_id`` is the
+    file name and a hash of the row, so a row repeated in a file counts as a
+    duplicate.
+    """
+    csv_schema = StructType([StructField(name, StringType()) for name in CSV_COLUMNS])
+    if streaming:
+        reader = spark.readStream.schema(csv_schema).option("header", "true")
+        if max_files_per_trigger:
+            reader = reader.option("maxFilesPerTrigger", max_files_per_trigger)
+        df = reader.csv(path)
+    else:
+        df = spark.read.schema(csv_schema).option("header", "true").csv(path)
+    df = df.withColumn("processing_timestamp", current_timestamp().cast("string")).withColumn(
+        "record_id", lit(None).cast("string")
+    )
+    df = df.withColumn(
+        "event_id",
+        concat(
+            element_at(split(input_file_name(), "/"), -1),
+            lit(":"),
+            xxhash64(*[col(f"`{name}`") for name in CSV_COLUMNS]).cast("string"),
+        ),
+    )
+    return with_typed_fields(df)
+
+
+def read_kafka_range(
+    spark,
+    starting_offsets: str = "earliest",
+    ending_offsets: str = "latest",
+    starting_timestamp: Optional[int] = None,
+    ending_timestamp: Optional[int] = None,
+):
+    """Batch-read a range of the transactions topic and decode it.
+
+    Offsets take Spark's JSON form (``{"topic": {"0": 42}}``) or
+    ``earliest``/``latest``; timestamps (epoch ms, matched against the Kafka
+    record timestamp, i.e. when the producer sent it) override them.
+    """
+    options = kafka_source_options()
+    options.pop("maxOffsetsPerTrigger", None)
+    options.update(startingOffsets=starting_offsets, endingOffsets=ending_offsets)
+    if starting_timestamp is not None:
+        options["startingTimestamp"] = str(starting_timestamp)
+    if ending_timestamp is not None:
+        options["endingTimestamp"] = str(ending_timestamp)
+    return parse_kafka_events(spark.read.format("kafka").options(**options).load())
+
+
+def run_batch(spark, df_cleaned, sinks: List[str]) -> None:
+    """Process decoded rows as one batch and write them to ``sinks``.
+
+    The batch is committed under a new scope (see ``scoped_commits``), so it
+    never counts as a replay of an earlier backfill or stream batch.
+    """
+    df_output = enrich_transactions(df_cleaned)
+    batch_sinks = [sink for sink in sinks if sink != "user_stats"]
+    with scoped_commits(spark, "backfill") as scope:
+        print(f"[Backfill] Committing as {scope}")
+        if batch_sinks:
+            started = time.perf_counter()
+            make_fanout_writer(spark, batch_sinks)(build_pipeline(df_output), BACKFILL_BATCH_ID)
+            print(f"[Backfill] Wrote {', '.join(batch_sinks)} in {time.perf_counter() - started:.1f}s")
+        if "user_stats" in sinks:
+            started = time.perf_counter()
+            make_user_stats_writer()(build_user_stats(df_output), BACKFILL_BATCH_ID)
+            print(f"[Backfill] Wrote user_stats in {time.perf_counter() - started:.1f}s")
+
+
+def stop_when_drained(query, poll_seconds: float = 1.0) -> None:
+    """Stop ``query`` once a batch read nothing and no more input is available.
+
+    Used instead of ``Trigger.AvailableNow`` for queries with processing-time
+    state timeouts, which never finish on their own.
+    """
+    while query.isActive:
+        time.sleep(poll_seconds)
+        progress = query.lastProgress
+        if progress and progress["numInputRows"] == 0 and not query.status["isDataAvailable"]:
+            query.stop()
+    query.awaitTermination()
+
+
+def run_available_now(spark, sinks: List[str], starting_offsets: str = "earliest", fresh: bool = False) -> None:
+    """Run the streaming queries over the topic on ``backfill_*`` checkpoints until caught up.
+
+    A rerun continues from the checkpoints; ``fresh`` deletes them first.
+    """
+    if fresh:
+        for name in ("backfill_pipeline", "backfill_user_statistics"):
+            fs_utils.delete(spark, checkpoint_path(name))
+
+    options = dict(kafka_source_options(), startingOffsets=starting_offsets)
+    df_stream = spark.readStream.format("kafka").options(**options).load()
+    df_output = enrich_transactions(parse_kafka_events(df_stream))
+
+    started = time.perf_counter()
+    drained, finishing = [], []
+    batch_sinks = [sink for sink in sinks if sink != "user_stats"]
+    if batch_sinks:
+        query = start_pipeline_query(
+            spark,
+            df_output,
+            batch_sinks,
+            checkpoint="backfill_pipeline",
+            trigger={"processingTime": "0 seconds"} if VELOCITY_FEATURES else {"availableNow": True},
+            name="backfill_pipeline",
+        )
+        (drained if VELOCITY_FEATURES else finishing).append(query)
+    if "user_stats" in sinks:
+        finishing.append(
+            start_user_stats_query(
+                spark,
+                df_output,
+                checkpoint="backfill_user_statistics",
+                trigger={"availableNow": True},
+                name="backfill_user_statistics",
+            )
+        )
+    for query in drained:
+        stop_when_drained(query)
+    for query in finishing:
+        query.awaitTermination()
+    print(f"[Backfill] Caught up in {time.perf_counter() - started:.1f}s")
+
+
+def _round_doubles(df, digits: int = 9):
+    from pyspark.sql.functions import col, round
+
+    return df.select(
+        *[
+            round(col(f"`{field.name}`"), digits).alias(field.name) if field.dataType.typeName() == "double"
+            else col(f"`{field.name}`")
+            for field in df.schema.fields
+        ]
+    )
+
+
+def _epoch_ms(value: Optional[str]) -> Optional[int]:
+    return None if value is None else int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reprocess history with the streaming transformations.")
+    parser.add_argument(
+        "--sinks",
+        default=",".join(DEFAULT_SINKS),
+        help=f"Comma-separated sinks to rebuild, from {BACKFILL_SINKS}.",
+    )
+    subparsers = parser.add_subparsers(dest="source", required=True)
+    csv_parser = subparsers.add_parser("csv", help="Batch job over transaction CSV files.")
+    csv_parser.add_argument("path", help="CSV file or directory (local, file:// or hdfs://).")
+    kafka_parser = subparsers.add_parser("kafka", help="Batch job, or AvailableNow stream, over the topic.")
+    kafka_parser.add_argument("--starting-offsets", default="earliest", help='"earliest" or Spark offset JSON.')
+    kafka_parser.add_argument("--ending-offsets", default="latest", help='"latest" or Spark offset JSON.')
+    kafka_parser.add_argument("--from-time", help="Start at records sent at or after this ISO time.")
+    kafka_parser.add_argument("--to-time", help="Stop at records sent before this ISO time.")
+    kafka_parser.add_argument(
+        "--available-now",
+        action="store_true",
+        help="Run the streaming queries on backfill checkpoints until caught up (ignores the ending options).",
+    )
+    kafka_parser.add_argument("--fresh", action="store_true", help="Delete the backfill checkpoints first.")
+    args = parser.parse_args(argv)
+
+    sinks = [sink.strip() for sink in args.sinks.split(",") if sink.strip()]
+    unknown = [sink for sink in sinks if sink not in BACKFILL_SINKS]
+    if unknown:
+        parser.error(f"Unknown sinks {unknown}, expected a subset of {BACKFILL_SINKS}")
+
+    spark = create_spark_session("CreditCardBackfill", packages=args.source == "kafka")
+    try:
+        if args.source == "csv":
+            run_batch(spark, read_csv_transactions(spark, args.path), sinks)
+        elif args.available_now:
+            run_available_now(spark, sinks, args.starting_offsets, fresh=args.fresh)
+        else:
+            df_cleaned = read_kafka_range(
+                spark, args.starting_offsets, args.ending_offsets, _epoch_ms(args.from_time), _epoch_ms(args.to_time)
+            )
+            run_batch(spark, df_cleaned, sinks)
+    finally:
+        spark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Idempotent per-batch commits for the file sinks.
+
+Spark replays the last micro-batch after a crash whenever the batch was
+written but its commit was not yet recorded in the checkpoint. A sink that
+appends would then write that batch twice. ``commit_batch`` ties every file
+to the batch that produced it instead:
+
+1. the batch is written to ``<root>/_staging/batch-<scope>-<id>-<uuid>``
+2. files recorded for the same batch by an earlier attempt are deleted
+3. the new file list is recorded in ``<root>/_batches/<sequence>.<scope>.<id>.json``
+4. the staged files are renamed into place as ``<partition>/b<sequence>-<name>``
+
+Batch ids restart at 0 with every new checkpoint and every backfill, so a
+batch is identified by its id together with a scope: the streaming query id,
+which Spark keeps in the checkpoint, or the ``COMMIT_SCOPE_PROPERTY`` local
+property a batch job sets (see ``commit_scope``). The sequence numbers the
+commits of a root in order across runs: one past the newest manifest, or
+that of the earlier attempt when a batch is replayed.
+
+A crash at any point leaves a manifest listing every file a replay has to
+remove, so a replayed batch overwrites its own output. Readers never see
+the ``_``-prefixed directories. Only the last ``BATCH_MANIFEST_RETAIN``
+manifests are kept, since Spark replays only the most recent batches.
+"""
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from . import fs_utils
+
+
+BATCH_MANIFEST_RETAIN = int(os.getenv("BATCH_MANIFEST_RETAIN", "100"))
+# Spark local property naming the commit scope of a batch job's sink writes
+COMMIT_SCOPE_PROPERTY = "credit.commit.scope"
+_QUERY_ID_PROPERTY = "sql.streaming.queryId"
+
+
+def _target_name(relative_path: str, sequence: int) -> str:
+    directory, _, name = relative_path.rpartition("/")
+    name = f"b{sequence:010d}-{name}"
+    return f"{directory}/{name}" if directory else name
+
+
+def _manifest_name(sequence: int, scope: str, batch_id: int) -> str:
+    return f"{sequence:010d}.{scope}.{batch_id}.json"
+
+
+def _manifests(names: Iterable[str]) -> List[Tuple[int, Optional[str], Optional[int], str]]:
+    """Parse manifest names into (sequence, scope, batch id, name), oldest first.
+
+    Manifests named ``<batch id>.json`` by older versions count as sequences
+    without a scope, so the sequence continues after them.
+    """
+    manifests = []
+    for name in names:
+        parts = name[: -len(".json")].split(".") if name.endswith(".json") else []
+        if len(parts) == 3 and parts[0].isdigit() and parts[2].isdigit():
+            manifests.append((int(parts[0]), parts[1], int(parts[2]), name))
+        elif len(parts) == 1 and parts[0].isdigit():
+            manifests.append((int(parts[0]), None, None, name))
+    return sorted(manifests)
+
+
+def _find_sequence(manifests, scope: str, batch_id: int) -> Tuple[int, Optional[str]]:
+    """Return the sequence of batch ``batch_id`` of ``scope`` and the manifest of its earlier attempt."""
+    for sequence, manifest_scope, manifest_batch, name in manifests:
+        if (manifest_scope, manifest_batch) == (scope, batch_id):
+            return sequence, name
+    return (manifests[-1][0] + 1 if manifests else 0), None
+
+
+def _expired(manifests, sequence: int) -> List[str]:
+    oldest_kept = sequence - BATCH_MANIFEST_RETAIN
+    return [name for manifest_sequence, _, _, name in manifests if manifest_sequence <= oldest_kept]
+
+
+def commit_scope(spark) -> str:
+    """Return the scope of the batch being written: the streaming query id, else ``COMMIT_SCOPE_PROPERTY``.
+
+    Raises ValueError outside a streaming query and a ``scoped_commits`` block.
+    """
+    context = spark.sparkContext
+    scope = context.getLocalProperty(_QUERY_ID_PROPERTY) or context.getLocalProperty(COMMIT_SCOPE_PROPERTY)
+    if not scope:
+        raise ValueError("Sink writes need a streaming query or a scoped_commits() block")
+    return scope
+
+
+@contextmanager
+def scoped_commits(spark, prefix: str = "batch"):
+    """Commit the batches written in this block (and thread) under a new unique scope, which is yielded."""
+    scope = f"{prefix}-{uuid.uuid4().hex}"
+    spark.sparkContext.setLocalProperty(COMMIT_SCOPE_PROPERTY, scope)
+    try:
+        yield scope
+    finally:
+        spark.sparkContext.setLocalProperty(COMMIT_SCOPE_PROPERTY, None)
+
+
+def batch_sequence(spark, root: str, batch_id: int) -> int:
+    """Return the sequence batch ``batch_id`` of the current scope commits under ``root`` as."""
+    names = [name for name, _, _ in fs_utils.list_dir(spark, f"{root}/_batches")]
+    return _find_sequence(_manifests(names), commit_scope(spark), batch_id)[0]
+
+
+def local_batch_sequence(root: Path, batch_id: int, scope: str) -> int:
+    """``batch_sequence`` for a local directory, without Spark."""
+    manifest_root = Path(root) / "_batches"
+    names = [path.name for path in manifest_root.iterdir()] if manifest_root.exists() else []
+    return _find_sequence(_manifests(names), scope, batch_id)[0]
+
+
+def commit_batch(spark, root: str, batch_id: int, write: Callable[[str], None]) -> List[str]:
+    """Write batch ``batch_id`` of the current scope under ``root``, replacing what an earlier attempt wrote.
+
+    ``write`` writes the batch to the staging path it is given, partition
+    directories included. Returns the committed files, relative to ``root``.
+    """
+    scope = commit_scope(spark)
+    staging_root = f"{root}/_staging"
+    prefix = f"batch-{scope}-{batch_id}-"
+    for name, _, _ in fs_utils.list_dir(spark, staging_root):
+        if name.startswith(prefix):
+            fs_utils.delete(spark, f"{staging_root}/{name}")
+    staging = f"{staging_root}/{prefix}{uuid.uuid4().hex}"
+    write(staging)
+
+    manifest_root = f"{root}/_batches"
+    manifests = _manifests(name for name, _, _ in fs_utils.list_dir(spark, manifest_root))
+    sequence, earlier = _find_sequence(manifests, scope, batch_id)
+    if earlier is not None:
+        previous = json.loads(fs_utils.read_text(spark, f"{manifest_root}/{earlier}"))
+        for name in previous:
+            fs_utils.delete(spark, f"{root}/{name}", recursive=False)
+        print(f"[Commit] {root}: batch {batch_id} replayed, replaced {len(previous)} files")
+
+    staged = [name for name, _ in fs_utils.list_data_files_recursive(spark, staging)]
+    targets = [_target_name(name, sequence) for name in staged]
+    fs_utils.mkdirs(spark, manifest_root)
+    fs_utils.write_text(spark, f"{manifest_root}/{_manifest_name(sequence, scope, batch_id)}", json.dumps(targets))
+    for name, target in zip(staged, targets):
+        fs_utils.rename(spark, f"{staging}/{name}", f"{root}/{target}")
+    fs_utils.delete(spark, staging)
+    for name in _expired(manifests, sequence):
+        fs_utils.delete(spark, f"{manifest_root}/{name}", recursive=False)
+    return targets
+
+
+def commit_local_batch(root: Path, batch_id: int, write: Callable[[Path], None], scope: str) -> List[str]:
+    """``commit_batch`` for a local directory, without Spark (used by the local engine)."""
+    root = Path(root)
+    staging_root = root / "_staging"
+    prefix = f"batch-{scope}-{batch_id}-"
+    if staging_root.exists():
+        for stale in staging_root.glob(f"{prefix}*"):
+            shutil.rmtree(stale, ignore_errors=True)
+    staging = staging_root / f"{prefix}{uuid.uuid4().hex}"
+    staging.mkdir(parents=True)
+    write(staging)
+
+    manifest_root = root / "_batches"
+    manifests = _manifests(path.name for path in manifest_root.iterdir()) if manifest_root.exists() else []
+    sequence, earlier = _find_sequence(manifests, scope, batch_id)
+    if earlier is not None:
+        previous = json.loads((manifest_root / earlier).read_text())
+        for name in previous:
+            (root / name).unlink(missing_ok=True)
+        print(f"[Commit] {root}: batch {batch_id} replayed, replaced {len(previous)} files")
+
+    staged = sorted(
+        path.relative_to(staging).as_posix()
+        for path in staging.rglob("*")
+        if path.is_file() and not path.name.startswith((".", "_"))
+    )
+    targets = [_target_name(name, sequence) for name in staged]
+    manifest_root.mkdir(parents=True, exist_ok=True)
+    (manifest_root / _manifest_name(sequence, scope, batch_id)).write_text(json.dumps(targets))
+    for name, target in zip(staged, targets):
+        (root / target).parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staging / name, root / target)
+    shutil.rmtree(staging, ignore_errors=True)
+    for name in _expired(manifests, sequence):
+        (manifest_root / name).unlink(missing_ok=True)
+    return targets
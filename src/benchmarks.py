@@ -0,0 +1,770 @@
+"""Manual benchmarks for the credit card pipeline.
+
+Run a benchmark with ``python -m src.benchmarks <name>``; see ``--help`` for
+the list of available benchmarks.
+"""
+import argparse
+import csv
+import json
+import math
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SAMPLE_CSV = BASE_DIR / "data" / "User0_credit_card_transactions.csv"
+
+
+def load_sample_rows(limit: int = 0) -> List[Dict]:
+    """Load the sample CSV as producer-style row dicts."""
+    rows = []
+    with SAMPLE_CSV.open("r", encoding="utf-8") as file:
+        for record_id, row in enumerate(csv.DictReader(file)):
+            if limit and record_id >= limit:
+                break
+            row["processing_timestamp"] = "2024-01-01T00:00:00.000000"
+            row["record_id"] = record_id
+            rows.append(row)
+    return rows
+
+
+def _rate(count: int, seconds: float) -> str:
+    return f"{count / seconds:>12,.0f} rows/s" if seconds else "n/a"
+
+
+def benchmark_wire_format(rows: int = 0, repeat: int = 3) -> None:
+    """Compare message size and encode/decode throughput of JSON vs the binary format."""
+    from .wire_format import decode_typed, encode_json, encode_typed, to_typed_record
+
+    sample = load_sample_rows(rows)
+
+    def best_of(func) -> float:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    json_messages = [encode_json(row) for row in sample]
+    binary_messages = [encode_typed(to_typed_record(row)) for row in sample]
+
+    def json_decode_typed():
+        # What the consumer must do with JSON: parse, then re-parse strings into types
+        for message in json_messages:
+            row = json.loads(message)
+            float(row["Amount"].replace("$", ""))
+            int(row["MCC"])
+            (int(row["Year"]), int(row["Month"]), int(row["Day"]), row["Time"].split(":"))
+
+    results = {
+        "json": {
+            "bytes": sum(len(m) for m in json_messages),
+            "encode": best_of(lambda: [encode_json(row) for row in sample]),
+            "decode": best_of(lambda: [json.loads(m) for m in json_messages]),
+            "decode_typed": best_of(json_decode_typed),
+        },
+        "binary": {
+            "bytes": sum(len(m) for m in binary_messages),
+            "encode": best_of(lambda: [encode_typed(to_typed_record(row)) for row in sample]),
+            "decode": best_of(lambda: [decode_typed(m) for m in binary_messages]),
+        },
+    }
+    results["binary"]["decode_typed"] = results["binary"]["decode"]
+
+    count = len(sample)
+    print("=" * 80)
+    print(f"WIRE FORMAT BENCHMARK ({count} rows, best of {repeat})")
+    print("=" * 80)
+    for name, result in results.items():
+        print(
+            f"{name:7} | avg {result['bytes'] / count:6.1f} B/msg | "
+            f"encode {_rate(count, result['encode'])} | "
+            f"decode {_rate(count, result['decode'])} | "
+            f"decode+typed {_rate(count, result['decode_typed'])}"
+        )
+    print("-" * 80)
+    print(f"Size reduction: {1 - results['binary']['bytes'] / results['json']['bytes']:.1%}")
+
+
+def create_local_spark(app_name: str = "CreditCardBenchmark"):
+    """Create a local Spark session without Kafka packages for batch benchmarks."""
+    from pyspark.sql import SparkSession
+
+    spark = (
+        SparkSession.builder.appName(app_name)
+        .master("local[*]")
+        .config("spark.ui.enabled", "false")
+        .config("spark.ui.showConsoleProgress", "false")
+        .getOrCreate()
+    )
+    spark.sparkContext.setLogLevel("WARN")
+    return spark
+
+
+def load_sample_frame(spark, copies: int = 1):
+    """Read the sample CSV into the typed layout produced by the Kafka parsers."""
+    from pyspark.sql.functions import col, concat, current_timestamp, lit, monotonically_increasing_id
+
+    from .spark_streaming_consumer import with_typed_fields
+
+    df = spark.read.option("header", "true").csv(str(SAMPLE_CSV))
+    if copies > 1:
+        df = df.crossJoin(spark.range(copies).withColumnRenamed("id", "copy")).drop("copy")
+    df = (
+        df.withColumn("processing_timestamp", current_timestamp().cast("string"))
+        .withColumn("record_id", monotonically_increasing_id().cast("string"))
+        .withColumn("event_id", concat(lit(f"{SAMPLE_CSV.name}:"), col("record_id")))
+    )
+    return with_typed_fields(df)
+
+
+def _time_noop_write(df) -> float:
+    started = time.perf_counter()
+    df.write.format("noop").mode("overwrite").save()
+    return time.perf_counter() - started
+
+
+def benchmark_exchange_rate(rows: int = 0, copies: int = 20) -> None:
+    """Compare the per-row Python rate UDF with the per-batch literal rate."""
+    from pyspark.sql.functions import col, udf
+    from pyspark.sql.types import DoubleType
+
+    from .spark_streaming_consumer import apply_exchange_rate, enrich_transactions, select_output
+
+    spark = create_local_spark()
+    rate = 25000.0
+    df = enrich_transactions(load_sample_frame(spark, copies)).cache()
+    if rows:
+        df = df.limit(rows)
+    count = df.count()
+
+    # Equivalent of the old zero-argument UDF, minus the network call, so only
+    # the Python worker round trip is measured.
+    row_udf = udf(lambda: rate, DoubleType())
+    before = select_output(
+        df.withColumn("exchange_rate", row_udf()).withColumn("Amount_VND", col("Amount_USD") * col("exchange_rate"))
+    )
+    after = select_output(apply_exchange_rate(df, rate))
+
+    _time_noop_write(after)  # warm up
+    udf_seconds = _time_noop_write(before)
+    literal_seconds = _time_noop_write(after)
+
+    print("=" * 80)
+    print(f"EXCHANGE RATE BENCHMARK ({count:,} rows = sample CSV x {copies})")
+    print("=" * 80)
+    print(f"Python UDF per row   | {udf_seconds:8.2f}s | {_rate(count, udf_seconds)}")
+    print(f"Per-batch literal    | {literal_seconds:8.2f}s | {_rate(count, literal_seconds)}")
+    print(f"Speed-up: {udf_seconds / literal_seconds:.1f}x")
+    df.unpersist()
+
+
+def benchmark_fraud_scoring(rows: int = 0, copies: int = 20) -> None:
+    """Compare the Arrow pandas UDF scorer with a row-at-a-time UDF using the same model."""
+    from pyspark.sql.functions import abs as spark_abs, col, max as spark_max, udf
+    from pyspark.sql.types import DoubleType
+
+    from .fraud_model import FRAUD_MODEL_PATH, INPUT_COLUMNS, add_fraud_score, load_model
+    from .spark_streaming_consumer import enrich_transactions
+
+    spark = create_local_spark()
+    df = enrich_transactions(load_sample_frame(spark, copies)).select(*INPUT_COLUMNS).cache()
+    if rows:
+        df = df.limit(rows)
+    count = df.count()
+
+    model = load_model(FRAUD_MODEL_PATH)
+    weights, mean, scale, bias = model.weights.tolist(), model.mean.tolist(), model.scale.tolist(), model.bias
+
+    def score_row(amount, hour, day_of_week, use_chip, merchant_state):
+        # The same features and model in plain Python, one call per row
+        amount = amount or 0.0
+        angle = hour * 2 * math.pi / 24
+        features = [
+            math.log1p(abs(amount)),
+            amount < 0,
+            use_chip == "Online Transaction",
+            use_chip == "Chip Transaction",
+            math.sin(angle),
+            math.cos(angle),
+            day_of_week in (1, 7),
+            len(merchant_state or "") > 2,
+        ]
+        logit = bias + sum(w * (float(x) - m) / s for w, x, m, s in zip(weights, features, mean, scale))
+        return 1.0 / (1.0 + math.exp(-logit))
+
+    row_udf = udf(score_row, DoubleType())
+    before = df.withColumn("fraud_score", row_udf(*[col(name) for name in INPUT_COLUMNS]))
+
+    print("=" * 80)
+    print(f"FRAUD SCORING BENCHMARK ({count:,} rows = sample CSV x {copies})")
+    print("=" * 80)
+    row_seconds = _time_noop_write(before)
+    print(f"Row UDF                  | {row_seconds:8.2f}s | {_rate(count, row_seconds)}")
+    for batch_size in (1000, 10000, 50000):
+        spark.conf.set("spark.sql.execution.arrow.maxRecordsPerBatch", str(batch_size))
+        after = add_fraud_score(df)
+        _time_noop_write(after)  # warm up the workers and the model cache
+        seconds = _time_noop_write(after)
+        print(
+            f"Pandas UDF, batch {batch_size:>6,} | {seconds:8.2f}s | {_rate(count, seconds)} | "
+            f"{row_seconds / seconds:5.1f}x"
+        )
+
+    difference = (
+        add_fraud_score(before.withColumnRenamed("fraud_score", "row_score"))
+        .select(spark_max(spark_abs(col("fraud_score") - col("row_score"))))
+        .first()[0]
+    )
+    print(f"Max score difference between the two: {difference:.2e}")
+    df.unpersist()
+
+
+FIXTURES_DIR = BASE_DIR / "data" / "fixtures"
+
+
+def _parse_xml_etree(content: bytes) -> Dict:
+    # Previous implementation: stdlib ElementTree, imported on every call
+    from xml.etree import ElementTree as ET
+
+    from .exchange_rate_scraper import _clean_rate
+
+    root = ET.fromstring(content)
+    currencies = {}
+    for exrate in root.findall(".//Exrate"):
+        code = exrate.get("CurrencyCode")
+        if code:
+            currencies[code] = {
+                "name": exrate.get("CurrencyName", ""),
+                "buy": _clean_rate(exrate.get("Buy", "0")),
+                "transfer": _clean_rate(exrate.get("Transfer", "0")),
+                "sell": _clean_rate(exrate.get("Sell", "0")),
+            }
+    return currencies
+
+
+def _parse_html_bs4(content: bytes) -> Dict:
+    # Previous implementation: BeautifulSoup with the pure-Python html.parser
+    from bs4 import BeautifulSoup
+
+    from .exchange_rate_scraper import _clean_rate
+
+    soup = BeautifulSoup(content, "html.parser")
+    tbody = soup.select_one(".table-responsive tbody") or soup.find("tbody")
+    currencies = {}
+    for tr in tbody.find_all("tr") if tbody else []:
+        td = tr.find_all("td")
+        if len(td) >= 5:
+            currencies[td[0].get_text(strip=True)] = {
+                "buy": _clean_rate(td[2].get_text(strip=True)),
+                "transfer": _clean_rate(td[3].get_text(strip=True)),
+                "sell": _clean_rate(td[4].get_text(strip=True)),
+            }
+    return currencies
+
+
+def _rate_parsers() -> Dict:
+    from .exchange_rate_scraper import parse_api_xml, parse_rate_table_html
+
+    return {
+        "xml/ElementTree": (_parse_xml_etree, "vcb_exrates.xml"),
+        "xml/lxml": (parse_api_xml, "vcb_exrates.xml"),
+        "html/bs4+html.parser": (_parse_html_bs4, "vcb_rates.html"),
+        "html/lxml": (parse_rate_table_html, "vcb_rates.html"),
+    }
+
+
+def _parser_peak_memory_kb(name: str) -> Dict:
+    """Parse once in a fresh process; return the traced Python heap peak and max-RSS growth.
+
+    Both are reported because lxml allocates its tree through libxml2, which
+    tracemalloc does not see, while RSS growth is coarse (page granularity).
+    """
+    import resource
+    import tracemalloc
+    from xml.etree import ElementTree  # noqa: F401 - import cost is not part of the parse
+
+    import bs4  # noqa: F401
+    import lxml.html  # noqa: F401
+
+    parser, fixture = _rate_parsers()[name]
+    content = (FIXTURES_DIR / fixture).read_bytes()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    parser(content)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "traced": traced_peak // 1024,
+        "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline,
+    }
+
+
+def benchmark_rate_parsers(iterations: int = 500) -> None:
+    """Compare parse time and memory of the rate parsers on the recorded fixtures."""
+    import multiprocessing
+
+    parsers = _rate_parsers()
+    context = multiprocessing.get_context("spawn")
+
+    print("=" * 80)
+    print(f"RATE PARSER BENCHMARK ({iterations} parses per fixture)")
+    print("=" * 80)
+    for name, (parser, fixture) in parsers.items():
+        content = (FIXTURES_DIR / fixture).read_bytes()
+        expected = len(parser(content))
+        started = time.perf_counter()
+        for _ in range(iterations):
+            parser(content)
+        per_parse_ms = (time.perf_counter() - started) / iterations * 1000
+        with context.Pool(1) as pool:
+            memory = pool.apply(_parser_peak_memory_kb, (name,))
+        print(
+            f"{name:22} | {per_parse_ms:8.3f} ms/parse | heap peak {memory['traced']:6,} KiB | "
+            f"max RSS +{memory['rss']:6,} KiB | {expected} currencies"
+        )
+
+
+STREAM_CSV_COLUMNS = [
+    "User", "Card", "Year", "Month", "Day", "Time", "Amount", "Use Chip", "Merchant Name",
+    "Merchant City", "Merchant State", "Zip", "MCC", "Errors?", "Is Fraud?",
+]
+
+
+def _write_replay_chunks(directory: Path, rows: int, chunks: int, rounds: int, cards_per_file: int = 0) -> int:
+    """Write the sample rows in event-time order as ``chunks`` CSV files per round.
+
+    Each round repeats the sample shifted past the end of the previous one, so
+    event time keeps advancing for as long as the replay runs. With
+    ``cards_per_file`` every file gets its own user, with rows spread over that
+    many cards, to simulate a large and changing card population.
+    """
+    sample = sorted(
+        load_sample_rows(rows),
+        key=lambda row: (int(row["Year"]), int(row["Month"]), int(row["Day"]), row["Time"]),
+    )
+    span = int(sample[-1]["Year"]) - int(sample[0]["Year"]) + 1
+    chunk_size = -(-len(sample) // chunks)
+    file_index = 0
+    for round_index in range(rounds):
+        for start in range(0, len(sample), chunk_size):
+            with (directory / f"part-{file_index:05d}.csv").open("w", encoding="utf-8", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=STREAM_CSV_COLUMNS, extrasaction="ignore")
+                writer.writeheader()
+                for position, row in enumerate(sample[start:start + chunk_size]):
+                    row = dict(row, Year=int(row["Year"]) + round_index * span)
+                    if cards_per_file:
+                        row.update(User=file_index, Card=position % cards_per_file)
+                    writer.writerow(row)
+            file_index += 1
+    return len(sample) * rounds
+
+
+def _replay_stream(spark, source_dir: str):
+    """Stream the replay files one per trigger, enriched like the Kafka input."""
+    from .backfill import read_csv_transactions
+    from .spark_streaming_consumer import enrich_transactions
+
+    return enrich_transactions(read_csv_transactions(spark, source_dir, streaming=True, max_files_per_trigger=1))
+
+
+def _soak_run(spark, source_dir: str, checkpoint_dir: str, bounded: bool) -> List[Dict]:
+    """Replay ``source_dir`` one file per trigger and return the query progress reports."""
+    from pyspark.sql.functions import col, count, sum, window
+
+    from . import spark_streaming_consumer as consumer
+
+    df_output = _replay_stream(spark, source_dir)
+
+    if bounded:
+        stats, output_mode = consumer.build_user_stats(df_output), consumer.STATS_OUTPUT_MODE
+    else:
+        # The previous shape: no watermark, complete mode, every window kept forever
+        stats, output_mode = (
+            df_output.groupBy(window(col("transaction_datetime"), consumer.STATS_WINDOW), col("User"))
+            .agg(count("*").alias("transaction_count"), sum("Amount_USD").alias("total_amount_usd")),
+            "complete",
+        )
+
+    query = (
+        stats.writeStream.outputMode(output_mode)
+        .foreachBatch(lambda batch_df, batch_id: batch_df.write.format("noop").mode("overwrite").save())
+        .option("checkpointLocation", checkpoint_dir)
+        .trigger(availableNow=True)
+        .start()
+    )
+    query.awaitTermination()
+    return [progress for progress in query.recentProgress if progress.get("numInputRows")]
+
+
+def benchmark_stats_soak(rows: int = 0, chunks: int = 40, rounds: int = 3) -> None:
+    """Replay the sample in event-time order and track state size and batch duration.
+
+    Compares the watermarked user statistics with an unbounded complete-mode
+    aggregation over the same input; with the watermark both numbers should
+    stay flat from the first to the last batch.
+    """
+    import tempfile
+
+    from . import spark_streaming_consumer as consumer
+
+    spark = create_local_spark("CreditCardStatsSoak")
+    spark.conf.set("spark.sql.streaming.numRecentProgressUpdates", str(chunks * rounds + 10))
+    spark.conf.set("spark.sql.shuffle.partitions", "4")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        source_dir.mkdir()
+        total = _write_replay_chunks(source_dir, rows, chunks, rounds)
+
+        print("=" * 80)
+        print(
+            f"USER STATS SOAK ({total:,} rows, {chunks * rounds} batches, window {consumer.STATS_WINDOW}, "
+            f"watermark {consumer.STATS_WATERMARK})"
+        )
+        print("=" * 80)
+        for label, bounded in (("watermark + " + consumer.STATS_OUTPUT_MODE, True), ("no watermark + complete", False)):
+            progress = _soak_run(spark, str(source_dir), str(Path(tmp_dir) / f"checkpoint-{bounded}"), bounded)
+            state = [sum(op["numRowsTotal"] for op in report["stateOperators"]) for report in progress]
+            memory = [sum(op["memoryUsedBytes"] for op in report["stateOperators"]) for report in progress]
+            duration = [report["durationMs"]["triggerExecution"] for report in progress]
+            tenth = max(1, len(progress) // 10)
+
+            def _mean(values, part):
+                values = values[:tenth] if part == "first" else values[-tenth:]
+                return sum(values) / len(values)
+
+            print(f"{label}:")
+            print(f"  state rows      | first 10%: {_mean(state, 'first'):>12,.0f} | last 10%: {_mean(state, 'last'):>12,.0f}")
+            print(
+                f"  state memory KiB| first 10%: {_mean(memory, 'first') / 1024:>12,.0f} | "
+                f"last 10%: {_mean(memory, 'last') / 1024:>12,.0f}"
+            )
+            print(
+                f"  batch ms        | first 10%: {_mean(duration, 'first'):>12,.0f} | "
+                f"last 10%: {_mean(duration, 'last'):>12,.0f}"
+            )
+    spark.stop()
+
+
+def benchmark_velocity_state(rows: int = 0, chunks: int = 20, rounds: int = 1, cards_per_file: int = 200) -> None:
+    """Measure throughput and state size of the per-card velocity operator.
+
+    Every replay file introduces ``cards_per_file`` new cards; with a short
+    state timeout the cards of earlier files are evicted, so the state store
+    holds only the recently active ones.
+    """
+    import tempfile
+
+    from .spark_streaming_consumer import with_velocity_features
+
+    spark = create_local_spark("CreditCardVelocityState")
+    spark.conf.set("spark.sql.shuffle.partitions", "4")
+    timeout_seconds = 10
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        source_dir.mkdir()
+        total = _write_replay_chunks(source_dir, rows, chunks, rounds, cards_per_file)
+
+        features = with_velocity_features(_replay_stream(spark, str(source_dir)), timeout_seconds)
+        query = (
+            features.writeStream.outputMode("append")
+            .format("noop")
+            .option("checkpointLocation", str(Path(tmp_dir) / "checkpoint"))
+            .trigger(processingTime="0 seconds")
+            .start()
+        )
+        started = time.perf_counter()
+        # Processing-time timeouts keep AvailableNow from finishing, so stop after one batch per file;
+        # reports are collected as they come since idle batches push them out of recentProgress
+        reports = {}
+        progress = []
+        while len(progress) < chunks * rounds:
+            time.sleep(0.2)
+            reports.update((report["batchId"], report) for report in query.recentProgress)
+            progress = [reports[batch_id] for batch_id in sorted(reports) if reports[batch_id]["numInputRows"]]
+        elapsed = time.perf_counter() - started
+        query.stop()
+
+    state = [report["stateOperators"][0] for report in progress]
+    evicted = sum(report["stateOperators"][0]["numRowsRemoved"] for report in reports.values())
+    print("=" * 80)
+    print(f"VELOCITY STATE BENCHMARK ({total:,} rows, {len(progress)} batches, {cards_per_file} new cards per batch)")
+    print("=" * 80)
+    print(f"End-to-end          | {elapsed:8.2f}s | {_rate(total, elapsed)}")
+    print(f"Operator updates    | {sum(op['allUpdatesTimeMs'] for op in state) / 1000:8.2f}s")
+    print(f"State rows (max)    | {max(op['numRowsTotal'] for op in state):>8,}")
+    print(f"State rows (last)   | {state[-1]['numRowsTotal']:>8,}")
+    print(f"Evicted cards       | {evicted:>8,}")
+    print(f"State memory (max)  | {max(op['memoryUsedBytes'] for op in state) / 1024:>8,.0f} KiB")
+    spark.stop()
+
+
+def benchmark_kafka_partitions(rows: int = 0, copies: int = 10, max_partitions: int = 0) -> None:
+    """Measure produce and Spark read throughput of one topic per partition count on a local broker.
+
+    Needs a broker at ``KAFKA_BROKER`` and the Kafka connector package. For 1,
+    2, 4, ... up to ``max_partitions`` (default: the local core count) a fresh
+    topic is filled with the sample ``copies`` times, keyed by card, and read
+    back, parsed and enriched in one Spark batch; Spark runs one read task per
+    topic partition, so throughput should grow with the partition count until
+    the cores are busy.
+    """
+    import os
+
+    from pyspark.sql import SparkSession
+
+    from .kafka_producer import KAFKA_BROKER, create_producer, ensure_topic, record_key
+    from .spark_streaming_consumer import connector_config, enrich_transactions, parse_kafka_events
+
+    max_partitions = max_partitions or os.cpu_count() or 1
+    counts = sorted({2 ** power for power in range(max_partitions.bit_length())} | {max_partitions})
+    sample = load_sample_rows(rows)
+    total = len(sample) * copies
+
+    builder = SparkSession.builder.appName("CreditCardKafkaPartitions").master(f"local[{max_partitions}]")
+    for key, value in connector_config().items():
+        builder = builder.config(key, value)
+    spark = (
+        builder.config("spark.ui.enabled", "false")
+        .config("spark.ui.showConsoleProgress", "false")
+        .getOrCreate()
+    )
+    spark.sparkContext.setLogLevel("WARN")
+
+    results = []
+    for partitions in counts:
+        topic = f"benchmark_partitions_{partitions}_{int(time.time())}"
+        if ensure_topic(topic, partitions) is None:
+            spark.stop()
+            return
+        producer = create_producer()
+        if producer is None:
+            spark.stop()
+            return
+        started = time.perf_counter()
+        for copy in range(copies):
+            for row in sample:
+                message = dict(row, record_id=copy * len(sample) + row["record_id"])
+                producer.send(topic, key=record_key(message, "card"), value=message)
+        producer.flush()
+        produce_seconds = time.perf_counter() - started
+        producer.close()
+
+        df = (
+            spark.read.format("kafka")
+            .option("kafka.bootstrap.servers", KAFKA_BROKER)
+            .option("subscribe", topic)
+            .option("startingOffsets", "earliest")
+            .option("endingOffsets", "latest")
+            .load()
+        )
+        sizes = {row["partition"]: row["count"] for row in df.groupBy("partition").count().collect()}
+        read_seconds = _time_noop_write(enrich_transactions(parse_kafka_events(df)))
+        results.append((partitions, df.rdd.getNumPartitions(), produce_seconds, read_seconds, sizes))
+
+    print("=" * 80)
+    print(f"KAFKA PARTITION SCALING ({total:,} records keyed by card, {max_partitions} local cores)")
+    print("=" * 80)
+    baseline = results[0][3]
+    for partitions, tasks, produce_seconds, read_seconds, sizes in results:
+        largest = max(sizes.values()) / (total / partitions) if sizes else 0.0
+        print(
+            f"{partitions:>3} partitions | {tasks:>3} read tasks | produce {_rate(total, produce_seconds)} | "
+            f"read+parse {_rate(total, read_seconds)} | speed-up {baseline / read_seconds:5.2f}x | "
+            f"largest partition {largest:4.2f}x even"
+        )
+    spark.stop()
+
+
+def _committed(manifests: Path) -> bool:
+    return manifests.is_dir() and any(manifests.glob("*.json"))
+
+
+def _time_first_commit(
+    command: List[str], env: Dict, manifests: Path, ready_marker: str = "", timeout: float = 600
+) -> Dict:
+    """Run ``command`` and time when it prints ``ready_marker``, commits a first batch and exits.
+
+    The first batch is committed once a manifest appears in ``manifests``,
+    the ``_batches`` directory of a sink. A process still running then (a
+    stream) is interrupted there. Raises RuntimeError with the end of the output if nothing was
+    committed.
+    """
+    import signal
+    import subprocess
+    import threading
+    from collections import deque
+
+    started = time.perf_counter()
+    times = {"ready": None, "first_commit": None}
+    output = deque(maxlen=40)
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    def read_output():
+        for line in process.stdout:
+            output.append(line)
+            if ready_marker and times["ready"] is None and ready_marker in line:
+                times["ready"] = time.perf_counter() - started
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+    while process.poll() is None and time.perf_counter() - started < timeout:
+        if _committed(manifests):
+            times["first_commit"] = time.perf_counter() - started
+            break
+        time.sleep(0.02)
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    times["total"] = time.perf_counter() - started
+    reader.join(5)
+    if times["first_commit"] is None:
+        if not _committed(manifests):
+            raise RuntimeError(f"{' '.join(command)} committed no batch:\n{''.join(output)}")
+        times["first_commit"] = times["total"]
+    return times
+
+
+def benchmark_local_engine(rows: int = 0, copies: int = 5) -> None:
+    """Compare the pandas engine with the Spark backfill on the same CSV input.
+
+    Each engine runs in a fresh process over ``copies`` copies of the sample
+    and writes the ``transactions`` sink. Startup is the time from process
+    start to the first committed batch manifest (the whole input for Spark,
+    which writes it as one batch; the first ``LOCAL_BATCH_ROWS`` chunk for the
+    local engine), throughput is the input rows over the whole run.
+    """
+    import os
+    import sys
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        source = tmp / "source"
+        source.mkdir()
+        lines = SAMPLE_CSV.read_text(encoding="utf-8").splitlines(keepends=True)
+        lines = lines[: rows + 1] if rows else lines
+        for copy in range(copies):
+            (source / f"copy_{copy}.csv").write_text("".join(lines), encoding="utf-8")
+        total = (len(lines) - 1) * copies
+
+        results = {}
+        for engine, module in (("local", "src.local_engine"), ("spark", "src.backfill")):
+            output = tmp / engine
+            env = dict(os.environ, OUTPUT_URI=str(output), CHECKPOINT_URI=str(tmp / f"{engine}_checkpoint"))
+            command = [sys.executable, "-m", module, "--sinks", "transactions", "csv", str(source)]
+            results[engine] = _time_first_commit(command, env, output / "transactions" / "_batches")
+
+    print("=" * 80)
+    print(f"LOCAL ENGINE VS SPARK ({total:,} rows, transactions sink, fresh process each)")
+    print("=" * 80)
+    for engine, timing in results.items():
+        print(
+            f"{engine:6} | first commit {timing['first_commit']:6.2f}s | total {timing['total']:6.2f}s | "
+            f"{_rate(total, timing['total'])}"
+        )
+    print(f"Startup speed-up {results['spark']['first_commit'] / results['local']['first_commit']:5.1f}x")
+
+
+def benchmark_startup(rows: int = 0) -> None:
+    """Measure the consumer's cold start: process start to the first committed micro-batch.
+
+    Needs a broker at ``KAFKA_BROKER``. A fresh topic is filled with the
+    sample, then the consumer (transactions sink, new checkpoint each time) is
+    started with its connector resolved through an empty Ivy directory, as a
+    plain launch does, through that directory again once it is filled
+    (``SPARK_IVY_DIR``), and from the jars it holds (``SPARK_JARS_DIR``, or the
+    configured directory when the Ivy runs could not download). "Session" is
+    the time until the Spark session is up and the stream is being defined.
+    """
+    import os
+    import sys
+    import tempfile
+
+    from .kafka_producer import create_producer, ensure_topic, send_rows
+    from .pipeline_settings import SPARK_JARS_DIR
+
+    sample = load_sample_rows(rows)
+    topic = f"benchmark_startup_{int(time.time())}"
+    if ensure_topic(topic, 1) is None:
+        return
+    producer = create_producer()
+    if producer is None:
+        return
+    send_rows(producer, sample, SAMPLE_CSV.name, topic=topic, log_every=0)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        ivy_dir = tmp / "ivy"
+        runs = [
+            ("ivy, empty cache", {"SPARK_JARS_DIR": "", "SPARK_IVY_DIR": str(ivy_dir)}),
+            ("ivy, filled cache", {"SPARK_JARS_DIR": "", "SPARK_IVY_DIR": str(ivy_dir)}),
+            ("local jars", {}),
+        ]
+        for run, (name, settings) in enumerate(runs):
+            if not settings:
+                downloaded = ivy_dir / "jars"
+                settings = {"SPARK_JARS_DIR": str(downloaded if any(downloaded.glob("*.jar")) else SPARK_JARS_DIR)}
+            env = dict(
+                os.environ,
+                PYTHONUNBUFFERED="1",
+                KAFKA_TOPIC=topic,
+                SINKS="transactions",
+                TRIGGER_INTERVAL="0 seconds",
+                METRICS_PORT="0",
+                METRICS_FILE="",
+                OUTPUT_URI=str(tmp / f"output_{run}"),
+                CHECKPOINT_URI=str(tmp / f"checkpoint_{run}"),
+                **settings,
+            )
+            try:
+                results[name] = _time_first_commit(
+                    [sys.executable, "-m", "src.spark_streaming_consumer"],
+                    env,
+                    tmp / f"output_{run}" / "transactions" / "_batches",
+                    ready_marker="Connecting to Kafka",
+                )
+            except RuntimeError as exc:
+                print(f"[Startup] {name} failed: {str(exc)[-500:]}")
+
+    print("=" * 80)
+    print(f"CONSUMER STARTUP ({len(sample):,} records waiting, transactions sink, fresh process each)")
+    print("=" * 80)
+    for name, timing in results.items():
+        session = f"{timing['ready']:6.2f}s" if timing["ready"] is not None else "   n/a "
+        print(f"{name:18} | session {session} | first commit {timing['first_commit']:6.2f}s")
+
+
+BENCHMARKS = {
+    "wire-format": benchmark_wire_format,
+    "exchange-rate": benchmark_exchange_rate,
+    "rate-parsers": benchmark_rate_parsers,
+    "stats-soak": benchmark_stats_soak,
+    "velocity-state": benchmark_velocity_state,
+    "fraud-scoring": benchmark_fraud_scoring,
+    "kafka-partitions": benchmark_kafka_partitions,
+    "local-engine": benchmark_local_engine,
+    "startup": benchmark_startup,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a pipeline benchmark.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", type=int, default=0, help="Limit the number of sample rows (0 = all).")
+    args = parser.parse_args(argv)
+    kwargs = {"rows": args.rows} if args.rows else {}
+    BENCHMARKS[args.benchmark](**kwargs)
+
+
+if __name__ == "__main__":
+    main()
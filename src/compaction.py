@@ -0,0 +1,229 @@
+"""Compact a day's micro-batch Parquet output into a few large sorted files.
+
+The streaming sink appends at least one small file per partition and trigger
+under ``<output>/transactions/processing_date=<day>``. This job merges a day's
+files into ``<consolidated>/transactions/processing_date=<day>``, range
+partitioned and sorted by ``transaction_datetime`` so readers get a handful of
+large files with tight min/max statistics.
+
+Each day has a manifest in ``<consolidated>/_compaction_log`` recording the
+input files (name and size) already merged. A rerun with no new inputs does
+nothing; late micro-batches are merged incrementally with the existing
+consolidated files. By default only closed days (before today) are compacted,
+so the job can run next to the live stream. The swap of the day directory goes
+through a trash directory, and the new manifest is recorded as pending before
+it, so a crash at any point is either rolled back or completed by the next run.
+"""
+import argparse
+import json
+import math
+import os
+import time
+import uuid
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pyspark.sql import SparkSession
+
+from . import fs_utils
+from .spark_streaming_consumer import output_path
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+CONSOLIDATED_URI = os.getenv("CONSOLIDATED_URI")
+CONSOLIDATED_DIR = BASE_DIR / "consolidated"
+
+PARTITION_COLUMN = "processing_date"
+SORT_COLUMN = "transaction_datetime"
+RECORDS_PER_FILE = int(os.getenv("COMPACTION_RECORDS_PER_FILE", "5000000"))
+COMPACTION_COMPRESSION = os.getenv("COMPACTION_COMPRESSION", "zstd")
+
+
+def consolidated_path(name: str) -> str:
+    """Return a location under CONSOLIDATED_URI (HDFS) or CONSOLIDATED_DIR."""
+    return (CONSOLIDATED_URI + "/" + name) if CONSOLIDATED_URI else str(CONSOLIDATED_DIR / name)
+
+
+def create_spark_session():
+    """Create a batch Spark session for compaction."""
+    spark = SparkSession.builder.appName("CreditCardCompaction").getOrCreate()
+
+    fs_default = os.getenv("FS_DEFAULTFS")
+    if fs_default:
+        spark.sparkContext._jsc.hadoopConfiguration().set("fs.defaultFS", fs_default)
+
+    spark.sparkContext.setLogLevel("WARN")
+    return spark
+
+
+class DayCompactor:
+    """Compact the partitions of the transactions table one day at a time."""
+
+    def __init__(
+        self,
+        spark: SparkSession,
+        source_root: Optional[str] = None,
+        target_root: Optional[str] = None,
+        log_root: Optional[str] = None,
+        records_per_file: int = RECORDS_PER_FILE,
+    ):
+        self.spark = spark
+        self.source_root = source_root or output_path("transactions")
+        self.target_root = target_root or consolidated_path("transactions")
+        self.log_root = log_root or consolidated_path("_compaction_log")
+        self.records_per_file = records_per_file
+
+    def _partition(self, root: str, day: str) -> str:
+        return f"{root}/{PARTITION_COLUMN}={day}"
+
+    def list_days(self) -> List[str]:
+        """Return the days present in the source table."""
+        prefix = f"{PARTITION_COLUMN}="
+        return sorted(
+            name[len(prefix):]
+            for name, is_dir, _ in fs_utils.list_dir(self.spark, self.source_root)
+            if is_dir and name.startswith(prefix)
+        )
+
+    def load_manifest(self, day: str) -> Dict:
+        path = f"{self.log_root}/{PARTITION_COLUMN}={day}.json"
+        if not fs_utils.exists(self.spark, path):
+            return {"day": day, "inputs": {}, "outputs": []}
+        return json.loads(fs_utils.read_text(self.spark, path))
+
+    def _save_manifest(self, day: str, manifest: Dict) -> None:
+        fs_utils.mkdirs(self.spark, self.log_root)
+        fs_utils.write_text(self.spark, f"{self.log_root}/{PARTITION_COLUMN}={day}.json", json.dumps(manifest, indent=2))
+
+    def _trash_dir(self, day: str) -> str:
+        return f"{self.target_root}/_trash/{PARTITION_COLUMN}={day}"
+
+    def _recover(self, day: str) -> None:
+        """Complete or roll back a swap interrupted by a crash.
+
+        A pending manifest whose outputs are all in the target means the new
+        files were swapped in: it becomes the manifest. Otherwise the swap did
+        not happen and the old output, if moved to the trash, is restored.
+        """
+        target = self._partition(self.target_root, day)
+        trash = self._trash_dir(day)
+        manifest = self.load_manifest(day)
+        pending = manifest.pop("pending", None)
+        if pending is not None:
+            outputs = []
+            if fs_utils.exists(self.spark, target):
+                outputs = [name for name, _ in fs_utils.list_data_files(self.spark, target)]
+            if sorted(outputs) == sorted(pending["outputs"]):
+                print(f"[Compaction] Completing interrupted swap for {day}")
+                manifest = pending
+            self._save_manifest(day, manifest)
+        if fs_utils.exists(self.spark, trash):
+            if fs_utils.exists(self.spark, target):
+                fs_utils.delete(self.spark, trash)
+            else:
+                print(f"[Compaction] Restoring interrupted swap for {day}")
+                fs_utils.rename(self.spark, trash, target)
+
+    def compact_day(self, day: str, purge_source: bool = False) -> Optional[Dict]:
+        """Compact one day; return the new manifest, or None when already up to date."""
+        self._recover(day)
+
+        source = self._partition(self.source_root, day)
+        target = self._partition(self.target_root, day)
+        manifest = self.load_manifest(day)
+        compacted = dict(manifest["inputs"])
+
+        current = dict(fs_utils.list_data_files(self.spark, source))
+        new_inputs = {name: size for name, size in current.items() if name not in compacted}
+        changed = [name for name, size in current.items() if name in compacted and compacted[name] != size]
+
+        if not new_inputs and not changed:
+            print(f"[Compaction] {day}: up to date ({len(compacted)} inputs already compacted)")
+            return None
+
+        if changed:
+            # A compacted input was rewritten in place: rebuild the day from the raw files
+            print(f"[Compaction] {day}: {len(changed)} inputs changed, rebuilding the whole day")
+            sources = [f"{source}/{name}" for name in current]
+            compacted = {}
+            new_inputs = current
+        else:
+            existing = [f"{target}/{name}" for name, _ in fs_utils.list_data_files(self.spark, target)]
+            sources = existing + [f"{source}/{name}" for name in new_inputs]
+
+        started = time.perf_counter()
+        df = self.spark.read.parquet(*sources)
+        rows = df.count()
+        num_files = max(1, math.ceil(rows / self.records_per_file))
+
+        staging = f"{self.target_root}/_staging/{PARTITION_COLUMN}={day}-{uuid.uuid4().hex}"
+        (
+            df.repartitionByRange(num_files, SORT_COLUMN)
+            .sortWithinPartitions(SORT_COLUMN)
+            .write.option("compression", COMPACTION_COMPRESSION)
+            .parquet(staging)
+        )
+
+        compacted.update(new_inputs)
+        pending = {
+            "day": day,
+            "inputs": compacted,
+            "outputs": [name for name, _ in fs_utils.list_data_files(self.spark, staging)],
+            "rows": rows,
+            "compacted_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+        # Swap: record the pending manifest, old output -> trash, staging -> target, then commit the manifest
+        self._save_manifest(day, dict(manifest, pending=pending))
+        trash = self._trash_dir(day)
+        if fs_utils.exists(self.spark, target):
+            fs_utils.rename(self.spark, target, trash)
+        fs_utils.rename(self.spark, staging, target)
+        manifest = pending
+        self._save_manifest(day, manifest)
+        fs_utils.delete(self.spark, trash)
+
+        if purge_source:
+            for name in new_inputs:
+                fs_utils.delete(self.spark, f"{source}/{name}", recursive=False)
+
+        print(
+            f"[Compaction] {day}: merged {len(new_inputs)} new inputs into {len(manifest['outputs'])} files "
+            f"({rows:,} rows) in {time.perf_counter() - started:.1f}s"
+        )
+        return manifest
+
+    def run(self, days: Optional[List[str]] = None, include_today: bool = False, purge_source: bool = False):
+        """Compact ``days`` (default: every closed day in the source table)."""
+        if days is None:
+            today = date.today().isoformat()
+            days = [day for day in self.list_days() if include_today or day < today]
+        for day in days:
+            self.compact_day(day, purge_source=purge_source)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact streaming output into the consolidated directory.")
+    parser.add_argument("--date", action="append", dest="days", help="Day to compact (repeatable, YYYY-MM-DD).")
+    parser.add_argument("--include-today", action="store_true", help="Also compact today's (still open) partition.")
+    parser.add_argument("--purge-source", action="store_true", help="Delete raw micro-batch files once compacted.")
+    parser.add_argument("--interval", type=int, default=0, help="Repeat every N seconds (0 = run once).")
+    args = parser.parse_args(argv)
+
+    spark = create_spark_session()
+    compactor = DayCompactor(spark)
+    try:
+        while True:
+            compactor.run(args.days, include_today=args.include_today, purge_source=args.purge_source)
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\nCompaction stopped by user.")
+    finally:
+        spark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""MCC and merchant dimension tables joined onto each micro-batch.
+
+Two small local CSV tables describe what the raw ``MCC`` code and the opaque
+``Merchant Name`` hash stand for:
+
+* ``data/mcc_codes.csv``: ``mcc, category, description, risk_level``
+* ``data/merchant_risk.csv``: ``merchant_name, transactions, fraud_count,
+  risk_score, risk_level``, built from labelled history with
+  ``python -m src.dimensions build-merchant-risk``
+
+``apply_dimensions`` adds ``mcc_category``, ``mcc_risk_level``,
+``merchant_risk_score`` and ``merchant_risk_level``. Tables of up to
+``DIMENSION_MAP_MAX_ROWS`` rows become literal map lookups in the projection
+(no join at all); larger ones are broadcast hash joined. Either way the
+stream side is never shuffled and each lookup is a hash probe. Tables are
+re-read only when their file changes, and since the lookup is rebuilt per
+micro-batch a new file takes effect on the next batch without restarting
+the stream. A missing file yields null columns.
+"""
+import argparse
+import os
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MCC_TABLE_PATH = Path(os.getenv("MCC_TABLE_PATH", str(BASE_DIR / "data" / "mcc_codes.csv")))
+MERCHANT_RISK_PATH = Path(os.getenv("MERCHANT_RISK_PATH", str(BASE_DIR / "data" / "merchant_risk.csv")))
+DIMENSION_MAP_MAX_ROWS = int(os.getenv("DIMENSION_MAP_MAX_ROWS", "200"))
+SAMPLE_CSV = BASE_DIR / "data" / "User0_credit_card_transactions.csv"
+
+
+class DimensionTable:
+    """A keyed lookup table loaded from a local CSV and reloaded when the file changes.
+
+    ``columns`` maps table columns to the output column names and Spark types
+    added to the stream; ``key`` is the table column matched against the
+    stream column ``stream_key`` (both compared as strings).
+    """
+
+    def __init__(self, path: Path, key: str, stream_key: str, columns: Dict[str, tuple], map_max_rows: int):
+        self.path = Path(path)
+        self.key = key
+        self.stream_key = stream_key
+        self.columns = columns
+        self.map_max_rows = map_max_rows
+        self._mtime: Optional[float] = None
+        self._lookup = None
+        self._frame_mtime: Optional[float] = None
+        self._frame: Optional[pd.DataFrame] = None
+
+    def mtime(self) -> Optional[float]:
+        return self.path.stat().st_mtime if self.path.exists() else None
+
+    def read(self) -> pd.DataFrame:
+        """Read the table, keeping the last row of each key."""
+        table = pd.read_csv(self.path, dtype={self.key: str}).drop_duplicates(self.key, keep="last")
+        return table[[self.key, *self.columns]]
+
+    def _build(self, spark):
+        table = self.read()
+        print(f"Loaded dimension table {self.path.name}: {len(table):,} rows")
+        if len(table) <= self.map_max_rows:
+            from pyspark.sql.functions import create_map, lit
+
+            return (
+                "map",
+                {
+                    column: create_map(
+                        *chain.from_iterable(
+                            (lit(key), lit(None if pd.isna(value) else value.item() if hasattr(value, "item") else value))
+                            for key, value in zip(table[self.key], table[column])
+                        )
+                    ).cast(f"map<string, {spark_type}>")
+                    for column, (_, spark_type) in self.columns.items()
+                },
+            )
+        frame = table.rename(columns={self.key: "_dimension_key", **{c: n for c, (n, _) in self.columns.items()}})
+        schema = ", ".join(
+            ["_dimension_key string"] + [f"`{name}` {spark_type}" for name, spark_type in self.columns.values()]
+        )
+        return "join", spark.createDataFrame(frame, schema).cache()
+
+    def lookup(self, spark):
+        """Return the current ``("map", {column: map_expr})`` or ``("join", frame)``, or None."""
+        mtime = self.mtime()
+        if mtime != self._mtime:
+            if self._lookup is not None and self._lookup[0] == "join":
+                self._lookup[1].unpersist()
+            self._lookup = self._build(spark) if mtime is not None else None
+            self._mtime = mtime
+        return self._lookup
+
+    def apply(self, spark, df):
+        """Add this table's output columns to ``df``."""
+        from pyspark.sql.functions import broadcast, col, lit
+
+        lookup = self.lookup(spark)
+        if lookup is None:
+            for name, spark_type in self.columns.values():
+                df = df.withColumn(name, lit(None).cast(spark_type))
+            return df
+        kind, value = lookup
+        key = col(self.stream_key).cast("string")
+        if kind == "map":
+            for column, (name, _) in self.columns.items():
+                df = df.withColumn(name, value[column][key])
+            return df
+        return (
+            df.join(broadcast(value), key == col("_dimension_key"), "left")
+            .drop("_dimension_key")
+        )
+
+    def apply_pandas(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Add this table's output columns to a pandas frame in place (the local engine's ``apply``)."""
+        mtime = self.mtime()
+        if mtime != self._frame_mtime:
+            self._frame = self.read().set_index(self.key) if mtime is not None else None
+            self._frame_mtime = mtime
+            if self._frame is not None:
+                print(f"Loaded dimension table {self.path.name}: {len(self._frame):,} rows")
+        keys = frame[self.stream_key].astype(object).where(frame[self.stream_key].notna(), None)
+        for column, (name, spark_type) in self.columns.items():
+            if self._frame is None:
+                frame[name] = None
+            else:
+                values = keys.map(self._frame[column])
+                frame[name] = values.astype("float64") if spark_type == "double" else values.astype(object)
+        return frame
+
+
+MCC_TABLE = DimensionTable(
+    MCC_TABLE_PATH,
+    key="mcc",
+    stream_key="MCC",
+    columns={"category": ("mcc_category", "string"), "risk_level": ("mcc_risk_level", "string")},
+    map_max_rows=DIMENSION_MAP_MAX_ROWS,
+)
+MERCHANT_TABLE = DimensionTable(
+    MERCHANT_RISK_PATH,
+    key="merchant_name",
+    stream_key="Merchant Name",
+    columns={"risk_score": ("merchant_risk_score", "double"), "risk_level": ("merchant_risk_level", "string")},
+    map_max_rows=DIMENSION_MAP_MAX_ROWS,
+)
+DIMENSION_TABLES = [MCC_TABLE, MERCHANT_TABLE]
+DIMENSION_COLUMNS: List[str] = [name for table in DIMENSION_TABLES for name, _ in table.columns.values()]
+
+
+def apply_dimensions(spark, df, tables: List[DimensionTable] = DIMENSION_TABLES):
+    """Add the MCC and merchant dimension columns to a (micro-)batch."""
+    for table in tables:
+        df = table.apply(spark, df)
+    return df
+
+
+def apply_dimensions_pandas(frame: pd.DataFrame, tables: List[DimensionTable] = DIMENSION_TABLES) -> pd.DataFrame:
+    """Add the MCC and merchant dimension columns to a pandas batch."""
+    for table in tables:
+        table.apply_pandas(frame)
+    return frame
+
+
+def build_merchant_risk(csv_path: Path = SAMPLE_CSV, prior_weight: float = 20.0) -> pd.DataFrame:
+    """Score merchants by their smoothed historical fraud rate in a labelled transactions CSV.
+
+    The rate is shrunk towards the overall fraud rate with ``prior_weight``
+    pseudo-transactions, so merchants seen a few times are not flagged on a
+    single fraud.
+    """
+    frame = pd.read_csv(csv_path, usecols=["Merchant Name", "Is Fraud?"], dtype=str)
+    frame["fraud"] = frame["Is Fraud?"] == "Yes"
+    overall = frame["fraud"].mean()
+    merchants = frame.groupby("Merchant Name")["fraud"].agg(transactions="size", fraud_count="sum").reset_index()
+    merchants["risk_score"] = (merchants["fraud_count"] + prior_weight * overall) / (
+        merchants["transactions"] + prior_weight
+    )
+    merchants["risk_level"] = pd.cut(
+        merchants["risk_score"] / overall, bins=[-1, 1.5, 5, float("inf")], labels=["LOW", "MEDIUM", "HIGH"]
+    ).astype(str)
+    return merchants.rename(columns={"Merchant Name": "merchant_name"}).sort_values("merchant_name")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the MCC and merchant dimension tables.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build-merchant-risk", help="Score merchants from a labelled CSV.")
+    build_parser.add_argument("--csv", type=Path, default=SAMPLE_CSV)
+    build_parser.add_argument("--output", type=Path, default=MERCHANT_RISK_PATH)
+    args = parser.parse_args(argv)
+
+    merchants = build_merchant_risk(args.csv)
+    merchants.to_csv(args.output, index=False, float_format="%.6f")
+    print(f"Wrote {len(merchants):,} merchants to {args.output}")
+    print(merchants["risk_level"].value_counts().to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,96 @@
 """Utilities for fetching foreign exchange rates from VietcomBank."""
 from datetime import datetime
+import os
 from typing import Dict, Optional
 
 import requests
-from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
+
+
+# Compiled once: the API response is a flat list of <Exrate .../> elements.
+_EXRATE_XPATH = etree.XPath("//Exrate")
+# The rate page keeps its table inside .table-responsive; the first tbody anywhere is only a
+# fallback for pages without it (a union would pick whichever tbody comes first in the document).
+_RATE_ROWS_XPATH = etree.XPath(
+    "(//*[contains(concat(' ', normalize-space(@class), ' '), ' table-responsive ')]//tbody)[1]/tr"
+)
+_FALLBACK_ROWS_XPATH = etree.XPath("(//tbody)[1]/tr")
+_CELLS_XPATH = etree.XPath("./td")
+
+ENABLE_SELENIUM = os.getenv("VCB_ENABLE_SELENIUM", "false").lower() in ("1", "true", "yes")
+
+
+def _clean_rate(rate_str: str) -> float:
+    """Normalize a rate string into a float."""
+    try:
+        cleaned = rate_str.replace(",", "").replace(" ", "").strip()
+        if cleaned and cleaned != "-":
+            return float(cleaned)
+        return 0.0
+    except Exception:
+        return 0.0
+
+
+def parse_api_xml(content: bytes) -> Dict[str, Dict]:
+    """Parse a ``pXML.aspx`` response into ``{code: {name, buy, transfer, sell}}``."""
+    root = etree.fromstring(content)
+    currencies = {}
+    for exrate in _EXRATE_XPATH(root):
+        currency_code = exrate.get("CurrencyCode")
+        if not currency_code:
+            continue
+        currencies[currency_code] = {
+            "name": exrate.get("CurrencyName", ""),
+            "buy": _clean_rate(exrate.get("Buy", "0")),
+            "transfer": _clean_rate(exrate.get("Transfer", "0")),
+            "sell": _clean_rate(exrate.get("Sell", "0")),
+        }
+    return currencies
+
+
+def parse_rate_table_html(content) -> Dict[str, Dict]:
+    """Parse the rate table of the VietcomBank web page into ``{code: {buy, transfer, sell}}``."""
+    document = lxml_html.fromstring(content)
+    currencies = {}
+    for row in _RATE_ROWS_XPATH(document) or _FALLBACK_ROWS_XPATH(document):
+        cells = _CELLS_XPATH(row)
+        if len(cells) >= 5:
+            currency_code = cells[0].text_content().strip()
+            currencies[currency_code] = {
+                "buy": _clean_rate(cells[2].text_content()),
+                "transfer": _clean_rate(cells[3].text_content()),
+                "sell": _clean_rate(cells[4].text_content()),
+            }
+    return currencies
 
 
 class ExchangeRateScraper:
-    """Fetch exchange rates from VietcomBank via API with web scraping fallback."""
-
-    API_URL = "https://portal.vietcombank.com.vn/Usercontrols/TVPortal.TyGia/pXML.aspx"
-    WEB_URL = "https://vietcombank.com.vn/vi-VN/KHCN/Cong-cu-Tien-ich/Ty-gia"
-
-    def __init__(self):
+    """Fetch exchange rates from VietcomBank via API with web scraping fallbacks.
+
+    Fallback order: XML API, then the rate page over plain HTTP, then (only when
+    ``enable_selenium`` is set) the rate page rendered by headless Chrome.
+    """
+
+    API_URL = os.getenv(
+        "VCB_API_URL", "https://portal.vietcombank.com.vn/Usercontrols/TVPortal.TyGia/pXML.aspx"
+    )
+    WEB_URL = os.getenv("VCB_WEB_URL", "https://vietcombank.com.vn/vi-VN/KHCN/Cong-cu-Tien-ich/Ty-gia")
+
+    def __init__(
+        self,
+        api_url: Optional[str] = None,
+        web_url: Optional[str] = None,
+        history=None,
+        enable_selenium: bool = ENABLE_SELENIUM,
+    ):
+        """``history`` is an optional ``RateHistory`` that every successful fetch is recorded in."""
+        self.history = history
+        self.enable_selenium = enable_selenium
+        if api_url:
+            self.API_URL = api_url
+        if web_url:
+            self.WEB_URL = web_url
         self.session = requests.Session()
         self.session.headers.update(
             {
@@ -26,32 +104,12 @@ class ExchangeRateScraper:
             response = self.session.get(self.API_URL, timeout=10)
             response.raise_for_status()
 
-            from xml.etree import ElementTree as ET
-
-            root = ET.fromstring(response.content)
-
             rates = {
                 "timestamp": datetime.now().isoformat(),
                 "source": "API",
-                "currencies": {},
+                "currencies": parse_api_xml(response.content),
             }
 
-            for exrate in root.findall(".//Exrate"):
-                currency_code = exrate.get("CurrencyCode")
-                if not currency_code:
-                    continue
-                currency_name = exrate.get("CurrencyName", "")
-                buy_rate = exrate.get("Buy", "0")
-                transfer_rate = exrate.get("Transfer", "0")
-                sell_rate = exrate.get("Sell", "0")
-
-                rates["currencies"][currency_code] = {
-                    "name": currency_name,
-                    "buy": self._clean_rate(buy_rate),
-                    "transfer": self._clean_rate(transfer_rate),
-                    "sell": self._clean_rate(sell_rate),
-                }
-
             print(f"Fetched exchange rates via API: {len(rates['currencies'])} currencies")
             return rates
 
@@ -59,6 +117,28 @@ class ExchangeRateScraper:
             print(f"API error: {exc}")
             return None
 
+    def get_exchange_rate_html(self) -> Optional[Dict]:
+        """Fetch the rate page over plain HTTP and parse its table with lxml."""
+        try:
+            response = self.session.get(self.WEB_URL, timeout=10)
+            response.raise_for_status()
+
+            currencies = parse_rate_table_html(response.content)
+            if not currencies:
+                print("Could not find the exchange rate table in the static page")
+                return None
+
+            print(f"Fetched exchange rates via HTML page: {len(currencies)} currencies")
+            return {
+                "timestamp": datetime.now().isoformat(),
+                "source": "HTML",
+                "currencies": currencies,
+            }
+
+        except Exception as exc:  # pragma: no cover - external dependency
+            print(f"HTML page error: {exc}")
+            return None
+
     def get_exchange_rate_scraping(self) -> Optional[Dict]:
         """Fetch exchange rates via web scraping with Selenium (requires browser driver)."""
         try:
@@ -82,44 +162,17 @@ class ExchangeRateScraper:
             driver.get(self.WEB_URL)
             time.sleep(5)
 
-            soup = BeautifulSoup(driver.page_source, "html.parser")
+            page_source = driver.page_source
             driver.quit()
 
-            rates = {
-                "timestamp": datetime.now().isoformat(),
-                "source": "WebScraping",
-                "currencies": {},
-            }
-
-            # Try primary selector
-            tbody = soup.select_one(".table-responsive tbody")
-            if not tbody:
-                tbody = soup.find("tbody")
-            if not tbody:
-                tables = soup.find_all("table")
-                if tables:
-                    tbody = tables[0].find("tbody")
-
-            if tbody:
-                for tr in tbody.find_all("tr"):
-                    td = tr.find_all("td")
-                    if len(td) >= 5:
-                        currency_code = td[0].get_text(strip=True)
-                        buy_cash = td[2].get_text(strip=True)
-                        buy_transfer = td[3].get_text(strip=True)
-                        sell = td[4].get_text(strip=True)
-
-                        rates["currencies"][currency_code] = {
-                            "buy": self._clean_rate(buy_cash),
-                            "transfer": self._clean_rate(buy_transfer),
-                            "sell": self._clean_rate(sell),
-                        }
-
-                print(
-                    f"Fetched exchange rates via web scraping: "
-                    f"{len(rates['currencies'])} currencies"
-                )
-                return rates
+            currencies = parse_rate_table_html(page_source)
+            if currencies:
+                print(f"Fetched exchange rates via web scraping: {len(currencies)} currencies")
+                return {
+                    "timestamp": datetime.now().isoformat(),
+                    "source": "WebScraping",
+                    "currencies": currencies,
+                }
 
             print("Could not find the exchange rate table on the web page")
             return None
@@ -129,26 +182,30 @@ class ExchangeRateScraper:
             return None
 
     def get_exchange_rate(self) -> Optional[Dict]:
-        """Attempt API first, then fall back to web scraping."""
+        """Attempt the API first, then the static page, then Selenium if enabled."""
         print("Retrieving exchange rates from VietcomBank...")
 
         rates = self.get_exchange_rate_api()
 
         if not rates:
-            print("API unavailable, switching to web scraping...")
+            print("API unavailable, falling back to the static rate page...")
+            rates = self.get_exchange_rate_html()
+
+        if not rates and self.enable_selenium:
+            print("Static page unavailable, switching to Selenium web scraping...")
             rates = self.get_exchange_rate_scraping()
 
+        if rates and self.history is not None:
+            try:
+                self.history.record(rates)
+            except Exception as exc:
+                print(f"Could not record rate history: {exc}")
+
         return rates
 
     def _clean_rate(self, rate_str: str) -> float:
         """Normalize a rate string into a float."""
-        try:
-            cleaned = rate_str.replace(",", "").replace(" ", "").strip()
-            if cleaned and cleaned != "-":
-                return float(cleaned)
-            return 0.0
-        except Exception:
-            return 0.0
+        return _clean_rate(rate_str)
 
     def get_usd_rate(self) -> Optional[Dict]:
         """Return the USD/VND rate if available."""
@@ -0,0 +1,203 @@
+"""Vectorised fraud scoring with a small logistic regression stored as numpy arrays.
+
+The model is a standardised logistic regression over a handful of features
+derived from columns every transaction row has (amount, hour, weekday,
+channel, merchant location). It is trained offline from a labelled CSV with
+``python -m src.fraud_model train`` and saved as an ``.npz`` file of plain
+arrays, so scoring needs numpy only.
+
+``add_fraud_score`` adds ``fraud_score`` (probability) and ``fraud_predicted``
+through a scalar pandas UDF: Spark hands each Python worker Arrow batches of
+``spark.sql.execution.arrow.maxRecordsPerBatch`` rows, the features and the
+score are computed for the whole batch with numpy, and the model is loaded
+once per worker process and reused until the file changes.
+"""
+import argparse
+import os
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+FRAUD_MODEL_PATH = Path(os.getenv("FRAUD_MODEL_PATH", str(BASE_DIR / "data" / "fraud_model.npz")))
+FRAUD_THRESHOLD = float(os.getenv("FRAUD_THRESHOLD", "0.8"))
+SAMPLE_CSV = BASE_DIR / "data" / "User0_credit_card_transactions.csv"
+
+FEATURE_NAMES = [
+    "log_amount",
+    "is_refund",
+    "is_online",
+    "is_chip",
+    "hour_sin",
+    "hour_cos",
+    "is_weekend",
+    "is_foreign",
+]
+# Columns of the enriched transaction frame the features are computed from
+INPUT_COLUMNS = ["Amount_USD", "transaction_hour", "day_of_week", "Use Chip", "Merchant State"]
+
+
+def feature_matrix(amount, hour, day_of_week, use_chip, merchant_state) -> np.ndarray:
+    """Return the ``(rows, len(FEATURE_NAMES))`` feature matrix for column-like inputs."""
+    amount = np.nan_to_num(np.asarray(amount, dtype=np.float64))
+    angle = np.asarray(hour, dtype=np.float64) * (2 * np.pi / 24)
+    day_of_week = np.asarray(day_of_week, dtype=np.float64)
+    use_chip = pd.Series(use_chip, dtype="object").fillna("").to_numpy()
+    state = pd.Series(merchant_state, dtype="object").fillna("").str.len().to_numpy()
+    return np.column_stack(
+        [
+            np.log1p(np.abs(amount)),
+            amount < 0,
+            use_chip == "Online Transaction",
+            use_chip == "Chip Transaction",
+            np.sin(angle),
+            np.cos(angle),
+            (day_of_week == 1) | (day_of_week == 7),
+            state > 2,  # US merchants carry a two-letter state, foreign ones a country name
+        ]
+    ).astype(np.float64)
+
+
+class FraudModel:
+    """Standardised logistic regression: ``sigmoid(((x - mean) / scale) . weights + bias)``."""
+
+    def __init__(self, weights: np.ndarray, bias: float, mean: np.ndarray, scale: np.ndarray):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        logits = ((features - self.mean) / self.scale) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def score(self, amount, hour, day_of_week, use_chip, merchant_state) -> np.ndarray:
+        return self.predict_proba(feature_matrix(amount, hour, day_of_week, use_chip, merchant_state))
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            weights=self.weights,
+            bias=np.array([self.bias]),
+            mean=self.mean,
+            scale=self.scale,
+            feature_names=np.array(FEATURE_NAMES),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "FraudModel":
+        with np.load(path) as arrays:
+            names = [str(name) for name in arrays["feature_names"]]
+            if names != FEATURE_NAMES:
+                raise ValueError(f"{path} was trained on features {names}, expected {FEATURE_NAMES}")
+            return cls(arrays["weights"], arrays["bias"][0], arrays["mean"], arrays["scale"])
+
+
+# Per-process model cache: each Python worker loads the file once and reloads it only when it changes
+_models: Dict[str, Tuple[float, FraudModel]] = {}
+
+
+def load_model(path: Path = FRAUD_MODEL_PATH) -> FraudModel:
+    """Return the model at ``path``, cached per process by file modification time."""
+    key = str(path)
+    mtime = os.path.getmtime(key)
+    cached = _models.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, FraudModel.load(key))
+        _models[key] = cached
+    return cached[1]
+
+
+def train(
+    csv_path: Path = SAMPLE_CSV, epochs: int = 500, learning_rate: float = 0.5, l2: float = 1e-3
+) -> FraudModel:
+    """Fit the model on a transactions CSV with an ``Is Fraud?`` label.
+
+    Plain full-batch gradient descent on the class-weighted log loss; fraud is
+    rare, so both classes get equal total weight.
+    """
+    frame = pd.read_csv(csv_path, dtype=str)
+    amount = frame["Amount"].str.replace("$", "", regex=False).astype(float)
+    timestamps = pd.to_datetime(
+        frame["Year"] + "-" + frame["Month"] + "-" + frame["Day"] + " " + frame["Time"], format="%Y-%m-%d %H:%M"
+    )
+    features = feature_matrix(
+        amount,
+        timestamps.dt.hour,
+        timestamps.dt.dayofweek.map(lambda day: (day + 1) % 7 + 1),  # Spark's dayofweek: Sunday = 1
+        frame["Use Chip"],
+        frame["Merchant State"],
+    )
+    labels = (frame["Is Fraud?"] == "Yes").to_numpy(np.float64)
+
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1.0
+    standardised = (features - mean) / scale
+    positives = max(labels.sum(), 1.0)
+    sample_weight = np.where(labels == 1, 0.5 / positives, 0.5 / max(len(labels) - positives, 1.0))
+
+    weights = np.zeros(features.shape[1])
+    bias = 0.0
+    for _ in range(epochs):
+        predictions = 1.0 / (1.0 + np.exp(-(standardised @ weights + bias)))
+        error = (predictions - labels) * sample_weight
+        weights -= learning_rate * (standardised.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum()
+    return FraudModel(weights, bias, mean, scale)
+
+
+def fraud_score_udf(model_path: Path = FRAUD_MODEL_PATH):
+    """Return a scalar pandas UDF scoring Arrow batches of ``INPUT_COLUMNS``."""
+    from pyspark.sql.functions import pandas_udf
+
+    model_path = str(model_path)
+
+    @pandas_udf("double")
+    def fraud_score(
+        amount: pd.Series, hour: pd.Series, day_of_week: pd.Series, use_chip: pd.Series, merchant_state: pd.Series
+    ) -> pd.Series:
+        model = load_model(model_path)
+        return pd.Series(model.score(amount, hour, day_of_week, use_chip, merchant_state))
+
+    return fraud_score
+
+
+def add_fraud_score(df, model_path: Path = FRAUD_MODEL_PATH, threshold: float = FRAUD_THRESHOLD):
+    """Add ``fraud_score`` and ``fraud_predicted`` (score at or above ``threshold``)."""
+    from pyspark.sql.functions import col, lit
+
+    score = fraud_score_udf(model_path)
+    return df.withColumn("fraud_score", score(*[col(name) for name in INPUT_COLUMNS])).withColumn(
+        "fraud_predicted", col("fraud_score") >= lit(threshold)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or inspect the fraud scoring model.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="Fit the model on a labelled transactions CSV.")
+    train_parser.add_argument("--csv", type=Path, default=SAMPLE_CSV)
+    train_parser.add_argument("--epochs", type=int, default=500)
+    subparsers.add_parser("show", help="Print the stored model weights.")
+    parser.add_argument("--path", type=Path, default=FRAUD_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        model = train(args.csv, epochs=args.epochs)
+        model.save(args.path)
+        print(f"Saved model to {args.path}")
+    else:
+        model = FraudModel.load(args.path)
+    for name, weight in zip(FEATURE_NAMES, model.weights):
+        print(f"  {name:12} {weight:+.4f}")
+    print(f"  {'bias':12} {model.bias:+.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Small Hadoop FileSystem helpers usable from the Spark driver.
+
+They go through the JVM ``FileSystem`` API so the same code works for local
+paths, ``file://`` and ``hdfs://`` URIs.
+"""
+from typing import List, Tuple
+
+
+def _path(spark, path: str):
+    return spark._jvm.org.apache.hadoop.fs.Path(path)
+
+
+def get_fs(spark, path: str):
+    """Return the Hadoop FileSystem that owns ``path``."""
+    return _path(spark, path).getFileSystem(spark._jsc.hadoopConfiguration())
+
+
+def exists(spark, path: str) -> bool:
+    return get_fs(spark, path).exists(_path(spark, path))
+
+
+def list_dir(spark, path: str) -> List[Tuple[str, bool, int]]:
+    """Return ``(name, is_dir, size)`` for each entry of ``path`` (empty if missing)."""
+    fs = get_fs(spark, path)
+    hadoop_path = _path(spark, path)
+    if not fs.exists(hadoop_path):
+        return []
+    return [
+        (status.getPath().getName(), status.isDirectory(), status.getLen())
+        for status in fs.listStatus(hadoop_path)
+    ]
+
+
+def list_data_files(spark, path: str) -> List[Tuple[str, int]]:
+    """Return ``(name, size)`` of committed data files directly under ``path``.
+
+    Hidden and metadata entries (``_SUCCESS``, ``_temporary``, ``.crc``) are skipped.
+    """
+    return sorted(
+        (name, size)
+        for name, is_dir, size in list_dir(spark, path)
+        if not is_dir and not name.startswith(("_", "."))
+    )
+
+
+def list_data_files_recursive(spark, path: str) -> List[Tuple[str, int]]:
+    """Return ``(relative path, size)`` of committed data files anywhere under ``path``.
+
+    Partition directories (``key=value``) are descended into; hidden and
+    metadata entries are skipped as in ``list_data_files``.
+    """
+    files = []
+    for name, is_dir, size in list_dir(spark, path):
+        if name.startswith(("_", ".")):
+            continue
+        if is_dir:
+            children = list_data_files_recursive(spark, f"{path}/{name}")
+            files.extend((f"{name}/{child}", child_size) for child, child_size in children)
+        else:
+            files.append((name, size))
+    return sorted(files)
+
+
+def mkdirs(spark, path: str) -> None:
+    get_fs(spark, path).mkdirs(_path(spark, path))
+
+
+def delete(spark, path: str, recursive: bool = True) -> bool:
+    return get_fs(spark, path).delete(_path(spark, path), recursive)
+
+
+def rename(spark, source: str, target: str) -> bool:
+    """Rename ``source`` to ``target`` (atomic on HDFS and local filesystems)."""
+    mkdirs(spark, target.rsplit("/", 1)[0])
+    return get_fs(spark, source).rename(_path(spark, source), _path(spark, target))
+
+
+def read_text(spark, path: str) -> str:
+    fs = get_fs(spark, path)
+    stream = fs.open(_path(spark, path))
+    try:
+        reader = spark._jvm.java.io.BufferedReader(spark._jvm.java.io.InputStreamReader(stream, "UTF-8"))
+        lines = []
+        line = reader.readLine()
+        while line is not None:
+            lines.append(line)
+            line = reader.readLine()
+        return "\n".join(lines)
+    finally:
+        stream.close()
+
+
+def write_text(spark, path: str, text: str) -> None:
+    """Write ``text`` to ``path`` via a temporary file and rename."""
+    fs = get_fs(spark, path)
+    tmp_path = path + ".tmp"
+    stream = fs.create(_path(spark, tmp_path), True)
+    try:
+        stream.write(bytearray(text.encode("utf-8")))
+    finally:
+        stream.close()
+    fs.delete(_path(spark, path), False)
+    fs.rename(_path(spark, tmp_path), _path(spark, path))
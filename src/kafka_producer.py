@@ -1,83 +1,417 @@
-"""Kafka producer that streams credit card transactions from CSV into Kafka."""
+"""Kafka producer that streams credit card transactions from CSV into Kafka.
+
+One or more CSV files (a path, a directory or a glob) are indexed by byte
+offset, cut into shards of ``SHARD_LINES`` lines and sent by a pool of worker
+processes, each with its own ``KafkaProducer``. Every shard checkpoints the
+position of its acknowledged records under ``PRODUCER_CHECKPOINT_DIR``, so a
+restarted producer resumes where it stopped.
+
+Delivery is at least once. A restart resends the records acknowledged after
+the last checkpoint, and a file changed since its checkpoint is replayed from
+its first line. Resent records keep their record_id but carry a new
+processing_timestamp. The consumer drops them on ``event_id`` only while
+the first copy is within ``DEDUP_WATERMARK`` (one hour by default). Past that,
+every sink gets them twice. After a restart that late, or a changed-file
+replay, rebuild the affected output with the backfill, which drops every
+duplicate event_id.
+"""
+import argparse
+import concurrent.futures
 import csv
+import glob
+import itertools
 import json
+import multiprocessing
 import random
+import shutil
+import threading
 import time
 from datetime import datetime
+from functools import partial
 from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import os
 
 from kafka import KafkaProducer
+from kafka.metrics.measurable_stat import AbstractMeasurableStat
+from kafka.partitioner.default import DefaultPartitioner
+
+from .metrics import SIZE_BUCKETS_BYTES, Histogram, JsonLinesLog, MetricsRegistry, log_snapshots
+from .wire_format import WIRE_FORMATS, get_value_serializer
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 KAFKA_BROKER = os.getenv("KAFKA_BROKER", "localhost:9092")
-TOPIC_NAME = "credit_card_transactions"
+TOPIC_NAME = os.getenv("KAFKA_TOPIC", "credit_card_transactions")
 CSV_FILE_PATH = BASE_DIR / "data" / "User0_credit_card_transactions.csv"
 
+# Replay and batching settings (overridable on the command line)
+REPLAY_MODE = os.getenv("REPLAY_MODE", "random")
+TARGET_RATE = float(os.getenv("TARGET_RATE", "1000"))
+SPEEDUP = float(os.getenv("SPEEDUP", "3600"))
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "1000"))
+LINGER_MS = int(os.getenv("LINGER_MS", "5"))
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "65536"))
+COMPRESSION_TYPE = os.getenv("COMPRESSION_TYPE") or None
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json")
+
+# Partitioning: how records are keyed (see KEY_STRATEGIES) and the partition count the
+# topic is created or grown to (0 = leave the topic as it is)
+KEY_STRATEGY = os.getenv("KEY_STRATEGY", "card")
+NUM_PARTITIONS = int(os.getenv("NUM_PARTITIONS", "0"))
+REPLICATION_FACTOR = int(os.getenv("REPLICATION_FACTOR", "1"))
+
+# user:        key by User; one busy user pins all its traffic to one partition
+# card:        key by "User:Card"; spreads users with several cards, keeps each card in order
+# record:      key by record_id; even spread, no per-card ordering
+# round_robin: no key, records are dealt to partitions in turn by RoundRobinPartitioner
+KEY_STRATEGIES = ("user", "card", "record", "round_robin")
+
+# Observability: Prometheus endpoint (0 = off), JSON-lines snapshots every METRICS_INTERVAL
+# seconds (empty METRICS_FILE = off), and one acknowledged record logged in every LOG_EVERY
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9109"))
+METRICS_FILE = os.getenv("METRICS_FILE", str(BASE_DIR / "metrics" / "producer.jsonl"))
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "10"))
+LOG_EVERY = int(os.getenv("LOG_EVERY", "1000"))
+
+# Multi-file replay: input paths, directories or globs (comma separated), worker processes
+# (0 = one per core), lines per shard, and where shard positions are checkpointed (saved
+# every PRODUCER_CHECKPOINT_INTERVAL seconds and when a shard ends)
+PRODUCER_INPUT = os.getenv("PRODUCER_INPUT", str(CSV_FILE_PATH))
+PRODUCER_WORKERS = int(os.getenv("PRODUCER_WORKERS", "1"))
+SHARD_LINES = int(os.getenv("SHARD_LINES", "1000000"))
+PRODUCER_CHECKPOINT_DIR = os.getenv("PRODUCER_CHECKPOINT_DIR", str(BASE_DIR / "checkpoint" / "producer"))
+PRODUCER_CHECKPOINT_INTERVAL = float(os.getenv("PRODUCER_CHECKPOINT_INTERVAL", "5"))
+
+# record_id = file_id * RECORD_ID_STRIDE + data line number, unique across files as long
+# as no file has more lines; the first registered file keeps the plain row numbers
+RECORD_ID_STRIDE = 10 ** 10
+INDEX_BLOCK_BYTES = 1 << 22
+
+METRICS = MetricsRegistry()
+RECORDS_SENT = METRICS.counter("producer_records_total", "Records handed to the producer, by outcome.")
+SEND_LATENCY = METRICS.histogram("producer_send_latency_ms", "Time from send() to the broker acknowledgement.")
+RECORD_SIZE = METRICS.histogram(
+    "producer_record_size_bytes", "Serialized key and value size of each acknowledged record.", SIZE_BUCKETS_BYTES
+)
+BATCH_SIZE_BYTES = METRICS.histogram(
+    "producer_batch_size_bytes", "Compressed size of each partition batch sent to the broker.", SIZE_BUCKETS_BYTES
+)
+RECORDS_PER_REQUEST = METRICS.histogram(
+    "producer_records_per_request", "Records in each produce request.", (1, 10, 50, 100, 500, 1000, 5000, 10000)
+)
+
+
+def record_key(row: Dict, strategy: str = KEY_STRATEGY) -> Optional[str]:
+    """Return the message key of ``row`` under ``strategy`` (None for unkeyed records)."""
+    if strategy == "user":
+        return str(row.get("User", "0"))
+    if strategy == "card":
+        return f"{row.get('User', '0')}:{row.get('Card', '0')}"
+    if strategy == "record":
+        return str(row["record_id"])
+    if strategy == "round_robin":
+        return None
+    raise ValueError(f"Unknown key strategy {strategy!r}, expected one of {KEY_STRATEGIES}")
+
+
+class RoundRobinPartitioner:
+    """Deal unkeyed records to the available partitions in turn.
+
+    kafka-python's default picks a random partition for unkeyed records, which
+    evens out only on average; keyed records are still hashed like the default
+    (murmur2, compatible with the Java client).
+    """
 
-def create_producer():
-    """Create a Kafka producer with JSON serialization."""
+    def __init__(self):
+        self._counter = itertools.count()
+        self._default = DefaultPartitioner()
+
+    def __call__(self, key, all_partitions, available):
+        if key is not None:
+            return self._default(key, all_partitions, available)
+        partitions = sorted(available) if available else all_partitions
+        return partitions[next(self._counter) % len(partitions)]
+
+
+def ensure_topic(
+    topic: str = TOPIC_NAME, partitions: int = NUM_PARTITIONS, replication_factor: int = REPLICATION_FACTOR
+) -> Optional[int]:
+    """Create ``topic`` with ``partitions`` partitions, or grow it to that many.
+
+    Partitions are never removed. Growing a topic remaps keys to partitions, so
+    records of one card written before and after the change may be read out of
+    order. Returns the resulting partition count, or None when the broker is
+    unreachable.
+    """
+    from kafka.admin import KafkaAdminClient, NewPartitions, NewTopic
+    from kafka.errors import TopicAlreadyExistsError
+
+    try:
+        admin = KafkaAdminClient(bootstrap_servers=KAFKA_BROKER)
+    except Exception as exc:
+        print(f"[Producer] Cannot reach Kafka to manage topic {topic}: {exc}")
+        return None
+    try:
+        try:
+            admin.create_topics([NewTopic(topic, num_partitions=partitions, replication_factor=replication_factor)])
+            print(f"[Producer] Created topic {topic} with {partitions} partitions")
+            return partitions
+        except TopicAlreadyExistsError:
+            pass
+        current = len(admin.describe_topics([topic])[0]["partitions"])
+        if current < partitions:
+            admin.create_partitions({topic: NewPartitions(total_count=partitions)})
+            print(f"[Producer] Grew topic {topic} from {current} to {partitions} partitions")
+            return partitions
+        print(f"[Producer] Topic {topic} has {current} partitions")
+        return current
+    finally:
+        admin.close()
+
+
+class _HistogramStat(AbstractMeasurableStat):
+    """Feed every value recorded on a kafka-python sensor into a ``Histogram``."""
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def record(self, config, value, time_ms):
+        self.histogram.observe(value)
+
+    def measure(self, config, now):
+        return float(sum(entry["value"]["count"] for entry in self.histogram.snapshot()))
+
+
+def instrument_producer(producer: KafkaProducer) -> None:
+    """Attach the batch histograms to the producer's internal sender sensors.
+
+    kafka-python records the size of every partition batch and the record
+    count of every request on its ``batch-size`` and ``records-per-request``
+    sensors but only exposes their average and maximum. The sensors are
+    internal, so a kafka-python without them leaves the histograms empty.
+    """
+    registry = getattr(producer, "_metrics", None)
+    if registry is None:
+        print("[Producer] This kafka-python exposes no sender metrics; batch histograms stay empty")
+        return
+    for sensor_name, histogram in (("batch-size", BATCH_SIZE_BYTES), ("records-per-request", RECORDS_PER_REQUEST)):
+        sensor = registry.get_sensor(sensor_name)
+        if sensor is not None:
+            sensor.add(
+                registry.metric_name(f"{sensor_name}-histogram", "producer-metrics"), _HistogramStat(histogram)
+            )
+
+
+def idempotence_config() -> Dict:
+    """Return the settings enabling the idempotent producer, or {} when kafka-python lacks it.
+
+    With idempotence the broker discards batches re-sent by a retry; without
+    it a retry after a lost acknowledgement writes the records twice and only
+    the consumer's deduplication on ``event_id`` removes them.
+    """
+    if "enable_idempotence" in KafkaProducer.DEFAULT_CONFIG:
+        return {"enable_idempotence": True}
+    return {}
+
+
+def create_producer(
+    linger_ms: int = LINGER_MS,
+    batch_size: int = BATCH_SIZE,
+    compression_type: Optional[str] = COMPRESSION_TYPE,
+    wire_format: str = WIRE_FORMAT,
+):
+    """Create a Kafka producer for the given wire format and batching settings."""
+    idempotence = idempotence_config()
+    if not idempotence:
+        print("[Producer] This kafka-python has no idempotent producer; retries may duplicate records")
     try:
         print(f"[Producer] Trying to connect to Kafka broker at {KAFKA_BROKER}...")
         producer = KafkaProducer(
             bootstrap_servers=KAFKA_BROKER,
-            value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+            value_serializer=get_value_serializer(wire_format),
             key_serializer=lambda v: json.dumps(v).encode("utf-8") if v else None,
             acks="all",
             retries=3,
+            linger_ms=linger_ms,
+            batch_size=batch_size,
+            compression_type=compression_type,
+            partitioner=RoundRobinPartitioner(),
+            **idempotence,
         )
-        print(f"[Producer] Connected to Kafka broker: {KAFKA_BROKER}")
+        instrument_producer(producer)
+        print(f"[Producer] Connected to Kafka broker: {KAFKA_BROKER} (wire format: {wire_format})")
         return producer
     except Exception as exc:
         print(f"[Producer] Failed to connect to Kafka: {exc}")
         return None
 
 
-def read_and_send_csv(producer: KafkaProducer) -> None:
-    """Read the CSV row by row and send each record to Kafka with a random delay."""
+class ReplayPacer:
+    """Decide how long to wait before sending each row in a given replay mode.
+
+    Modes:
+        random: sleep ``random.uniform(1, 5)`` between records (demo mode).
+        max:    no pacing, send as fast as the in-flight window allows.
+        rate:   hold a fixed target of ``rate`` records per second.
+        event:  replay with the original Year/Month/Day/Time spacing,
+                compressed by ``speedup`` (e.g. 3600 = one hour per second).
+    """
+
+    MODES = ("random", "max", "rate", "event")
+
+    def __init__(self, mode: str = "random", rate: float = 1000.0, speedup: float = 3600.0):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown replay mode {mode!r}, expected one of {self.MODES}")
+        if mode == "rate" and rate <= 0:
+            raise ValueError("Target rate must be positive")
+        if mode == "event" and speedup <= 0:
+            raise ValueError("Speed-up factor must be positive")
+        self.mode = mode
+        self.rate = rate
+        self.speedup = speedup
+        self._start = None
+        self._sent = 0
+        self._first_event = None
+        self._last_event = None
+
+    @staticmethod
+    def event_time(row: Dict) -> Optional[datetime]:
+        """Parse the event time of a CSV row, or None when it is malformed."""
+        try:
+            hours, minutes = row["Time"].split(":")
+            return datetime(
+                int(row["Year"]), int(row["Month"]), int(row["Day"]), int(hours), int(minutes)
+            )
+        except (KeyError, ValueError, AttributeError):
+            return None
+
+    def wait(self, row: Dict) -> None:
+        """Block until ``row`` is due to be sent."""
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = now
+
+        if self.mode == "random":
+            if self._sent:
+                time.sleep(random.uniform(1, 5))
+        elif self.mode == "rate":
+            due = self._start + self._sent / self.rate
+            if due > now:
+                time.sleep(due - now)
+        elif self.mode == "event":
+            event = self.event_time(row)
+            if event is not None:
+                # Rows are grouped per card, so event time can jump backwards;
+                # a jump back starts a new pacing segment from the current row.
+                if self._first_event is None or event < self._last_event:
+                    self._first_event = event
+                    self._start = now
+                self._last_event = event
+                offset = (event - self._first_event).total_seconds() / self.speedup
+                due = self._start + offset
+                if due > now:
+                    time.sleep(due - now)
+
+        self._sent += 1
+
+
+def send_rows(
+    producer: KafkaProducer,
+    rows: Iterable[Dict],
+    source: str,
+    pacer: Optional[ReplayPacer] = None,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    key_strategy: str = KEY_STRATEGY,
+    topic: str = TOPIC_NAME,
+    log_every: int = LOG_EVERY,
+    numbered: bool = False,
+    on_ack: Optional[Callable[[int], None]] = None,
+) -> Dict:
+    """Send CSV-layout row dicts to Kafka asynchronously, then flush and close the producer.
+
+    Sends are pipelined: each record is handed to the producer with success and
+    error callbacks, and at most ``max_in_flight`` unacknowledged records are
+    outstanding at any time. ``pacer`` controls the replay speed and
+    ``key_strategy`` how records are spread over the topic's partitions.
+    Every acknowledgement is timed into ``SEND_LATENCY``, but only one record
+    in ``log_every`` is printed (failures always are). ``source`` is sent as
+    the ``source_file`` header.
+
+    Records are numbered from 0 in send order unless ``numbered``, when each
+    row already carries its ``record_id``. ``on_ack`` is called with the
+    ``record_id`` of every acknowledged record, from the producer's I/O
+    thread. Returns the sent, acked and failed counts and the elapsed seconds.
+    """
+    pacer = pacer or ReplayPacer(REPLAY_MODE, TARGET_RATE, SPEEDUP)
+    window = threading.BoundedSemaphore(max_in_flight)
+    stats = {"acked": 0, "failed": 0}
+    stats_lock = threading.Lock()
+
+    def on_success(record_metadata, record_id: int, row: Dict, sent_at: float) -> None:
+        window.release()
+        latency_ms = (time.perf_counter() - sent_at) * 1000
+        SEND_LATENCY.observe(latency_ms)
+        RECORD_SIZE.observe(
+            max(record_metadata.serialized_key_size, 0) + max(record_metadata.serialized_value_size, 0)
+        )
+        RECORDS_SENT.inc(outcome="acked")
+        if on_ack is not None:
+            on_ack(record_id)
+        with stats_lock:
+            stats["acked"] += 1
+            acked = stats["acked"]
+        if log_every and acked % log_every == 0:
+            print(
+                f"Record #{record_id} | Partition: {record_metadata.partition} | Offset: {record_metadata.offset} | "
+                f"User: {row['User']} | Amount: {row['Amount']} | Fraud: {row['Is Fraud?']} | "
+                f"latency: {latency_ms:.1f} ms | acked so far: {acked}"
+            )
+
+    def on_error(exc: BaseException, record_id: int) -> None:
+        window.release()
+        RECORDS_SENT.inc(outcome="failed")
+        with stats_lock:
+            stats["failed"] += 1
+        print(f"Failed to send record #{record_id}: {exc}")
+
+    count = 0
+    started = time.perf_counter()
     try:
-        if not CSV_FILE_PATH.exists():
-            print(f"Error: CSV file not found: {CSV_FILE_PATH}")
-            return
-        
-        with CSV_FILE_PATH.open("r", encoding="utf-8") as file:
-            csv_reader = csv.DictReader(file)
-            if not csv_reader:
-                print("Error: CSV file is empty or invalid")
-                return
-            
-            count = 0
-
-            for row in csv_reader:
-                row["processing_timestamp"] = datetime.now().isoformat()
+        # With record_id, identifies each event for the consumer's deduplication
+        headers = [("source_file", source.encode("utf-8"))]
+        print(
+            f"[Producer] Replay mode: {pacer.mode} | max in-flight: {max_in_flight} | "
+            f"topic: {topic} | key strategy: {key_strategy} | source: {source}"
+        )
+
+        for row in rows:
+            pacer.wait(row)
+
+            row["processing_timestamp"] = datetime.now().isoformat()
+            if not numbered:
                 row["record_id"] = count
+            record_id = row["record_id"]
 
-                key = str(row.get("User", "0"))
+            key = record_key(row, key_strategy)
 
+            window.acquire()
+            sent_at = time.perf_counter()
+            try:
                 future = producer.send(
-                    TOPIC_NAME,
+                    topic,
                     key=key,
                     value=row,
+                    headers=headers,
                 )
+            except Exception as send_exc:
+                on_error(send_exc, record_id)
+            else:
+                future.add_callback(on_success, record_id=record_id, row=row, sent_at=sent_at)
+                future.add_errback(on_error, record_id=record_id)
 
-                try:
-                    record_metadata = future.get(timeout=10)
-                except Exception as send_exc:
-                    print(f"Failed to send record #{count}: {send_exc}")
-                    continue
-
-                count += 1
-
-                print(
-                    f"Record #{count} | Partition: {record_metadata.partition} | Offset: {record_metadata.offset} | "
-                    f"User: {row['User']} | Amount: {row['Amount']} | Fraud: {row['Is Fraud?']}"
-                )
-
-                time.sleep(random.uniform(1, 5))
+            count += 1
 
-    except FileNotFoundError:
-        print(f"CSV file not found: {CSV_FILE_PATH}")
     except Exception as exc:  # pragma: no cover - runtime logging only
         print(f"Unexpected error: {exc}")
     finally:
@@ -86,15 +420,459 @@ def read_and_send_csv(producer: KafkaProducer) -> None:
             producer.close()
             print("Closed Kafka producer.")
 
+        elapsed = time.perf_counter() - started
+        print(
+            f"[Producer] Sent {count} records in {elapsed:.2f}s "
+            f"({count / elapsed if elapsed else 0:,.0f} records/s) | "
+            f"acked: {stats['acked']} | failed: {stats['failed']}"
+        )
+    return {"sent": count, "acked": stats["acked"], "failed": stats["failed"], "seconds": elapsed}
+
+
+def read_and_send_csv(
+    producer: KafkaProducer,
+    pacer: Optional[ReplayPacer] = None,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    key_strategy: str = KEY_STRATEGY,
+    topic: str = TOPIC_NAME,
+    log_every: int = LOG_EVERY,
+) -> None:
+    """Send ``CSV_FILE_PATH`` row by row through ``producer`` with ``send_rows``.
+
+    Kept for callers of the original single-file entry point; ``main`` replays
+    files with ``replay_files``, which shards and checkpoints them. Records are
+    numbered from 0 in send order, the record_ids ``replay_files`` gives the
+    data lines of its first file when it has no blank lines.
+    """
+    if not CSV_FILE_PATH.exists():
+        print(f"Error: CSV file not found: {CSV_FILE_PATH}")
+        producer.close()
+        return
+
+    with CSV_FILE_PATH.open("r", encoding="utf-8") as file:
+        send_rows(
+            producer,
+            csv.DictReader(file),
+            CSV_FILE_PATH.name,
+            pacer=pacer,
+            max_in_flight=max_in_flight,
+            key_strategy=key_strategy,
+            topic=topic,
+            log_every=log_every,
+        )
+
+
+def resolve_inputs(specs: Iterable[str]) -> List[Path]:
+    """Expand input paths, directories (their ``*.csv`` files) and globs into a sorted file list."""
+    paths = set()
+    for spec in specs:
+        if glob.has_magic(spec):
+            matches = [Path(match) for match in glob.glob(spec, recursive=True)]
+        elif Path(spec).is_dir():
+            matches = list(Path(spec).glob("*.csv"))
+        else:
+            matches = [Path(spec)]
+        for path in matches:
+            if path.is_file():
+                paths.add(path.resolve())
+            else:
+                print(f"Error: CSV file not found: {path}")
+    return sorted(paths)
+
+
+def build_line_index(path: Path, stride: int) -> Tuple[List[int], int]:
+    """Return the byte offsets of data lines 0, ``stride``, 2 * ``stride``, ... and the data line count.
+
+    Line 0 is the first line after the header. The file is scanned in blocks
+    for newline bytes, so indexing costs about one sequential read; quoted
+    fields must not contain newlines (the transaction CSVs have none).
+    """
+    import numpy as np
+
+    with open(path, "rb") as file:
+        position = len(file.readline())
+        offsets = [position]
+        next_mark = stride
+        newlines = 0
+        last = b"\n"
+        while True:
+            block = file.read(INDEX_BLOCK_BYTES)
+            if not block:
+                break
+            ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n"))
+            while next_mark - newlines <= len(ends):
+                offsets.append(position + int(ends[next_mark - newlines - 1]) + 1)
+                next_mark += stride
+            newlines += len(ends)
+            position += len(block)
+            last = block[-1:]
+    lines = newlines + (last != b"\n")
+    return offsets[: -(-lines // stride)], lines
+
+
+def _read_json(path: Path) -> Optional[Dict]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: Path, doc: Dict) -> None:
+    """Replace ``path`` with ``doc`` atomically, so a crash leaves the old or the new document."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_name(path.name + ".tmp")
+    staging.write_text(json.dumps(doc, indent=1), encoding="utf-8")
+    os.replace(staging, path)
+
+
+def register_files(paths: Iterable[Path], checkpoint_dir: Path) -> Dict[str, int]:
+    """Return the file id of each path, assigning new ids in order and keeping them in ``files.json``.
+
+    Ids are never reused or reassigned, so a file keeps its record_ids, and
+    resent records their event_ids, across runs.
+    """
+    registry_path = checkpoint_dir / "files.json"
+    registry = _read_json(registry_path) or {}
+    added = False
+    for path in paths:
+        if str(path) not in registry:
+            registry[str(path)] = max(registry.values(), default=-1) + 1
+            added = True
+    if added:
+        _write_json(registry_path, registry)
+    return {str(path): registry[str(path)] for path in paths}
+
+
+def plan_shards(path: Path, file_id: int, shard_lines: int, checkpoint_dir: Path, fresh: bool = False) -> List[Dict]:
+    """Split ``path`` into shards of ``shard_lines`` lines, resumed from their checkpoints.
+
+    The index and shard size are kept in ``<file_id>/file.json``, so a
+    resumed file keeps its shard boundaries even when ``shard_lines``
+    changes. A file whose size or modification time changed is replayed from
+    the start, as is every file with ``fresh``. The rows it shares with the
+    earlier copy are sent again and reach the sinks twice unless the consumer
+    still deduplicates them (see the module docstring).
+    """
+    file_dir = checkpoint_dir / str(file_id)
+    stat = path.stat()
+    layout = None if fresh else _read_json(file_dir / "file.json")
+    if layout is not None and (layout["size"], layout["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+        print(f"[Producer] {path} changed since its checkpoint; replaying it from the start")
+        layout = None
+    if layout is None:
+        shutil.rmtree(file_dir, ignore_errors=True)
+        offsets, lines = build_line_index(path, shard_lines)
+        if lines >= RECORD_ID_STRIDE:
+            raise ValueError(f"{path} has {lines} lines, more than record ids allow ({RECORD_ID_STRIDE})")
+        layout = {
+            "path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "shard_lines": shard_lines, "lines": lines, "offsets": offsets,
+        }
+        _write_json(file_dir / "file.json", layout)
+
+    shards = []
+    offsets = layout["offsets"]
+    for index, start_offset in enumerate(offsets):
+        start_line = index * layout["shard_lines"]
+        shard = {
+            "path": str(path),
+            "file_id": file_id,
+            "start_line": start_line,
+            "end_line": min(start_line + layout["shard_lines"], layout["lines"]),
+            "end_offset": offsets[index + 1] if index + 1 < len(offsets) else layout["size"],
+            "next_line": start_line,
+            "next_offset": start_offset,
+            "checkpoint": str(file_dir / f"shard-{start_line:010d}.json"),
+        }
+        saved = _read_json(Path(shard["checkpoint"]))
+        if saved is not None:
+            shard.update(next_line=saved["next_line"], next_offset=saved["next_offset"])
+        shards.append(shard)
+    return shards
+
+
+class ShardProgress:
+    """Read the rows of one shard and checkpoint the prefix of it that Kafka acknowledged.
 
-def main():
-    producer = create_producer()
+    Acknowledgements arrive out of order across partitions, so the checkpoint
+    holds the first line not yet acknowledged (``next_line``) and its byte
+    offset. After a restart the records acknowledged past it are sent again
+    with the same record_id. The consumer drops them on ``event_id`` only
+    within ``DEDUP_WATERMARK`` of the first copy (see the module docstring).
+    Blank lines are skipped but keep their line numbers.
+    """
 
-    if producer:
-        read_and_send_csv(producer)
+    def __init__(self, shard: Dict):
+        self.shard = shard
+        self.base = shard["file_id"] * RECORD_ID_STRIDE
+        self.next_line = shard["next_line"]
+        self.next_offset = shard["next_offset"]
+        self._saved = None
+        self._line_ends: Dict[int, int] = {}
+        self._acked = set()
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.next_line >= self.shard["end_line"]
+
+    def rows(self, file) -> Iterator[Dict]:
+        """Yield the unsent rows of the shard from ``file`` (opened in binary mode), with their record_id."""
+        file.seek(0)
+        header = next(csv.reader([file.readline().decode("utf-8")]))
+        line, offset = self.next_line, self.next_offset
+        file.seek(offset)
+        while line < self.shard["end_line"]:
+            raw = file.readline()
+            if not raw:
+                break
+            offset += len(raw)
+            values = next(csv.reader([raw.decode("utf-8")]), None)
+            with self._lock:
+                self._line_ends[line] = offset
+            if values:
+                yield dict(zip(header, values), record_id=self.base + line)
+            else:
+                self._complete(line)
+            line += 1
+
+    def ack(self, record_id: int) -> None:
+        self._complete(record_id - self.base)
+
+    def _complete(self, line: int) -> None:
+        with self._lock:
+            self._acked.add(line)
+            while self.next_line in self._acked:
+                self._acked.discard(self.next_line)
+                self.next_offset = self._line_ends.pop(self.next_line)
+                self.next_line += 1
+
+    def save(self) -> None:
+        """Write the acknowledged position to the shard's checkpoint if it moved."""
+        with self._lock:
+            position = {"next_line": self.next_line, "next_offset": self.next_offset}
+        if position != self._saved:
+            _write_json(Path(self.shard["checkpoint"]), dict(position, end_line=self.shard["end_line"]))
+            self._saved = position
+
+    def save_every(self, interval_seconds: float):
+        """Save every ``interval_seconds`` from a daemon thread; returns a function that stops it and saves."""
+        stopped = threading.Event()
+
+        def run():
+            while not stopped.wait(interval_seconds):
+                self.save()
+
+        thread = threading.Thread(target=run, name="producer-checkpoint", daemon=True)
+        thread.start()
+
+        def stop():
+            stopped.set()
+            thread.join()
+            self.save()
+
+        return stop
+
+
+def send_shard(shard: Dict, options: Dict, producer_factory: Optional[Callable] = None) -> Dict:
+    """Send the unsent rows of ``shard`` with a producer of its own, checkpointing as records are acked.
+
+    ``options`` holds the producer, pacing and routing settings of
+    ``replay_files``. Returns the ``send_rows`` counts with the shard's
+    resulting ``next_line``, or an ``error`` when no producer could be made.
+    """
+    name = f"{Path(shard['path']).name}[{shard['next_line']}:{shard['end_line']}]"
+    producer = (producer_factory or create_producer)(
+        linger_ms=options["linger_ms"],
+        batch_size=options["batch_size"],
+        compression_type=options["compression_type"],
+        wire_format=options["wire_format"],
+    )
+    if producer is None:
+        return {"shard": name, "error": "no producer", "sent": 0, "acked": 0, "failed": 0}
+    progress = ShardProgress(shard)
+    stop_saving = progress.save_every(PRODUCER_CHECKPOINT_INTERVAL)
+    try:
+        with open(shard["path"], "rb") as file:
+            stats = send_rows(
+                producer,
+                progress.rows(file),
+                Path(shard["path"]).name,
+                pacer=ReplayPacer(options["mode"], rate=options["rate"], speedup=options["speedup"]),
+                max_in_flight=options["max_in_flight"],
+                key_strategy=options["key_strategy"],
+                topic=options["topic"],
+                log_every=options["log_every"],
+                numbered=True,
+                on_ack=progress.ack,
+            )
+    finally:
+        stop_saving()
+    return dict(stats, shard=name, next_line=progress.next_line, end_line=shard["end_line"])
+
+
+def replay_files(
+    paths: List[Path],
+    options: Dict,
+    workers: int = PRODUCER_WORKERS,
+    shard_lines: int = SHARD_LINES,
+    checkpoint_dir: Path = Path(PRODUCER_CHECKPOINT_DIR),
+    fresh: bool = False,
+    producer_factory: Optional[Callable] = None,
+) -> Dict:
+    """Replay the CSV files ``paths`` into Kafka, resuming each shard from its checkpoint.
+
+    Shards are sent in file and line order, by ``workers`` processes (0 =
+    one per core) or in this process when there is one worker. In ``rate``
+    mode the target rate is shared between the workers. Records of one card
+    keep their order except across a shard boundary, which two workers may
+    send concurrently. Returns the summed counts of the shards sent.
+    """
+    file_ids = register_files(paths, checkpoint_dir)
+    shards = [
+        shard
+        for path in paths
+        for shard in plan_shards(path, file_ids[str(path)], shard_lines, checkpoint_dir, fresh)
+    ]
+    pending = [shard for shard in shards if shard["next_line"] < shard["end_line"]]
+    workers = min(workers or os.cpu_count() or 1, max(len(pending), 1))
+    remaining = sum(shard["end_line"] - shard["next_line"] for shard in pending)
+    print(
+        f"[Producer] {len(paths)} files | {len(shards)} shards, {len(pending)} to send "
+        f"({remaining:,} lines) | workers: {workers} | checkpoints: {checkpoint_dir}"
+    )
+    options = dict(options, rate=options["rate"] / workers)
+    send = partial(send_shard, options=options, producer_factory=producer_factory)
+
+    totals = {"shards": 0, "sent": 0, "acked": 0, "failed": 0}
+    started = time.perf_counter()
+
+    def add(stats: Dict) -> bool:
+        if stats.get("error"):
+            print(f"Unable to send shard {stats['shard']}. Please verify the Kafka server.")
+            return False
+        totals["shards"] += 1
+        for field in ("sent", "acked", "failed"):
+            totals[field] += stats[field]
+        if stats["next_line"] < stats["end_line"]:
+            print(f"[Producer] Shard {stats['shard']} stopped at line {stats['next_line']}; a rerun resumes it")
+        return True
+
+    if workers == 1:
+        for shard in pending:
+            if not add(send(shard)):
+                break
     else:
-        print("Unable to start producer. Please verify the Kafka server.")
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+            for future in concurrent.futures.as_completed([pool.submit(send, shard) for shard in pending]):
+                stats = future.result()
+                if add(stats):
+                    # Worker processes keep their own metrics; count their records here
+                    RECORDS_SENT.inc(stats["acked"], outcome="acked")
+                    RECORDS_SENT.inc(stats["failed"], outcome="failed")
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"[Producer] Replayed {totals['shards']} shards: {totals['sent']} records in {elapsed:.2f}s "
+        f"({totals['sent'] / elapsed if elapsed else 0:,.0f} records/s) | "
+        f"acked: {totals['acked']} | failed: {totals['failed']}"
+    )
+    return totals
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay credit card transactions into Kafka.")
+    parser.add_argument(
+        "--input",
+        nargs="+",
+        default=PRODUCER_INPUT.split(","),
+        help="CSV files, directories of CSV files or globs to replay.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=PRODUCER_WORKERS,
+        help="Sending processes, one producer each (0 = one per core).",
+    )
+    parser.add_argument("--shard-lines", type=int, default=SHARD_LINES, help="Lines per shard of an input file.")
+    parser.add_argument(
+        "--checkpoint", default=PRODUCER_CHECKPOINT_DIR, help="Directory of the file ids and shard positions."
+    )
+    parser.add_argument("--fresh", action="store_true", help="Ignore the shard positions and replay from the start.")
+    parser.add_argument("--mode", choices=ReplayPacer.MODES, default=REPLAY_MODE)
+    parser.add_argument("--rate", type=float, default=TARGET_RATE, help="Records per second in 'rate' mode.")
+    parser.add_argument(
+        "--speedup", type=float, default=SPEEDUP, help="Event-time compression factor in 'event' mode."
+    )
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--linger-ms", type=int, default=LINGER_MS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--compression",
+        choices=["gzip", "snappy", "lz4", "zstd"],
+        default=COMPRESSION_TYPE,
+        help="Producer compression codec (snappy/lz4/zstd need their Python packages).",
+    )
+    parser.add_argument(
+        "--wire-format",
+        choices=WIRE_FORMATS,
+        default=WIRE_FORMAT,
+        help="Message encoding; 'avro' is the compact typed format, 'json' the fallback.",
+    )
+    parser.add_argument(
+        "--key-strategy",
+        choices=KEY_STRATEGIES,
+        default=KEY_STRATEGY,
+        help="How records are keyed, and so spread over partitions.",
+    )
+    parser.add_argument("--topic", default=TOPIC_NAME)
+    parser.add_argument(
+        "--log-every", type=int, default=LOG_EVERY, help="Print one acknowledged record in this many (0 = none)."
+    )
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Prometheus endpoint port (0 = off).")
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=NUM_PARTITIONS,
+        help="Create or grow the topic to this many partitions before sending (0 = leave it as it is).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = resolve_inputs(args.input)
+    if not paths:
+        print("Error: no input files to replay")
+        return
+    if args.partitions:
+        ensure_topic(args.topic, args.partitions)
+
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+    stop_metrics_log = None
+    if METRICS_FILE:
+        stop_metrics_log = log_snapshots(METRICS, JsonLinesLog(Path(METRICS_FILE)), METRICS_INTERVAL, "producer")
+    options = {
+        "linger_ms": args.linger_ms,
+        "batch_size": args.batch_size,
+        "compression_type": args.compression,
+        "wire_format": args.wire_format,
+        "mode": args.mode,
+        "rate": args.rate,
+        "speedup": args.speedup,
+        "max_in_flight": args.max_in_flight,
+        "key_strategy": args.key_strategy,
+        "topic": args.topic,
+        "log_every": args.log_every,
+    }
+    try:
+        replay_files(paths, options, args.workers, args.shard_lines, Path(args.checkpoint), args.fresh)
+    finally:
+        if stop_metrics_log:
+            stop_metrics_log()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,792 @@
+"""Spark-free single-node engine for the transaction pipeline.
+
+For small deployments where a JVM and connector resolution cost more than
+the few records per second they process, this engine runs the stages of
+``process_stream`` on chunked pandas frames:
+
+* parsing, amount cleaning and event time (``with_typed_fields``)
+* date formatting, ``transaction_type`` and error filtering
+  (``enrich_transactions``)
+* deduplication by ``event_id`` within ``DEDUP_WATERMARK``
+* the exchange rate (live and historical), the dimension tables and the
+  fraud score (``enrich_batch``)
+* per-user window statistics with the ``STATS_WATERMARK`` watermark, in
+  ``STATS_OUTPUT_MODE``
+
+It writes the same sinks in the same layout: ``transactions`` and
+``user_stats`` as Parquet committed per batch like ``commit_batch`` (each
+CSV run under a scope of its own, the Kafka source under one kept in its
+checkpoint), the
+daily ``rollups`` merged per batch, plus ``csv_export``, ``console`` and
+``alerts``. Velocity features are not
+computed here.
+
+Sources:
+
+* ``csv PATH``: a file or directory of transaction CSVs, read in chunks of
+  ``LOCAL_BATCH_ROWS`` rows. Open windows are emitted at the end.
+* ``kafka``: the transactions topic, polled every ``TRIGGER_INTERVAL``. The
+  offsets, the deduplication state and the open windows are saved after each
+  batch to ``<checkpoint>/local_engine/state.pkl``, so a restart resumes
+  from the last committed batch.
+
+CSV rows have no producer ``record_id``, so their ``event_id`` is the file
+name and a hash of the row, like ``backfill.read_csv_transactions`` (the
+hash function differs). ``tests/test_local_engine.py`` checks the output
+against the Spark path on the sample CSV.
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from dateutil import tz
+
+from .batch_commit import commit_local_batch, local_batch_sequence
+from .dimensions import DIMENSION_COLUMNS, apply_dimensions_pandas
+from .fraud_model import FRAUD_MODEL_PATH, FRAUD_THRESHOLD, INPUT_COLUMNS, load_model
+from .pipeline_settings import (
+    ALERT_TYPES,
+    ALERTS_TOPIC,
+    CHECKPOINT_DIR,
+    CHECKPOINT_URI,
+    DEDUP_WATERMARK,
+    DEFAULT_EXCHANGE_RATE,
+    EXCHANGE_RATE_MODE,
+    FRAUD_COLUMNS,
+    FRAUD_SCORING,
+    KAFKA_BROKER,
+    KAFKA_TOPIC,
+    OUTPUT_COLUMNS,
+    OUTPUT_DIR,
+    OUTPUT_URI,
+    PARQUET_COMPRESSION,
+    PARTITION_BY,
+    SINKS,
+    STATS_OUTPUT_MODE,
+    STATS_WATERMARK,
+    STATS_WINDOW,
+    TRIGGER_INTERVAL,
+    VELOCITY_FEATURES,
+    WIRE_FORMAT,
+)
+from .rate_cache import get_shared_cache
+from .rate_history import RateHistory
+from .rollups import (
+    PARTITION_COLUMNS,
+    base_files,
+    merge_rollup_pandas,
+    partition_dir,
+    rollup_deltas_pandas,
+    stale_files,
+)
+from .wire_format import USE_CHIP_LABELS, USE_CHIP_SYMBOLS, WIRE_FORMAT_AVRO, decode_typed
+
+
+LOCAL_BATCH_ROWS = int(os.getenv("LOCAL_BATCH_ROWS", "50000"))
+LOCAL_SINKS = ("transactions", "csv_export", "console", "rollups", "user_stats", "alerts")
+
+CSV_COLUMNS = [
+    "User", "Card", "Year", "Month", "Day", "Time", "Amount", "Use Chip", "Merchant Name",
+    "Merchant City", "Merchant State", "Zip", "MCC", "Errors?", "Is Fraud?",
+]
+RAW_COLUMNS = CSV_COLUMNS + ["processing_timestamp", "record_id"]
+
+# Spark's session time zone defaults to the JVM's, i.e. the local zone; wall-clock
+# timestamps are read in it and stored as instants
+LOCAL_TZ = tz.tzlocal()
+
+# Parquet types matching what the Spark sinks write, so both engines' files read as one table
+COLUMN_TYPES = {
+    "transaction_datetime": "timestamp",
+    "processed_at": "timestamp",
+    "processing_date": "date",
+    "transaction_year": "int32",
+    "transaction_month": "int32",
+    "transaction_day": "int32",
+    "transaction_hour": "int32",
+    "day_of_week": "int32",
+    "Amount_USD": "double",
+    "Amount_VND": "double",
+    "exchange_rate": "double",
+    "merchant_risk_score": "double",
+    "fraud_score": "double",
+    "fraud_predicted": "bool",
+    "window_start": "timestamp",
+    "window_end": "timestamp",
+    "transaction_count": "int64",
+    "total_amount_vnd": "double",
+    "avg_amount_vnd": "double",
+    "fraud_count": "int64",
+    "batch_id": "int32",
+    "event_date": "date",
+    "amount_usd": "double",
+    "amount_vnd": "double",
+}
+
+
+def _seconds(interval: str) -> float:
+    return pd.Timedelta(interval).total_seconds()
+
+
+def to_instant(wall_clock: pd.Series) -> pd.Series:
+    """Read naive wall-clock timestamps in the local zone, as Spark does, and return UTC instants."""
+    if wall_clock.dt.tz is not None:
+        return wall_clock.dt.tz_convert("UTC")
+    return wall_clock.dt.tz_localize(
+        LOCAL_TZ, ambiguous=np.ones(len(wall_clock), dtype=bool), nonexistent="shift_forward"
+    ).dt.tz_convert("UTC")
+
+
+def with_typed_fields(frame: pd.DataFrame) -> pd.DataFrame:
+    """Derive typed amount and event-time columns from the raw string fields."""
+    frame["Amount_USD"] = pd.to_numeric(frame["Amount"].str.replace("$", "", regex=False), errors="coerce")
+    frame["transaction_datetime"] = pd.to_datetime(
+        frame["Year"] + "-" + frame["Month"] + "-" + frame["Day"] + " " + frame["Time"],
+        format="%Y-%m-%d %H:%M",
+        errors="coerce",
+    )
+    frame["Zip"] = frame["Zip"].str.replace(r"\.0$", "", regex=True)
+    frame["processing_timestamp"] = pd.to_datetime(frame["processing_timestamp"], format="ISO8601", errors="coerce")
+    return frame
+
+
+def with_event_id(frame: pd.DataFrame) -> pd.DataFrame:
+    """Add ``event_id``: ``<source_file>:<record_id>``, else the Kafka position."""
+    source_id = frame["_event_source"] + ":" + frame["record_id"]
+    frame["event_id"] = source_id.where(source_id.notna(), frame["_event_position"])
+    return frame.drop(columns=["_event_source", "_event_position"])
+
+
+def enrich_transactions(frame: pd.DataFrame, processed_at: datetime) -> pd.DataFrame:
+    """Add date, analysis and category columns and drop rows with errors."""
+    when = frame["transaction_datetime"]
+    frame["transaction_date"] = when.dt.strftime("%d/%m/%Y")
+    frame["transaction_time"] = when.dt.strftime("%H:%M:%S")
+    frame["transaction_year"] = when.dt.year.astype("Int32")
+    frame["transaction_month"] = when.dt.month.astype("Int32")
+    frame["transaction_day"] = when.dt.day.astype("Int32")
+    frame["transaction_hour"] = when.dt.hour.astype("Int32")
+    # Spark's dayofweek: Sunday = 1 ... Saturday = 7
+    frame["day_of_week"] = ((when.dt.dayofweek + 1) % 7 + 1).astype("Int32")
+
+    amount = frame["Amount_USD"]
+    frame["transaction_type"] = np.select(
+        [frame["Is Fraud?"] == "Yes", amount > 500, amount > 100],
+        ["FRAUD", "HIGH_VALUE", "MEDIUM_VALUE"],
+        "LOW_VALUE",
+    )
+
+    frame = frame[frame["Errors?"].isna() | (frame["Errors?"] == "")].copy()
+    frame["processed_at"] = pd.Timestamp(processed_at)
+    frame["processing_date"] = processed_at.date()
+    return frame
+
+
+class EventDeduplicator:
+    """Keep the first row of each ``event_id`` within ``delay`` of ``event_time``.
+
+    Mirrors ``dropDuplicatesWithinWatermark``: the watermark is the latest
+    event time seen in earlier batches minus ``delay``; rows behind it are
+    dropped as late and ids are forgotten once their time falls behind it.
+    ``late`` counts the rows dropped as late, like Spark's
+    ``numRowsDroppedByWatermark``.
+    """
+
+    def __init__(self, event_time: str, delay: str):
+        self.event_time = event_time
+        self.delay = pd.Timedelta(delay)
+        self.watermark: Optional[pd.Timestamp] = None
+        self.seen: Dict[str, pd.Timestamp] = {}
+        self.late = 0
+
+    def apply(self, frame: pd.DataFrame) -> pd.DataFrame:
+        times = frame[self.event_time]
+        keep = times.notna()
+        if self.watermark is not None:
+            on_time = times >= self.watermark
+            self.late += int((keep & ~on_time).sum())
+            keep &= on_time
+        frame = frame[keep]
+        frame = frame[~frame["event_id"].duplicated() & ~frame["event_id"].isin(list(self.seen))]
+        self.seen.update(zip(frame["event_id"], frame[self.event_time]))
+        if not frame.empty:
+            latest = frame[self.event_time].max() - self.delay
+            self.watermark = latest if self.watermark is None else max(self.watermark, latest)
+            self.seen = {key: seen for key, seen in self.seen.items() if seen >= self.watermark}
+        return frame
+
+
+def resolve_exchange_rate() -> float:
+    """Return the USD/VND transfer rate from the shared rate cache."""
+    return get_shared_cache().get_rate("USD", "transfer", default=DEFAULT_EXCHANGE_RATE)
+
+
+_history_cache = {"mtime": None, "rates": None}
+
+
+def load_rate_history() -> Optional[pd.Series]:
+    """Return the daily USD rate indexed by day, or None (see the Spark ``load_rate_history``)."""
+    if EXCHANGE_RATE_MODE != "historical":
+        return None
+    history = RateHistory()
+    mtime = history.mtime()
+    if mtime is None:
+        return None
+    if _history_cache["mtime"] != mtime:
+        daily = history.daily_rates("USD", "transfer")
+        rates = None
+        if not daily.empty:
+            rates = pd.Series(daily["history_rate"].to_numpy(), index=pd.to_datetime(daily["rate_date"]))
+            print(f"Loaded rate history: {len(daily):,} days up to {daily['rate_date'].iloc[-1]}")
+        _history_cache.update(mtime=mtime, rates=rates)
+    return _history_cache["rates"]
+
+
+def apply_exchange_rate(frame: pd.DataFrame, rate: float, history: Optional[pd.Series] = None) -> pd.DataFrame:
+    """Add ``exchange_rate`` (the rate on the transaction date, else ``rate``) and ``Amount_VND``."""
+    frame["exchange_rate"] = float(rate)
+    if history is not None:
+        frame["exchange_rate"] = (
+            frame["transaction_datetime"].dt.normalize().map(history).fillna(float(rate)).astype("float64")
+        )
+    frame["Amount_VND"] = frame["Amount_USD"] * frame["exchange_rate"]
+    return frame
+
+
+def rate_user_stats(stats: pd.DataFrame, rate: float, history: Optional[pd.Series] = None) -> pd.DataFrame:
+    """Convert emitted windows to VND at the rate of the window start's local date (see the Spark version)."""
+    exchange_rate = pd.Series(float(rate), index=stats.index)
+    if history is not None:
+        day = stats["window_start"].dt.tz_convert(LOCAL_TZ).dt.tz_localize(None).dt.normalize()
+        exchange_rate = day.map(history).fillna(float(rate)).astype("float64")
+    amounts = {"total_amount_usd": "total_amount_vnd", "avg_amount_usd": "avg_amount_vnd"}
+    stats = stats.rename(columns=amounts)
+    stats[list(amounts.values())] = stats[list(amounts.values())].astype("float64").mul(exchange_rate, axis=0)
+    return stats
+
+
+def add_fraud_score(frame: pd.DataFrame, model_path: Path = FRAUD_MODEL_PATH, threshold: float = FRAUD_THRESHOLD):
+    """Add ``fraud_score`` and ``fraud_predicted`` with the same numpy model the pandas UDF uses."""
+    amount, hour, day_of_week, use_chip, merchant_state = INPUT_COLUMNS
+    frame["fraud_score"] = load_model(model_path).score(
+        frame[amount],
+        frame[hour].astype("float64"),
+        frame[day_of_week].astype("float64"),
+        frame[use_chip],
+        frame[merchant_state],
+    )
+    frame["fraud_predicted"] = frame["fraud_score"] >= threshold
+    return frame
+
+
+def select_output(frame: pd.DataFrame) -> pd.DataFrame:
+    optional = [name for name in DIMENSION_COLUMNS + FRAUD_COLUMNS if name in frame.columns]
+    return frame[OUTPUT_COLUMNS + optional]
+
+
+def enrich_batch(frame: pd.DataFrame, scoring: bool = FRAUD_SCORING) -> pd.DataFrame:
+    """Apply the per-batch stages: exchange rate, dimension tables and fraud score, then project."""
+    frame = apply_exchange_rate(frame, resolve_exchange_rate(), load_rate_history())
+    frame = apply_dimensions_pandas(frame)
+    if scoring and FRAUD_MODEL_PATH.exists():
+        frame = add_fraud_score(frame)
+    return select_output(frame)
+
+
+class UserStatsAggregator:
+    """Per-user aggregates over ``STATS_WINDOW`` event-time windows with a watermark.
+
+    In ``append`` mode a window is emitted once the watermark passes its end;
+    in ``update`` mode every window a batch touched is emitted. ``flush``
+    emits the windows still open (end of a bounded source).
+    """
+
+    def __init__(self, window: str = STATS_WINDOW, delay: str = STATS_WATERMARK, mode: str = STATS_OUTPUT_MODE):
+        self.window = pd.Timedelta(window)
+        self.mode = mode
+        self.dedup = EventDeduplicator("transaction_datetime", delay)
+        # (window_start, User) -> [count, sum of Amount_USD, non-null Amount_USD, frauds]
+        self.windows: Dict[tuple, list] = {}
+
+    def update(self, frame: pd.DataFrame) -> pd.DataFrame:
+        frame = self.dedup.apply(frame)
+        touched = set()
+        if not frame.empty:
+            starts = to_instant(frame["transaction_datetime"]).dt.floor(self.window)
+            grouped = (
+                pd.DataFrame(
+                    {
+                        "window_start": starts.to_numpy(),
+                        "User": frame["User"].to_numpy(),
+                        "amount": frame["Amount_USD"].to_numpy(),
+                        "fraud": (frame["Is Fraud?"] == "Yes").to_numpy(),
+                    }
+                )
+                .groupby(["window_start", "User"], dropna=False)
+                .agg(rows=("fraud", "size"), total=("amount", "sum"), amounts=("amount", "count"),
+                     frauds=("fraud", "sum"))
+            )
+            for key, rows, total, amounts, frauds in grouped.itertuples(name=None):
+                state = self.windows.setdefault(key, [0, 0.0, 0, 0])
+                state[0] += rows
+                state[1] += total
+                state[2] += amounts
+                state[3] += frauds
+                touched.add(key)
+
+        watermark = None if self.dedup.watermark is None else to_instant(pd.Series([self.dedup.watermark])).iloc[0]
+        closed = {key for key in self.windows if watermark is not None and key[0] + self.window <= watermark}
+        result = self._rows(touched if self.mode == "update" else closed)
+        for key in closed:
+            del self.windows[key]
+        return result
+
+    def flush(self) -> pd.DataFrame:
+        result = self._rows(set(self.windows))
+        self.windows.clear()
+        return result
+
+    def _rows(self, keys) -> pd.DataFrame:
+        rows = []
+        for key in sorted(keys, key=lambda key: (key[0], str(key[1]))):
+            count, total, amounts, frauds = self.windows[key]
+            rows.append(
+                {
+                    "window_start": key[0],
+                    "window_end": key[0] + self.window,
+                    "User": key[1],
+                    "transaction_count": count,
+                    "total_amount_usd": total if amounts else None,
+                    "avg_amount_usd": total / amounts if amounts else None,
+                    "fraud_count": frauds,
+                }
+            )
+        return pd.DataFrame(
+            rows,
+            columns=["window_start", "window_end", "User", "transaction_count", "total_amount_usd",
+                     "avg_amount_usd", "fraud_count"],
+        )
+
+
+def output_root(name: str) -> Path:
+    """Return the local output directory of a sink (``file://`` URIs allowed, other schemes are not)."""
+    if OUTPUT_URI is None:
+        return OUTPUT_DIR / name
+    if OUTPUT_URI.startswith("file://"):
+        return Path(OUTPUT_URI[len("file://"):]) / name
+    if "://" in OUTPUT_URI:
+        raise ValueError(f"The local engine writes local files only, not {OUTPUT_URI}")
+    return Path(OUTPUT_URI) / name
+
+
+def checkpoint_root(name: str) -> Path:
+    if CHECKPOINT_URI is None:
+        return CHECKPOINT_DIR / name
+    if CHECKPOINT_URI.startswith("file://"):
+        return Path(CHECKPOINT_URI[len("file://"):]) / name
+    if "://" in CHECKPOINT_URI:
+        raise ValueError(f"The local engine keeps local checkpoints only, not {CHECKPOINT_URI}")
+    return Path(CHECKPOINT_URI) / name
+
+
+def to_arrow(frame: pd.DataFrame):
+    """Convert a sink frame to an Arrow table with the column types the Spark sinks write."""
+    import pyarrow as pa
+
+    arrow_types = {
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "date": pa.date32(),
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "double": pa.float64(),
+        "bool": pa.bool_(),
+    }
+    frame = frame.copy()
+    fields = []
+    for name in frame.columns:
+        kind = COLUMN_TYPES.get(name, "string")
+        if kind == "timestamp":
+            frame[name] = to_instant(pd.to_datetime(frame[name]))
+        elif kind == "string":
+            frame[name] = frame[name].astype(object).where(frame[name].notna(), None)
+        fields.append(pa.field(name, arrow_types.get(kind, pa.string())))
+    return pa.Table.from_pandas(frame, schema=pa.schema(fields), preserve_index=False)
+
+
+def write_parquet(frame: pd.DataFrame, directory: Path, partition_by: List[str] = ()) -> None:
+    """Write ``frame`` as one Parquet file per partition value under ``directory``."""
+    import pyarrow.parquet as pq
+
+    if frame.empty:
+        return
+    if not partition_by:
+        pq.write_table(to_arrow(frame), directory / "part-00000.parquet", compression=PARQUET_COMPRESSION)
+        return
+    for values, part in frame.groupby(list(partition_by), sort=True, dropna=False):
+        values = values if isinstance(values, tuple) else (values,)
+        subdir = directory.joinpath(
+            *[f"{name}={'__HIVE_DEFAULT_PARTITION__' if pd.isna(value) else value}"
+              for name, value in zip(partition_by, values)]
+        )
+        subdir.mkdir(parents=True, exist_ok=True)
+        pq.write_table(
+            to_arrow(part.drop(columns=list(partition_by))), subdir / "part-00000.parquet",
+            compression=PARQUET_COMPRESSION,
+        )
+
+
+def write_transactions_sink(frame: pd.DataFrame, batch_id: int, scope: str) -> None:
+    commit_local_batch(
+        output_root("transactions"), batch_id, lambda path: write_parquet(frame, path, PARTITION_BY), scope
+    )
+
+
+def write_csv_export_sink(frame: pd.DataFrame, batch_id: int, scope: str) -> None:
+    commit_local_batch(
+        output_root("transactions_csv"),
+        batch_id,
+        lambda path: frame.to_csv(path / "part-00000.csv", index=False) if not frame.empty else None,
+        scope,
+    )
+
+
+def write_console_sink(frame: pd.DataFrame, batch_id: int, scope: str) -> None:
+    print(f"Batch: {batch_id}")
+    print(frame.head(20).to_string(index=False))
+
+
+def write_rollups_sink(frame: pd.DataFrame, batch_id: int, scope: str) -> None:
+    """Merge the batch into the daily rollup tables, like ``rollups.update_rollups``."""
+    for name, delta in rollup_deltas_pandas(frame).items():
+        if delta.empty:
+            continue
+        table = output_root("rollups") / name
+        sequence = local_batch_sequence(table, batch_id, scope)
+        listings, frames = {}, [delta]
+        for year, month in delta[PARTITION_COLUMNS].drop_duplicates().itertuples(index=False):
+            directory = table / partition_dir(year, month)
+            listings[directory] = [
+                path.name for path in directory.glob("*") if path.is_file() and not path.name.startswith(("_", "."))
+            ]
+            frames.extend(
+                pd.read_parquet(directory / file).assign(transaction_year=year, transaction_month=month)
+                for file in base_files(listings[directory], sequence)
+            )
+        merged = merge_rollup_pandas(frames, name)
+        commit_local_batch(table, batch_id, lambda path: write_parquet(merged, path, PARTITION_COLUMNS), scope)
+        for directory, files in listings.items():
+            for file in stale_files(files, sequence):
+                (directory / file).unlink(missing_ok=True)
+
+
+def write_user_stats(stats: pd.DataFrame, batch_id: int, scope: str) -> None:
+    if stats.empty:
+        return
+    stats = rate_user_stats(stats, resolve_exchange_rate(), load_rate_history()).assign(batch_id=batch_id)
+    commit_local_batch(output_root("user_stats"), batch_id, lambda path: write_parquet(stats, path), scope)
+
+
+class AlertPublisher:
+    """Publish alert-worthy rows to ``ALERTS_TOPIC`` in the format of ``build_alerts``."""
+
+    def __init__(self, topic: str = ALERTS_TOPIC):
+        from kafka import KafkaProducer
+
+        self.topic = topic
+        self.producer = KafkaProducer(bootstrap_servers=KAFKA_BROKER, acks="all", linger_ms=5)
+
+    def publish(self, frame: pd.DataFrame, batch_id: int) -> None:
+        condition = frame["transaction_type"].isin(ALERT_TYPES)
+        if "fraud_predicted" in frame.columns:
+            condition |= frame["fraud_predicted"].fillna(False).astype(bool)
+        alerts = frame[condition]
+        alerted_at_ms = int(time.time() * 1000)
+        processing_ms = to_instant(alerts["processing_timestamp"]).astype("int64") // 10**6
+        for row, sent_ms in zip(alerts.to_dict("records"), processing_ms):
+            fields = {
+                "event_id": row["event_id"],
+                "record_id": row.get("record_id"),
+                "user": row["User"],
+                "card": row["Card"],
+                "transaction_type": row["transaction_type"],
+                "amount_usd": row["Amount_USD"],
+                "merchant_name": row["Merchant Name"],
+                "merchant_city": row["Merchant City"],
+                "transaction_datetime": row["transaction_datetime"].strftime("%Y-%m-%dT%H:%M:%S"),
+                "processing_ts_ms": int(sent_ms),
+                "alerted_at_ms": alerted_at_ms,
+            }
+            if "fraud_score" in row:
+                fields["fraud_score"] = row["fraud_score"]
+            value = {key: value for key, value in fields.items() if value is not None and not pd.isna(value)}
+            self.producer.send(
+                self.topic, key=f"{row['User']}:{row['Card']}".encode(), value=json.dumps(value).encode()
+            )
+        self.producer.flush()
+        if len(alerts):
+            print(f"[Alerts] batch {batch_id}: published {len(alerts)} alerts to {self.topic}")
+
+
+SINK_WRITERS: Dict[str, Callable[[pd.DataFrame, int], None]] = {
+    "transactions": write_transactions_sink,
+    "csv_export": write_csv_export_sink,
+    "console": write_console_sink,
+    "rollups": write_rollups_sink,
+}
+
+
+class LocalPipeline:
+    """The pipeline's per-batch processing and cross-batch state (deduplication, open windows).
+
+    Batches are committed under ``scope`` (see ``commit_batch``), a new one
+    unless the caller resumes an earlier run.
+    """
+
+    def __init__(self, sinks: List[str] = SINKS, scope: Optional[str] = None):
+        unknown = [sink for sink in sinks if sink not in LOCAL_SINKS]
+        if unknown:
+            raise ValueError(f"Unknown sinks {unknown}, expected a subset of {list(LOCAL_SINKS)}")
+        if VELOCITY_FEATURES:
+            print("[Local] Velocity features are not computed by the local engine")
+        self.sinks = list(sinks)
+        self.scope = scope or f"local-{uuid.uuid4().hex}"
+        self.dedup = EventDeduplicator("processing_timestamp", DEDUP_WATERMARK)
+        self.stats = UserStatsAggregator() if "user_stats" in sinks else None
+        self.alerts = AlertPublisher() if "alerts" in sinks else None
+
+    def state(self) -> Dict:
+        return {"dedup": self.dedup.__dict__, "stats": self.stats.__dict__ if self.stats else None}
+
+    def restore(self, state: Dict) -> None:
+        self.dedup.__dict__.update(state["dedup"])
+        if self.stats and state.get("stats"):
+            self.stats.__dict__.update(state["stats"])
+
+    def process(self, typed: pd.DataFrame, batch_id: int) -> Dict:
+        """Run one batch of typed rows (``with_event_id`` output) through every sink."""
+        started = time.perf_counter()
+        enriched = enrich_transactions(typed, datetime.now())
+        deduplicated = self.dedup.apply(enriched)
+        output = None
+        if any(sink in SINK_WRITERS or sink == "alerts" for sink in self.sinks):
+            output = enrich_batch(deduplicated.copy())
+        for sink in self.sinks:
+            if sink in SINK_WRITERS:
+                SINK_WRITERS[sink](output, batch_id, self.scope)
+        if self.alerts is not None:
+            self.alerts.publish(output.join(deduplicated[["record_id", "processing_timestamp"]]), batch_id)
+        if self.stats is not None:
+            write_user_stats(self.stats.update(enriched), batch_id, self.scope)
+        return {
+            "batch_id": batch_id,
+            "input_rows": len(typed),
+            "output_rows": 0 if output is None else len(output),
+            "late_rows": self.dedup.late + (self.stats.dedup.late if self.stats else 0),
+            "seconds": time.perf_counter() - started,
+            "committed_at": time.time(),
+        }
+
+    def finish(self, batch_id: int) -> None:
+        """Emit the windows still open at the end of a bounded source, as batch ``batch_id``."""
+        if self.stats is not None:
+            write_user_stats(self.stats.flush(), batch_id, self.scope)
+
+
+def _log_batch(stats: Dict) -> None:
+    rate = stats["input_rows"] / stats["seconds"] if stats["seconds"] else 0
+    print(
+        f"[Local] batch {stats['batch_id']}: {stats['input_rows']:,} rows in, {stats['output_rows']:,} written "
+        f"in {stats['seconds']:.2f}s ({rate:,.0f} rows/s)"
+    )
+    if stats.get("late_rows"):
+        print(f"[Local] {stats['late_rows']:,} rows dropped so far as later than the watermark")
+
+
+def read_csv_batches(path: Path, batch_rows: int = LOCAL_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """Read transaction CSVs in chunks of ``batch_rows`` typed rows with their ``event_id``."""
+    path = Path(path)
+    files = sorted(path.glob("*.csv")) if path.is_dir() else [path]
+    for file in files:
+        chunks = pd.read_csv(
+            file, dtype=str, keep_default_na=False, na_values=[""], chunksize=batch_rows,
+            usecols=lambda name: name in CSV_COLUMNS,
+        )
+        for chunk in chunks:
+            chunk = chunk.reindex(columns=CSV_COLUMNS)
+            chunk["processing_timestamp"] = datetime.now().isoformat()
+            chunk["record_id"] = None
+            chunk["_event_source"] = None
+            row_hash = pd.util.hash_pandas_object(chunk[CSV_COLUMNS], index=False).astype(str)
+            chunk["_event_position"] = file.name + ":" + row_hash
+            yield with_event_id(with_typed_fields(chunk)).reset_index(drop=True)
+
+
+def run_csv(path: Path, sinks: List[str] = SINKS, batch_rows: int = LOCAL_BATCH_ROWS,
+            on_batch: Callable[[Dict], None] = _log_batch) -> List[Dict]:
+    """Process CSV files as consecutive micro-batches, then emit the open windows."""
+    pipeline = LocalPipeline(sinks)
+    results = []
+    batch_id = -1
+    for batch_id, frame in enumerate(read_csv_batches(path, batch_rows)):
+        results.append(pipeline.process(frame, batch_id))
+        on_batch(results[-1])
+    pipeline.finish(batch_id + 1)
+    return results
+
+
+def decode_kafka_records(records) -> pd.DataFrame:
+    """Decode polled Kafka records in ``WIRE_FORMAT`` into typed rows with their ``event_id``."""
+    rows = []
+    for record in records:
+        headers = dict(record.headers or [])
+        source = headers.get("source_file")
+        position = f"{record.topic}:{record.partition}:{record.offset}"
+        if WIRE_FORMAT == WIRE_FORMAT_AVRO:
+            try:
+                (user, card, event_ms, cents, use_chip, merchant, city, state, zip_code, mcc, errors, is_fraud,
+                 processing_ms, record_id) = decode_typed(record.value)
+            except ValueError:
+                continue
+            rows.append(
+                {
+                    "User": str(user), "Card": str(card), "Amount": f"${cents / 100:.2f}",
+                    "Use Chip": USE_CHIP_LABELS[USE_CHIP_SYMBOLS[use_chip]], "Merchant Name": str(merchant),
+                    "Merchant City": city, "Merchant State": state,
+                    "Zip": None if zip_code is None else str(zip_code), "MCC": str(mcc), "Errors?": errors,
+                    "Is Fraud?": "Yes" if is_fraud else "No", "record_id": str(record_id),
+                    "Amount_USD": cents / 100, "_event_ms": event_ms, "_processing_ms": processing_ms,
+                    "_event_source": None if source is None else source.decode("utf-8"), "_event_position": position,
+                }
+            )
+        else:
+            try:
+                value = json.loads(record.value)
+            except (TypeError, ValueError):
+                value = {}
+            row = {name: None if value.get(name) is None else str(value[name]) for name in RAW_COLUMNS}
+            row["_event_source"] = None if source is None else source.decode("utf-8")
+            row["_event_position"] = position
+            rows.append(row)
+    frame = pd.DataFrame(rows)
+    if frame.empty:
+        return frame
+    if WIRE_FORMAT == WIRE_FORMAT_AVRO:
+        # Event times travel as wall-clock UTC, processing times as instants
+        frame["transaction_datetime"] = pd.to_datetime(frame.pop("_event_ms"), unit="ms")
+        frame["processing_timestamp"] = (
+            pd.to_datetime(frame.pop("_processing_ms"), unit="ms", utc=True).dt.tz_convert(LOCAL_TZ)
+            .dt.tz_localize(None)
+        )
+        return with_event_id(frame)
+    return with_event_id(with_typed_fields(frame))
+
+
+class KafkaBatchSource:
+    """Poll the transactions topic in micro-batches, with offsets and engine state in a local checkpoint."""
+
+    def __init__(self, checkpoint: Path, topic: str = KAFKA_TOPIC, max_records: int = LOCAL_BATCH_ROWS):
+        from kafka import KafkaConsumer, TopicPartition
+
+        self.checkpoint = Path(checkpoint) / "state.pkl"
+        self.max_records = max_records
+        self.consumer = KafkaConsumer(bootstrap_servers=KAFKA_BROKER, enable_auto_commit=False, group_id=None)
+        partitions = sorted(self.consumer.partitions_for_topic(topic) or [])
+        if not partitions:
+            raise RuntimeError(f"Topic {topic} not found on {KAFKA_BROKER}")
+        self.partitions = [TopicPartition(topic, partition) for partition in partitions]
+        self.consumer.assign(self.partitions)
+        self.saved = {"batch_id": 0, "offsets": {}, "pipeline": None}
+        if self.checkpoint.exists():
+            with self.checkpoint.open("rb") as file:
+                self.saved = pickle.load(file)
+        if "scope" not in self.saved:
+            # The commit scope of this checkpoint's batches, saved before the first batch is written
+            self.saved["scope"] = f"local-{uuid.uuid4().hex}"
+            self._save()
+        for partition in self.partitions:
+            offset = self.saved["offsets"].get(partition.partition)
+            if offset is None:
+                self.consumer.seek_to_beginning(partition)
+            else:
+                self.consumer.seek(partition, offset)
+
+    def poll(self, timeout_seconds: float) -> list:
+        batches = self.consumer.poll(timeout_ms=int(timeout_seconds * 1000), max_records=self.max_records)
+        return [record for records in batches.values() for record in records]
+
+    def commit(self, batch_id: int, pipeline_state: Dict) -> None:
+        """Record the consumed offsets and the engine state after batch ``batch_id`` was written."""
+        self.saved = {
+            "batch_id": batch_id + 1,
+            "offsets": {partition.partition: self.consumer.position(partition) for partition in self.partitions},
+            "pipeline": pipeline_state,
+            "scope": self.saved["scope"],
+        }
+        self._save()
+
+    def _save(self) -> None:
+        self.checkpoint.parent.mkdir(parents=True, exist_ok=True)
+        staged = self.checkpoint.with_suffix(".tmp")
+        with staged.open("wb") as file:
+            pickle.dump(self.saved, file)
+        os.replace(staged, self.checkpoint)
+
+
+def run_kafka(sinks: List[str] = SINKS, trigger_seconds: float = _seconds(TRIGGER_INTERVAL)) -> None:
+    """Process the topic every ``trigger_seconds`` until interrupted."""
+    source = KafkaBatchSource(checkpoint_root("local_engine"))
+    pipeline = LocalPipeline(sinks, source.saved["scope"])
+    if source.saved["pipeline"]:
+        pipeline.restore(source.saved["pipeline"])
+    batch_id = source.saved["batch_id"]
+    print(f"[Local] Consuming {KAFKA_TOPIC} from {KAFKA_BROKER} from batch {batch_id} (sinks: {', '.join(sinks)})")
+    while True:
+        started = time.monotonic()
+        records = source.poll(trigger_seconds)
+        frame = decode_kafka_records(records)
+        if records:
+            if not frame.empty:
+                _log_batch(pipeline.process(frame, batch_id))
+            source.commit(batch_id, pipeline.state())
+            batch_id += 1
+        time.sleep(max(0.0, trigger_seconds - (time.monotonic() - started)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the transaction pipeline without Spark.")
+    parser.add_argument(
+        "--sinks",
+        default=",".join(sink for sink in SINKS if sink in LOCAL_SINKS),
+        help=f"Comma-separated sinks, from {list(LOCAL_SINKS)}.",
+    )
+    subparsers = parser.add_subparsers(dest="source", required=True)
+    csv_parser = subparsers.add_parser("csv", help="Process transaction CSVs in micro-batches.")
+    csv_parser.add_argument("path", type=Path, help="CSV file or directory of CSV files.")
+    csv_parser.add_argument("--batch-rows", type=int, default=LOCAL_BATCH_ROWS)
+    subparsers.add_parser("kafka", help="Consume the transactions topic.")
+    args = parser.parse_args(argv)
+
+    sinks = [sink.strip() for sink in args.sinks.split(",") if sink.strip()]
+    if args.source == "csv":
+        started = time.perf_counter()
+        results = run_csv(args.path, sinks, args.batch_rows)
+        rows = sum(result["input_rows"] for result in results)
+        elapsed = time.perf_counter() - started
+        print(f"[Local] Processed {rows:,} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)")
+    else:
+        try:
+            run_kafka(sinks)
+        except KeyboardInterrupt:
+            print("\nLocal engine stopped by user.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Settings of the transaction pipeline shared by the Spark consumer and the local engine.
+
+Everything here comes from the environment or is a plain constant, so it can
+be imported without Spark.
+"""
+import os
+from pathlib import Path
+
+from .wire_format import WIRE_FORMAT_JSON
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+KAFKA_BROKER = os.getenv("KAFKA_BROKER", "localhost:9092")
+KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "credit_card_transactions")
+WIRE_FORMAT = os.getenv("WIRE_FORMAT", WIRE_FORMAT_JSON)
+CHECKPOINT_DIR = BASE_DIR / "checkpoint"
+OUTPUT_DIR = BASE_DIR / "output"
+
+# Optional HDFS URIs (set via environment when using Hadoop)
+OUTPUT_URI = os.getenv("OUTPUT_URI")
+CHECKPOINT_URI = os.getenv("CHECKPOINT_URI")
+
+# Comma-separated sinks fed from the single streaming query (see SINK_WRITERS);
+# "user_stats" and "alerts" run as their own queries
+SINKS = [
+    sink.strip()
+    for sink in os.getenv("SINKS", "transactions,rollups,console,user_stats,alerts").split(",")
+    if sink.strip()
+]
+STREAM_SINKS = ("user_stats", "alerts")
+TRIGGER_INTERVAL = os.getenv("TRIGGER_INTERVAL", "30 seconds")
+
+# Parquet transactions sink: partition columns (e.g. "transaction_year,transaction_month"),
+# codec (snappy/zstd/...) and file sizing (0 = no per-file record limit)
+PARTITION_BY = [name.strip() for name in os.getenv("PARTITION_BY", "processing_date").split(",") if name.strip()]
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+MAX_RECORDS_PER_FILE = int(os.getenv("MAX_RECORDS_PER_FILE", "1000000"))
+
+# Event-time user statistics: window length, allowed lateness and output mode (append/update).
+# Rows more than STATS_WATERMARK behind the newest event time seen are left out of the statistics;
+# the consumer counts them (streaming_state_rows_dropped_by_watermark_total) and prints them per batch.
+# Files ordered per card, like the sample CSV and synthetic_data's output, jump back in event time at
+# every card, so streamed as they are most of their rows are dropped: replay them in event-time order,
+# raise STATS_WATERMARK (the state grows with it) or build the statistics with the backfill, which
+# keeps every window.
+STATS_WINDOW = os.getenv("STATS_WINDOW", "1 hour")
+STATS_WATERMARK = os.getenv("STATS_WATERMARK", "1 day")
+STATS_OUTPUT_MODE = os.getenv("STATS_OUTPUT_MODE", "append")
+STATS_TRIGGER_INTERVAL = os.getenv("STATS_TRIGGER_INTERVAL", "1 minute")
+
+# Low-latency alerts: topic, trigger, alerted transaction types and end-to-end latency target
+ALERTS_TOPIC = os.getenv("ALERTS_TOPIC", "credit_card_alerts")
+ALERT_TRIGGER_INTERVAL = os.getenv("ALERT_TRIGGER_INTERVAL", "500 milliseconds")
+ALERT_TYPES = [name.strip() for name in os.getenv("ALERT_TYPES", "FRAUD,HIGH_VALUE").split(",") if name.strip()]
+ALERT_LATENCY_TARGET_MS = float(os.getenv("ALERT_LATENCY_TARGET_MS", "1000"))
+
+# Per-(User, Card) velocity features computed by a stateful operator in the pipeline query.
+# Adding the operator changes the query's state layout, so enable it on a fresh pipeline checkpoint.
+VELOCITY_FEATURES = os.getenv("VELOCITY_FEATURES", "false").lower() in ("1", "true", "yes")
+
+# Vectorised fraud scoring (skipped when the model file is missing) and rows per Arrow batch
+FRAUD_SCORING = os.getenv("FRAUD_SCORING", "true").lower() in ("1", "true", "yes")
+ARROW_BATCH_SIZE = int(os.getenv("ARROW_BATCH_SIZE", "10000"))
+
+# Duplicate events (producer retries, replays) are dropped by event_id when seen again within
+# DEDUP_WATERMARK of processing time; events from partitions lagging further behind are dropped as late.
+# Late events are dropped before every sink, the transactions archive included: the consumer counts
+# them (streaming_state_rows_dropped_by_watermark_total) and prints them per batch. Raise the setting
+# when partitions can lag that far behind (a backlog produced before the consumer started, a stalled
+# partition); the deduplication state grows with it.
+DEDUP_WATERMARK = os.getenv("DEDUP_WATERMARK", "1 hour")
+
+# Read parallelism: Spark splits the topic's offset ranges into at least KAFKA_MIN_PARTITIONS tasks
+# (0 = one task per topic partition) and caps each micro-batch at MAX_OFFSETS_PER_TRIGGER offsets
+# (0 = everything available). SHUFFLE_PARTITIONS = 0 sizes shuffles from the available cores.
+KAFKA_MIN_PARTITIONS = int(os.getenv("KAFKA_MIN_PARTITIONS", "0"))
+MAX_OFFSETS_PER_TRIGGER = int(os.getenv("MAX_OFFSETS_PER_TRIGGER", "0"))
+SHUFFLE_PARTITIONS = int(os.getenv("SHUFFLE_PARTITIONS", "0"))
+
+# Per-batch query metrics: Prometheus endpoint on METRICS_PORT (0 = off) and one JSON line per
+# progress report in METRICS_FILE (empty = off)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_FILE = os.getenv("METRICS_FILE", str(BASE_DIR / "metrics" / "consumer.jsonl"))
+
+# Connector jars: when SPARK_JARS_DIR holds the jars of every connector package (written by
+# ``python -m src.spark_streaming_consumer --fetch-jars DIR``) they are put on the classpath directly;
+# otherwise Spark resolves the packages through Ivy, in SPARK_IVY_DIR when set (a pre-filled cache)
+SPARK_JARS_DIR = os.getenv("SPARK_JARS_DIR", str(BASE_DIR / "jars"))
+SPARK_IVY_DIR = os.getenv("SPARK_IVY_DIR", "")
+
+DEFAULT_EXCHANGE_RATE = 24000.0
+# "historical" joins each row to the rate on its transaction date; "live" uses today's rate
+EXCHANGE_RATE_MODE = os.getenv("EXCHANGE_RATE_MODE", "historical")
+
+# Optional columns appended to the sink schema when the stages producing them are enabled
+FRAUD_COLUMNS = ["fraud_score", "fraud_predicted"]
+
+OUTPUT_COLUMNS = [
+    "event_id",
+    "User",
+    "Card",
+    "transaction_date",
+    "transaction_time",
+    "transaction_datetime",
+    "transaction_year",
+    "transaction_month",
+    "transaction_day",
+    "transaction_hour",
+    "day_of_week",
+    "Amount",
+    "Amount_USD",
+    "Amount_VND",
+    "exchange_rate",
+    "Use Chip",
+    "Merchant Name",
+    "Merchant City",
+    "Merchant State",
+    "Zip",
+    "MCC",
+    "Is Fraud?",
+    "transaction_type",
+    "processed_at",
+    "processing_date",
+]
@@ -0,0 +1,192 @@
+"""Shared exchange-rate cache with background refresh and disk snapshots."""
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RATE_SNAPSHOT_PATH = Path(os.getenv("RATE_SNAPSHOT_PATH", str(BASE_DIR / "checkpoint" / "exchange_rates.json")))
+RATE_CACHE_TTL = int(os.getenv("RATE_CACHE_TTL", "3600"))
+RATE_REFRESH_INTERVAL = int(os.getenv("RATE_REFRESH_INTERVAL", "900"))
+RATE_RETRY_INTERVAL = int(os.getenv("RATE_RETRY_INTERVAL", "60"))
+
+
+def _default_fetcher() -> Optional[Dict]:
+    from .exchange_rate_scraper import ExchangeRateScraper
+    from .rate_history import RateHistory
+
+    return ExchangeRateScraper(history=RateHistory()).get_exchange_rate()
+
+
+class ExchangeRateCache:
+    """Keep the latest exchange rates for all currencies fresh in the background.
+
+    Readers always get the last good value immediately and never touch the
+    network: a daemon thread calls ``fetcher`` every ``refresh_interval``
+    seconds (or ``retry_interval`` after a failure) and swaps in the new rates.
+    Values older than ``ttl`` are reported as stale but still served, so an
+    outage of the rate source degrades to slightly old rates instead of
+    blocking the pipeline. Each successful refresh is written to
+    ``snapshot_path`` and loaded on start-up, so a cold start needs no network
+    round-trip.
+    """
+
+    def __init__(
+        self,
+        fetcher: Optional[Callable[[], Optional[Dict]]] = None,
+        ttl: float = RATE_CACHE_TTL,
+        refresh_interval: float = RATE_REFRESH_INTERVAL,
+        retry_interval: float = RATE_RETRY_INTERVAL,
+        snapshot_path: Optional[Path] = RATE_SNAPSHOT_PATH,
+    ):
+        self.fetcher = fetcher or _default_fetcher
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+
+        self._lock = threading.Lock()
+        self._rates: Dict = {}
+        self._fetched_at: Optional[float] = None
+        self._last_attempt = 0.0
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.load_snapshot()
+
+    # ------------------------------------------------------------------ readers
+    def get(self, currency: str = "USD") -> Optional[Dict]:
+        """Return the cached buy/transfer/sell dict for ``currency`` (possibly stale)."""
+        with self._lock:
+            rate = self._rates.get(currency)
+        if self.is_stale() and time.time() - self._last_attempt > self.retry_interval:
+            # Stale-while-revalidate: serve the old value, nudge the refresher
+            self._wakeup.set()
+        return rate
+
+    def get_rate(self, currency: str = "USD", kind: str = "transfer", default: Optional[float] = None):
+        """Return a single rate value, or ``default`` when nothing is cached yet."""
+        rate = self.get(currency)
+        if rate and rate.get(kind):
+            return float(rate[kind])
+        return default
+
+    def currencies(self) -> Dict:
+        with self._lock:
+            return dict(self._rates)
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the cached rates were fetched, or None when empty."""
+        fetched_at = self._fetched_at
+        return None if fetched_at is None else time.time() - fetched_at
+
+    def is_stale(self) -> bool:
+        age = self.age
+        return age is None or age > self.ttl
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until at least one rate set is cached (from disk or network)."""
+        return self._ready.wait(timeout)
+
+    # ---------------------------------------------------------------- refreshing
+    def refresh(self) -> bool:
+        """Fetch rates once and update the cache; return whether it succeeded."""
+        self._last_attempt = time.time()
+        try:
+            rates = self.fetcher()
+        except Exception as exc:  # pragma: no cover - external dependency
+            print(f"[RateCache] Refresh failed: {exc}")
+            return False
+
+        currencies = (rates or {}).get("currencies") or {}
+        if not currencies:
+            print("[RateCache] Refresh returned no rates, keeping cached values")
+            return False
+
+        fetched_at = time.time()
+        with self._lock:
+            self._rates = currencies
+            self._fetched_at = fetched_at
+        self._ready.set()
+        self.save_snapshot()
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            ok = self.refresh()
+            interval = self.refresh_interval if ok else self.retry_interval
+            # Either the interval elapses, a stale read asks for a refresh, or stop() is called
+            self._wakeup.wait(interval)
+
+    def start(self) -> "ExchangeRateCache":
+        """Start the background refresher thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="exchange-rate-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ----------------------------------------------------------------- snapshots
+    def save_snapshot(self) -> None:
+        """Atomically write the cached rates to ``snapshot_path``."""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            payload = {"fetched_at": self._fetched_at, "currencies": self._rates}
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(payload, file)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as exc:
+            print(f"[RateCache] Could not write snapshot {self.snapshot_path}: {exc}")
+
+    def load_snapshot(self) -> bool:
+        """Load rates from ``snapshot_path`` if present; return whether anything was loaded."""
+        if not self.snapshot_path or not self.snapshot_path.exists():
+            return False
+        try:
+            with self.snapshot_path.open("r", encoding="utf-8") as file:
+                payload = json.load(file)
+        except (OSError, ValueError) as exc:
+            print(f"[RateCache] Ignoring unreadable snapshot {self.snapshot_path}: {exc}")
+            return False
+
+        currencies = payload.get("currencies") or {}
+        if not currencies:
+            return False
+        with self._lock:
+            self._rates = currencies
+            self._fetched_at = payload.get("fetched_at")
+        self._ready.set()
+        return True
+
+
+_shared_cache: Optional[ExchangeRateCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> ExchangeRateCache:
+    """Return the process-wide cache, starting its refresher on first use."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ExchangeRateCache().start()
+        return _shared_cache
@@ -0,0 +1,165 @@
+"""Dated exchange-rate history stored as a small sorted Parquet table.
+
+The live scraper only knows today's rate, but transactions in the sample data
+go back to 2002. ``RateHistory`` keeps one row per (effective_date, currency)
+sorted by date, filled in by ``ExchangeRateScraper`` on every successful fetch
+and seeded in bulk from CSV exports for older periods. The consumer expands it
+into a dense per-day table and broadcast-joins transactions on their event
+date, so each lookup is a hash probe instead of a per-row scrape or search.
+"""
+import argparse
+import os
+import tempfile
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RATE_HISTORY_PATH = Path(os.getenv("RATE_HISTORY_PATH", str(BASE_DIR / "data" / "exchange_rate_history.parquet")))
+# First day covered by the dense daily table; earlier dates use the earliest known rate
+RATE_HISTORY_START = os.getenv("RATE_HISTORY_START", "2000-01-01")
+
+COLUMNS = ["effective_date", "currency", "buy", "transfer", "sell"]
+_DTYPES = {
+    "effective_date": "object",
+    "currency": "object",
+    "buy": "float64",
+    "transfer": "float64",
+    "sell": "float64",
+}
+
+
+class RateHistory:
+    """Read and update the dated rate history file."""
+
+    def __init__(self, path: Path = RATE_HISTORY_PATH):
+        self.path = Path(path)
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def mtime(self) -> Optional[float]:
+        return self.path.stat().st_mtime if self.path.exists() else None
+
+    def load(self) -> pd.DataFrame:
+        """Return the full history sorted by (effective_date, currency)."""
+        if not self.path.exists():
+            return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in _DTYPES.items()})
+        frame = pd.read_parquet(self.path, columns=COLUMNS)
+        frame["effective_date"] = pd.to_datetime(frame["effective_date"]).dt.date
+        return frame
+
+    def _write(self, frame: pd.DataFrame) -> None:
+        frame = (
+            frame.drop_duplicates(["effective_date", "currency"], keep="last")
+            .sort_values(["effective_date", "currency"])
+            .astype({"buy": "float64", "transfer": "float64", "sell": "float64"})
+            .reset_index(drop=True)
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        os.close(fd)
+        frame[COLUMNS].to_parquet(tmp_path, index=False, compression="zstd")
+        os.replace(tmp_path, self.path)
+
+    def record(self, rates: Dict, effective_date: Optional[date] = None) -> int:
+        """Upsert a scraper result (``{"currencies": {...}}``) for one date.
+
+        Returns the number of rows written; nothing is rewritten when the rates
+        for that date are unchanged.
+        """
+        currencies = (rates or {}).get("currencies") or {}
+        if not currencies:
+            return 0
+        effective_date = effective_date or date.today()
+        new_rows = pd.DataFrame(
+            [
+                {
+                    "effective_date": effective_date,
+                    "currency": code,
+                    "buy": float(values.get("buy", 0.0)),
+                    "transfer": float(values.get("transfer", 0.0)),
+                    "sell": float(values.get("sell", 0.0)),
+                }
+                for code, values in currencies.items()
+            ]
+        )
+
+        current = self.load()
+        same_day = current[current["effective_date"] == effective_date]
+        if not same_day.empty:
+            merged = same_day.merge(new_rows, on=["effective_date", "currency"], suffixes=("", "_new"))
+            if len(merged) == len(new_rows) and all(
+                (merged[kind] == merged[f"{kind}_new"]).all() for kind in ("buy", "transfer", "sell")
+            ):
+                return 0
+
+        self._write(pd.concat([current, new_rows], ignore_index=True))
+        return len(new_rows)
+
+    def import_csv(self, csv_path: Path) -> int:
+        """Merge a CSV with ``effective_date,currency,buy,transfer,sell`` columns."""
+        imported = pd.read_csv(csv_path)
+        missing = set(COLUMNS) - set(imported.columns)
+        if missing:
+            raise ValueError(f"{csv_path} is missing columns: {sorted(missing)}")
+        imported["effective_date"] = pd.to_datetime(imported["effective_date"]).dt.date
+        self._write(pd.concat([self.load(), imported[COLUMNS]], ignore_index=True))
+        return len(imported)
+
+    def daily_rates(
+        self,
+        currency: str = "USD",
+        kind: str = "transfer",
+        start: str = RATE_HISTORY_START,
+        end: Optional[date] = None,
+    ) -> pd.DataFrame:
+        """Expand the history into one row per day with the rate in effect that day.
+
+        Each day up to ``end`` (default today) carries the most recent rate on or
+        before it (as-of semantics); days before the first known rate use the
+        earliest one. Returns columns
+        ``rate_date`` and ``history_rate``.
+        """
+        frame = self.load()
+        frame = frame[(frame["currency"] == currency) & (frame[kind] > 0)]
+        if frame.empty:
+            return pd.DataFrame({"rate_date": pd.Series(dtype="object"), "history_rate": pd.Series(dtype="float64")})
+
+        changes = frame.set_index(pd.to_datetime(frame["effective_date"]))[kind].sort_index()
+        end = pd.Timestamp(end or max(pd.Timestamp(date.today()), changes.index.max()))
+        days = pd.date_range(min(pd.Timestamp(start), changes.index.min()), end, freq="D")
+        daily = changes.reindex(changes.index.union(days)).ffill().bfill().reindex(days)
+        return pd.DataFrame({"rate_date": days.date, "history_rate": daily.to_numpy()})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the dated exchange-rate history.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("update", help="Fetch today's rates from VietcomBank and record them.")
+    import_parser = subparsers.add_parser("import", help="Merge historical rates from a CSV file.")
+    import_parser.add_argument("csv_path", type=Path)
+    show_parser = subparsers.add_parser("show", help="Print the stored history.")
+    show_parser.add_argument("--currency", default="USD")
+    parser.add_argument("--path", type=Path, default=RATE_HISTORY_PATH)
+    args = parser.parse_args(argv)
+
+    history = RateHistory(args.path)
+    if args.command == "update":
+        from .exchange_rate_scraper import ExchangeRateScraper
+
+        rates = ExchangeRateScraper(history=history).get_exchange_rate()
+        print("Recorded today's rates." if rates else "No rates fetched.")
+    elif args.command == "import":
+        print(f"Imported {history.import_csv(args.csv_path)} rows into {history.path}")
+    else:
+        frame = history.load()
+        print(frame[frame["currency"] == args.currency].to_string(index=False))
+        print(f"\n{len(frame)} rows, last updated {datetime.fromtimestamp(history.mtime() or 0):%Y-%m-%d %H:%M}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""Daily rollup tables maintained by the stream for dashboard queries.
+
+The transactions table is unpartitioned by event time, so a dashboard that
+totals it per user, day, merchant state, MCC or ``transaction_type`` rescans
+every raw row on each refresh. The ``rollups`` sink keeps one small Parquet
+table per entry of ``ROLLUPS`` instead, under ``<output>/rollups/<name>``:
+one row per ``event_date`` (the transaction's calendar day) and dimension
+value with
+
+* ``transaction_count`` and ``fraud_count`` (rows labelled ``Is Fraud?``)
+* ``amount_usd`` and ``amount_vnd``, the summed amounts
+
+Tables are partitioned by ``transaction_year`` and ``transaction_month``.
+Each micro-batch aggregates its rows and merges them into every month it
+touches: the month's current rows and the batch's partial sums are summed
+again per key and committed as a new file generation with
+``commit_batch`` (files prefixed ``b<sequence>-``). Generations follow the
+commit sequence, which keeps growing across restarts, fresh checkpoints
+and backfills, so every batch merges from the newest generation. Readers
+take only the newest generation of each month. The generation a batch
+merged from is kept, so a replayed batch (which keeps its sequence)
+re-merges from it and counts each row once; older generations are deleted.
+Rollups only cover batches written while the sink was enabled; a
+``backfill --sinks rollups`` adds the backfilled rows to them, so backfill
+only rows the rollups do not hold yet.
+
+``query_totals`` answers grouped totals from the smallest table covering the
+requested columns and filters, and reads the raw transactions only when no
+table does (e.g. per user and MCC). ``python -m src.rollups query`` runs it
+from the command line.
+"""
+import argparse
+import os
+import re
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from . import fs_utils
+from .batch_commit import batch_sequence, commit_batch
+from .pipeline_settings import PARQUET_COMPRESSION
+
+
+# Dimension columns of each rollup besides ``event_date``, smallest table first
+ROLLUPS = {
+    "daily_transaction_type": ["transaction_type"],
+    "daily_merchant_state": ["Merchant State"],
+    "daily_mcc": ["MCC"],
+    "daily_user": ["User"],
+}
+ROLLUP_TABLES = [
+    name.strip() for name in os.getenv("ROLLUP_TABLES", ",".join(ROLLUPS)).split(",") if name.strip()
+]
+MEASURES = ["transaction_count", "amount_usd", "amount_vnd", "fraud_count"]
+PARTITION_COLUMNS = ["transaction_year", "transaction_month"]
+# Grouping columns every table can answer
+TIME_COLUMNS = ["event_date"] + PARTITION_COLUMNS
+
+_GENERATION = re.compile(r"^b(\d+)-")
+
+
+def rollup_keys(name: str) -> List[str]:
+    return ["event_date"] + ROLLUPS[name]
+
+
+def partition_dir(year: int, month: int) -> str:
+    return f"transaction_year={year}/transaction_month={month}"
+
+
+def _generations(names: Iterable[str]) -> Dict[int, List[str]]:
+    generations = defaultdict(list)
+    for name in names:
+        match = _GENERATION.match(name)
+        generations[int(match.group(1)) if match else -1].append(name)
+    return generations
+
+
+def current_files(names: Iterable[str]) -> List[str]:
+    """Return the files of the newest generation among a partition's data files."""
+    generations = _generations(names)
+    return sorted(generations[max(generations)]) if generations else []
+
+
+def base_files(names: Iterable[str], sequence: int) -> List[str]:
+    """Return the files the commit ``sequence`` merges into: the newest generation before it."""
+    generations = _generations(names)
+    earlier = [generation for generation in generations if generation < sequence]
+    return sorted(generations[max(earlier)]) if earlier else []
+
+
+def stale_files(names: Iterable[str], sequence: int) -> List[str]:
+    """Return the files older than the base of the commit ``sequence``, which no replay or reader needs."""
+    generations = _generations(names)
+    earlier = [generation for generation in generations if generation < sequence]
+    if not earlier:
+        return []
+    base = max(earlier)
+    return sorted(name for generation, files in generations.items() if generation < base for name in files)
+
+
+def choose_rollup(columns: Iterable[str], tables: Sequence[str] = ROLLUP_TABLES) -> Optional[str]:
+    """Return the smallest table whose keys cover ``columns`` (grouping and filter columns), or None."""
+    needed = set(columns) - set(TIME_COLUMNS)
+    for name in ROLLUPS:
+        if name in tables and needed <= set(ROLLUPS[name]):
+            return name
+    return None
+
+
+# Spark
+
+
+def _spark_measures():
+    from pyspark.sql.functions import col, count, sum, when
+
+    return [
+        count("*").alias("transaction_count"),
+        sum("Amount_USD").alias("amount_usd"),
+        sum("Amount_VND").alias("amount_vnd"),
+        sum(when(col("Is Fraud?") == "Yes", 1).otherwise(0)).alias("fraud_count"),
+    ]
+
+
+def _with_event_date(df):
+    from pyspark.sql.functions import col, to_date
+
+    return df.withColumn("event_date", to_date(col("transaction_datetime"))).filter(col("event_date").isNotNull())
+
+
+def update_rollups(batch_df, batch_id: int, root: str, tables: Sequence[str] = ROLLUP_TABLES) -> None:
+    """Merge a sink-schema batch into the rollup ``tables`` under ``root``."""
+    from pyspark.sql.functions import sum
+
+    spark = batch_df.sparkSession
+    rows = _with_event_date(batch_df)
+    months = [tuple(row) for row in rows.select(*PARTITION_COLUMNS).distinct().collect()]
+    if not months:
+        return
+    for name in tables:
+        table = f"{root}/{name}"
+        sequence = batch_sequence(spark, table, batch_id)
+        keys = rollup_keys(name) + PARTITION_COLUMNS
+        listings = {
+            month: [file for file, _ in fs_utils.list_data_files(spark, f"{table}/{partition_dir(*month)}")]
+            for month in months
+        }
+        merged = rows.groupBy(*keys).agg(*_spark_measures())
+        previous = [
+            f"{table}/{partition_dir(*month)}/{file}"
+            for month, files in listings.items()
+            for file in base_files(files, sequence)
+        ]
+        if previous:
+            current = spark.read.option("basePath", table).parquet(*previous)
+            merged = (
+                merged.unionByName(current.select(*keys, *MEASURES))
+                .groupBy(*keys)
+                .agg(*[sum(measure).alias(measure) for measure in MEASURES])
+            )
+        writer = (
+            merged.repartition(*PARTITION_COLUMNS)
+            .write.option("compression", PARQUET_COMPRESSION)
+            .partitionBy(*PARTITION_COLUMNS)
+        )
+        commit_batch(spark, table, batch_id, writer.parquet)
+        for month, files in listings.items():
+            for file in stale_files(files, sequence):
+                fs_utils.delete(spark, f"{table}/{partition_dir(*month)}/{file}", recursive=False)
+
+
+def _list_months(spark, table: str) -> Dict[str, List[str]]:
+    """Return the data files of each month directory of ``table``."""
+    months = defaultdict(list)
+    for path, _ in fs_utils.list_data_files_recursive(spark, table):
+        directory, _, file = path.rpartition("/")
+        months[directory].append(file)
+    return months
+
+
+def _month_of(directory: str) -> Tuple[int, int]:
+    year, month = (int(part.partition("=")[2]) for part in directory.split("/"))
+    return year, month
+
+
+def read_rollup(spark, name: str, root: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None):
+    """Read the current generation of rollup ``name``, or None if it has no data yet.
+
+    ``start`` and ``end`` (ISO dates) skip the months outside them; rows are not filtered.
+    """
+    from .spark_streaming_consumer import output_path
+
+    table = f"{root or output_path('rollups')}/{name}"
+    first = (date.fromisoformat(start).year, date.fromisoformat(start).month) if start else (0, 0)
+    last = (date.fromisoformat(end).year, date.fromisoformat(end).month) if end else (9999, 12)
+    files = [
+        f"{table}/{directory}/{file}"
+        for directory, names in _list_months(spark, table).items()
+        if first <= _month_of(directory) <= last
+        for file in current_files(names)
+    ]
+    return spark.read.option("basePath", table).parquet(*files) if files else None
+
+
+def _totals(df, by: Sequence[str], measures):
+    from pyspark.sql.functions import col
+
+    grouped = df.groupBy(*by).agg(*measures) if by else df.agg(*measures)
+    return (
+        grouped.withColumn("avg_amount_usd", col("amount_usd") / col("transaction_count"))
+        .withColumn("fraud_rate", col("fraud_count") / col("transaction_count"))
+        .orderBy(*by)
+    )
+
+
+def query_totals(
+    spark,
+    by: Sequence[str] = ("event_date",),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    where: Optional[Dict[str, str]] = None,
+    root: Optional[str] = None,
+    raw_path: Optional[str] = None,
+    use_rollups: bool = True,
+) -> Tuple[object, str]:
+    """Return grouped totals and the name of the table they were computed from.
+
+    ``by`` and the ``where`` equality filters may use ``event_date``,
+    ``transaction_year``, ``transaction_month`` and the dimension columns;
+    ``start``/``end`` bound ``event_date`` (ISO dates, inclusive). The result
+    has the ``MEASURES`` plus ``avg_amount_usd`` and ``fraud_rate`` per group.
+    When no rollup covers the columns, has data, or ``use_rollups`` is off,
+    the raw transactions at ``raw_path`` (default: the transactions sink) are
+    aggregated instead and the source is ``"transactions"``.
+    """
+    from pyspark.sql.functions import col, lit, sum
+
+    from .spark_streaming_consumer import output_path
+
+    where = dict(where or {})
+    name = choose_rollup(list(by) + list(where)) if use_rollups else None
+    df = read_rollup(spark, name, root, start, end) if name else None
+    if df is not None:
+        source, measures = name, [sum(measure).alias(measure) for measure in MEASURES]
+    else:
+        source, measures = "transactions", _spark_measures()
+        df = _with_event_date(spark.read.parquet(raw_path or output_path("transactions")))
+    if start:
+        df = df.filter(col("event_date") >= lit(start).cast("date"))
+    if end:
+        df = df.filter(col("event_date") <= lit(end).cast("date"))
+    for column, value in where.items():
+        df = df.filter(col(f"`{column}`").cast("string") == value)
+    return _totals(df, [f"`{column}`" for column in by], measures), source
+
+
+# pandas (local engine)
+
+
+def rollup_deltas_pandas(frame: pd.DataFrame, tables: Sequence[str] = ROLLUP_TABLES) -> Dict[str, pd.DataFrame]:
+    """Aggregate a sink-schema batch into the partial rows of each rollup table."""
+    rows = frame.assign(
+        event_date=pd.to_datetime(frame["transaction_datetime"]).dt.date,
+        fraud_count=(frame["Is Fraud?"] == "Yes").astype("int64"),
+    ).rename(columns={"Amount_USD": "amount_usd", "Amount_VND": "amount_vnd"})
+    rows = rows[rows["event_date"].notna()]
+    deltas = {}
+    for name in tables:
+        grouped = rows.groupby(rollup_keys(name) + PARTITION_COLUMNS, dropna=False, sort=False)
+        deltas[name] = pd.concat(
+            [
+                grouped.size().rename("transaction_count"),
+                grouped[["amount_usd", "amount_vnd"]].sum(min_count=1),
+                grouped["fraud_count"].sum(),
+            ],
+            axis=1,
+        ).reset_index()
+    return deltas
+
+
+def merge_rollup_pandas(frames: List[pd.DataFrame], name: str) -> pd.DataFrame:
+    """Sum rollup rows of the same key (a batch's partial rows and a month's current rows)."""
+    combined = pd.concat(frames, ignore_index=True)
+    grouped = combined.groupby(rollup_keys(name) + PARTITION_COLUMNS, dropna=False, sort=False)
+    merged = pd.concat(
+        [grouped[["transaction_count", "fraud_count"]].sum(), grouped[["amount_usd", "amount_vnd"]].sum(min_count=1)],
+        axis=1,
+    ).reset_index()
+    return merged[rollup_keys(name) + MEASURES + PARTITION_COLUMNS]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the daily rollup tables.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    query_parser = subparsers.add_parser("query", help="Print grouped totals, from a rollup when one covers them.")
+    query_parser.add_argument(
+        "--by", default="event_date", help=f"Comma-separated grouping columns, e.g. event_date,MCC ({TIME_COLUMNS} "
+        f"or {sorted({column for keys in ROLLUPS.values() for column in keys})})."
+    )
+    query_parser.add_argument("--start", help="First event_date (YYYY-MM-DD).")
+    query_parser.add_argument("--end", help="Last event_date (YYYY-MM-DD).")
+    query_parser.add_argument("--where", action="append", default=[], help="COLUMN=VALUE filter (repeatable).")
+    query_parser.add_argument("--raw", action="store_true", help="Aggregate the raw transactions instead.")
+    query_parser.add_argument("--limit", type=int, default=50, help="Rows to print.")
+    args = parser.parse_args(argv)
+
+    from .spark_streaming_consumer import create_spark_session
+
+    where = dict(item.split("=", 1) for item in args.where)
+    by = [column.strip() for column in args.by.split(",") if column.strip()]
+    spark = create_spark_session("CreditCardRollupQuery", packages=False)
+    try:
+        totals, source = query_totals(spark, by, args.start, args.end, where, use_rollups=not args.raw)
+        print(f"From {source}:")
+        totals.show(args.limit, truncate=False)
+    finally:
+        spark.stop()
+
+
+if __name__ == "__main__":
+    main()
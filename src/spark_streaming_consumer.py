@@ -1,46 +1,108 @@
 """Spark Structured Streaming consumer for credit card transactions."""
-from datetime import datetime
+import argparse
+import builtins
+from collections import deque
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import json
 import os
+import time
 
+import numpy as np
+
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
 from pyspark.sql.functions import (
     avg,
+    broadcast,
+    coalesce,
     col,
     concat,
+    concat_ws,
     count,
     current_date,
     current_timestamp,
     date_format,
     dayofweek,
+    element_at,
+    expr,
+    filter as array_filter,
+    format_string,
     from_json,
+    from_utc_timestamp,
     hour,
     lit,
     regexp_replace,
+    struct,
     sum,
+    timestamp_millis,
+    to_date,
+    to_json,
     to_timestamp,
-    udf,
+    unix_millis,
     when,
     window,
     day,
     month,
     year,
 )
-from pyspark.sql.types import DoubleType, StringType, StructField, StructType
-
-from .exchange_rate_scraper import ExchangeRateScraper
-
-
-BASE_DIR = Path(__file__).resolve().parent.parent
+from pyspark.sql.streaming import StreamingQueryListener
+from pyspark.sql.types import StringType, StructField, StructType
+
+from .batch_commit import commit_batch
+from .dimensions import DIMENSION_COLUMNS, apply_dimensions
+from .fraud_model import FRAUD_MODEL_PATH, add_fraud_score
+from .metrics import JsonLinesLog, MetricsRegistry
+from .pipeline_settings import (
+    ALERTS_TOPIC,
+    ALERT_LATENCY_TARGET_MS,
+    ALERT_TRIGGER_INTERVAL,
+    ALERT_TYPES,
+    ARROW_BATCH_SIZE,
+    CHECKPOINT_DIR,
+    CHECKPOINT_URI,
+    DEDUP_WATERMARK,
+    DEFAULT_EXCHANGE_RATE,
+    EXCHANGE_RATE_MODE,
+    FRAUD_COLUMNS,
+    FRAUD_SCORING,
+    KAFKA_BROKER,
+    KAFKA_MIN_PARTITIONS,
+    KAFKA_TOPIC,
+    MAX_OFFSETS_PER_TRIGGER,
+    MAX_RECORDS_PER_FILE,
+    METRICS_FILE,
+    METRICS_PORT,
+    OUTPUT_COLUMNS,
+    OUTPUT_DIR,
+    OUTPUT_URI,
+    PARQUET_COMPRESSION,
+    PARTITION_BY,
+    SHUFFLE_PARTITIONS,
+    SINKS,
+    SPARK_IVY_DIR,
+    SPARK_JARS_DIR,
+    STATS_OUTPUT_MODE,
+    STATS_TRIGGER_INTERVAL,
+    STATS_WATERMARK,
+    STATS_WINDOW,
+    STREAM_SINKS,
+    TRIGGER_INTERVAL,
+    VELOCITY_FEATURES,
+    WIRE_FORMAT,
+)
+from .rate_cache import get_shared_cache
+from .rate_history import RateHistory
+from .rollups import update_rollups
+from .velocity_features import FEATURE_COLUMNS, VELOCITY_STATE_TIMEOUT, add_velocity_features
+from .wire_format import AVRO_SCHEMA_JSON, HEADER, USE_CHIP_LABELS, WIRE_FORMAT_AVRO, WIRE_FORMAT_JSON
 
-KAFKA_BROKER = os.getenv("KAFKA_BROKER", "localhost:9092")
-KAFKA_TOPIC = "credit_card_transactions"
-CHECKPOINT_DIR = BASE_DIR / "checkpoint"
-OUTPUT_DIR = BASE_DIR / "output"
 
-# Optional HDFS URIs (set via environment when using Hadoop)
-OUTPUT_URI = os.getenv("OUTPUT_URI")
-CHECKPOINT_URI = os.getenv("CHECKPOINT_URI")
+KAFKA_PACKAGE = "org.apache.spark:spark-sql-kafka-0-10_2.12:3.5.1"
+AVRO_PACKAGE = "org.apache.spark:spark-avro_2.12:3.5.1"
+SPARK_PACKAGES = [KAFKA_PACKAGE]
+if WIRE_FORMAT == WIRE_FORMAT_AVRO:
+    SPARK_PACKAGES.append(AVRO_PACKAGE)
 
 schema = StructType(
     [
@@ -65,18 +127,73 @@ schema = StructType(
 )
 
 
-def create_spark_session():
-    """Create a Spark session configured for Kafka streaming."""
+def package_jar_name(package: str) -> str:
+    """Return the file name Ivy gives the jar of a ``group:artifact:version`` package."""
+    group, artifact, version = package.split(":")
+    return f"{group}_{artifact}-{version}.jar"
+
+
+def connector_config(
+    packages: List[str] = SPARK_PACKAGES, jars_dir: str = SPARK_JARS_DIR, ivy_dir: str = SPARK_IVY_DIR
+) -> Dict[str, str]:
+    """Return the Spark settings that put the connector ``packages`` on the classpath.
+
+    Jars already in ``jars_dir`` are used when they include every package, so
+    start-up needs no network and no Ivy resolution; otherwise Spark resolves
+    ``packages`` and their dependencies through Ivy, in ``ivy_dir`` if set.
+    """
+    jars = sorted(Path(jars_dir).glob("*.jar")) if jars_dir else []
+    missing = [package for package in packages if package_jar_name(package) not in {jar.name for jar in jars}]
+    if jars and not missing:
+        return {"spark.jars": ",".join(str(jar) for jar in jars)}
+    if jars:
+        print(f"[Spark] {jars_dir} has no jar for {missing}, resolving the connector packages instead")
+    config = {"spark.jars.packages": ",".join(packages)}
+    if ivy_dir:
+        config["spark.jars.ivy"] = ivy_dir
+    return config
+
+
+def fetch_connector_jars(target: Path, packages: Iterable[str] = (KAFKA_PACKAGE, AVRO_PACKAGE)) -> List[Path]:
+    """Resolve ``packages`` with their dependencies once and copy the jars to ``target``.
+
+    Both wire formats' connectors are fetched by default, so one directory
+    serves either ``WIRE_FORMAT``. Point ``SPARK_JARS_DIR`` at ``target``.
+    """
+    import shutil
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as ivy_dir:
+        spark = (
+            SparkSession.builder.appName("CreditCardConnectorJars")
+            .master("local[1]")
+            .config("spark.jars.packages", ",".join(packages))
+            .config("spark.jars.ivy", ivy_dir)
+            .config("spark.ui.enabled", "false")
+            .getOrCreate()
+        )
+        spark.stop()
+        target.mkdir(parents=True, exist_ok=True)
+        jars = [Path(shutil.copy2(jar, target / jar.name)) for jar in sorted((Path(ivy_dir) / "jars").glob("*.jar"))]
+    print(f"[Spark] Copied {len(jars)} connector jars to {target}")
+    return jars
+
+
+def create_spark_session(app_name: str = "CreditCardTransactionStreaming", packages: bool = True):
+    """Create a Spark session configured for Kafka streaming (``packages=False`` skips the connectors)."""
+    builder = SparkSession.builder.appName(app_name)
+    if packages:
+        for key, value in connector_config().items():
+            builder = builder.config(key, value)
     spark = (
-        SparkSession.builder.appName("CreditCardTransactionStreaming")
-        .config("spark.jars.packages", "org.apache.spark:spark-sql-kafka-0-10_2.12:3.5.1")
-        .config(
+        builder.config(
             "spark.sql.streaming.checkpointLocation",
             CHECKPOINT_URI if CHECKPOINT_URI else str(CHECKPOINT_DIR),
         )
-        .config("spark.sql.shuffle.partitions", "4")
+        .config("spark.sql.execution.arrow.maxRecordsPerBatch", str(ARROW_BATCH_SIZE))
         .getOrCreate()
     )
+    spark.conf.set("spark.sql.shuffle.partitions", str(shuffle_partitions(spark)))
 
     # If provided, set default FS to HDFS (or other) so Spark writes to it
     fs_default = os.getenv("FS_DEFAULTFS")
@@ -88,84 +205,208 @@ def create_spark_session():
     return spark
 
 
-def get_exchange_rate_udf():
-    """Return a UDF that fetches the USD/VND rate with one-hour caching."""
-    cached_rate = {"rate": None, "timestamp": None}
+def shuffle_partitions(spark) -> int:
+    """Return SHUFFLE_PARTITIONS, or one shuffle partition per core available to the application.
+
+    Stateful queries keep the count they were first started with in their
+    checkpoint, so a new value only applies to new checkpoints.
+    """
+    return SHUFFLE_PARTITIONS or max(1, spark.sparkContext.defaultParallelism)
+
+
+def kafka_source_options() -> Dict[str, str]:
+    """Return the Kafka source options of the transaction stream."""
+    options = {
+        "kafka.bootstrap.servers": KAFKA_BROKER,
+        "subscribe": KAFKA_TOPIC,
+        "startingOffsets": "earliest",
+        "failOnDataLoss": "false",
+        "kafka.session.timeout.ms": "30000",
+        "kafka.request.timeout.ms": "40000",
+        "includeHeaders": "true",
+    }
+    if KAFKA_MIN_PARTITIONS:
+        options["minPartitions"] = str(KAFKA_MIN_PARTITIONS)
+    if MAX_OFFSETS_PER_TRIGGER:
+        options["maxOffsetsPerTrigger"] = str(MAX_OFFSETS_PER_TRIGGER)
+    return options
+
+
+def resolve_exchange_rate() -> float:
+    """Return the USD/VND transfer rate from the driver's shared rate cache.
+
+    The cache refreshes in the background, so this never blocks on the network;
+    it falls back to ``DEFAULT_EXCHANGE_RATE`` until a first rate is known.
+    """
+    return get_shared_cache().get_rate("USD", "transfer", default=DEFAULT_EXCHANGE_RATE)
+
+
+# Broadcastable daily rate table, rebuilt only when the history file changes
+_history_cache = {"mtime": None, "frame": None}
+
+
+def load_rate_history(spark: SparkSession):
+    """Return the dense per-day USD rate table as a cached Spark DataFrame, or None."""
+    if EXCHANGE_RATE_MODE != "historical":
+        return None
+
+    history = RateHistory()
+    mtime = history.mtime()
+    if mtime is None:
+        return None
+    if _history_cache["mtime"] != mtime:
+        daily = history.daily_rates("USD", "transfer")
+        frame = None
+        if not daily.empty:
+            frame = spark.createDataFrame(daily, "rate_date date, history_rate double").cache()
+            print(f"Loaded rate history: {len(daily):,} days up to {daily['rate_date'].iloc[-1]}")
+        if _history_cache["frame"] is not None:
+            _history_cache["frame"].unpersist()
+        _history_cache.update(mtime=mtime, frame=frame)
+    return _history_cache["frame"]
+
+
+def with_exchange_rate(df, rate: float, history=None, time_column: str = "transaction_datetime"):
+    """Add the ``exchange_rate`` in effect at ``time_column``.
+
+    Without ``history`` every row gets the literal ``rate``. With a daily rate
+    table (see ``load_rate_history``) each row is broadcast-joined to the rate in
+    effect on the date of ``time_column``; dates after the end of the history
+    fall back to ``rate``.
+    """
+    if history is None:
+        return df.withColumn("exchange_rate", lit(float(rate)))
+    return (
+        df.withColumn("rate_date", to_date(col(time_column)))
+        .join(broadcast(history), "rate_date", "left")
+        .withColumn("exchange_rate", coalesce(col("history_rate"), lit(float(rate))))
+        .drop("rate_date", "history_rate")
+    )
 
-    def fetch_rate():
-        now = datetime.now()
 
-        if cached_rate["rate"] and cached_rate["timestamp"]:
-            time_diff = (now - cached_rate["timestamp"]).total_seconds()
-            if time_diff < 3600:
-                return cached_rate["rate"]
+def apply_exchange_rate(df, rate: float, history=None):
+    """Add ``exchange_rate`` (see ``with_exchange_rate``) and derive ``Amount_VND`` as a JVM expression."""
+    return with_exchange_rate(df, rate, history).withColumn("Amount_VND", col("Amount_USD") * col("exchange_rate"))
 
-        try:
-            scraper = ExchangeRateScraper()
-            usd_rate = scraper.get_usd_rate()
-            if usd_rate and usd_rate.get("transfer"):
-                rate = usd_rate["transfer"]
-                cached_rate["rate"] = rate
-                cached_rate["timestamp"] = now
-                print(f"Updated exchange rate: 1 USD = {rate:,.0f} VND")
-                return float(rate)
-        except Exception as exc:  # pragma: no cover - external dependency
-            print(f"Exchange rate lookup failed: {exc}")
 
-        return 24000.0
+def with_typed_fields(df):
+    """Derive typed amount and event-time columns from the raw string fields."""
+    return (
+        df.withColumn("Amount_USD", regexp_replace(col("Amount"), "\\$", "").cast("double"))
+        .withColumn(
+            "transaction_datetime",
+            to_timestamp(
+                concat(col("Year"), lit("-"), col("Month"), lit("-"), col("Day"), lit(" "), col("Time")),
+                "yyyy-M-d HH:mm",
+            ),
+        )
+        .withColumn("Zip", regexp_replace(col("Zip"), "\\.0$", ""))
+        .withColumn("processing_timestamp", to_timestamp(col("processing_timestamp")))
+    )
 
-    return udf(fetch_rate, DoubleType())
 
+def event_source_columns(df_stream):
+    """Return the columns ``with_event_id`` derives the event id of a Kafka record from.
+
+    ``_event_source`` is the producer's ``source_file`` header and
+    ``_event_position`` the record's topic, partition and offset, the fallback
+    for records sent without the header.
+    """
+    if "headers" in df_stream.columns:
+        header = element_at(array_filter(col("headers"), lambda h: h["key"] == "source_file"), 1)["value"]
+        source = header.cast("string")
+    else:
+        source = lit(None).cast("string")
+    return [
+        source.alias("_event_source"),
+        concat_ws(":", col("topic"), col("partition"), col("offset")).alias("_event_position"),
+    ]
 
-def process_stream(spark: SparkSession):
-    """Consume the Kafka stream, enrich, and write to multiple sinks."""
 
-    print("=" * 80)
-    print("SPARK STREAMING - CREDIT CARD TRANSACTION PROCESSING")
-    print("=" * 80)
-    print(f"Connecting to Kafka: {KAFKA_BROKER}")
-    print(f"Topic: {KAFKA_TOPIC}")
-    print(
-        f"Checkpoint: "
-        + (CHECKPOINT_URI if CHECKPOINT_URI else str(CHECKPOINT_DIR))
-    )
-    print(f"Output: " + (OUTPUT_URI if OUTPUT_URI else str(OUTPUT_DIR)))
-    print("=" * 80)
+def with_event_id(df):
+    """Add ``event_id``, ``<source_file>:<record_id>`` (stable across producer retries and replays)."""
+    return df.withColumn(
+        "event_id", coalesce(concat(col("_event_source"), lit(":"), col("record_id")), col("_event_position"))
+    ).drop("_event_source", "_event_position")
 
-    df_stream = (
-        spark.readStream.format("kafka")
-        .option("kafka.bootstrap.servers", KAFKA_BROKER)
-        .option("subscribe", KAFKA_TOPIC)
-        .option("startingOffsets", "earliest")
-        .option("failOnDataLoss", "false")
-        .option("kafka.session.timeout.ms", "30000")
-        .option("kafka.request.timeout.ms", "40000")
-        .load()
-    )
 
+def parse_json_events(df_stream):
+    """Decode JSON Kafka values (all-string fields) into typed transaction rows."""
     df_parsed = df_stream.select(
         col("key").cast("string").alias("key"),
         from_json(col("value").cast("string"), schema).alias("data"),
         col("timestamp").alias("kafka_timestamp"),
-    ).select("key", "data.*", "kafka_timestamp")
+        *event_source_columns(df_stream),
+    ).select("key", "data.*", "kafka_timestamp", "_event_source", "_event_position")
+    return with_event_id(with_typed_fields(df_parsed))
+
 
-    df_cleaned = df_parsed.withColumn("Amount_USD", regexp_replace(col("Amount"), "\\$", "").cast("double"))
+def parse_avro_events(df_stream, session_time_zone: str):
+    """Decode binary wire-format Kafka values into typed transaction rows.
 
-    get_rate = get_exchange_rate_udf()
-    df_with_rate = df_cleaned.withColumn("exchange_rate", get_rate())
-    df_with_rate = df_with_rate.withColumn("Amount_VND", col("Amount_USD") * col("exchange_rate"))
+    Messages whose header does not match the current schema version are dropped.
+    """
+    from pyspark.sql.avro.functions import from_avro
 
-    df_with_date = df_with_rate.withColumn(
-        "transaction_datetime",
-        to_timestamp(
-            concat(col("Year"), lit("-"), col("Month"), lit("-"), col("Day"), lit(" "), col("Time")),
-            "yyyy-M-d HH:mm",
+    use_chip_labels = expr(
+        "map(" + ", ".join(f"'{symbol}', '{label}'" for symbol, label in USE_CHIP_LABELS.items()) + ")"
+    )
+
+    df_decoded = df_stream.filter(col("value").substr(1, len(HEADER)) == lit(bytearray(HEADER))).select(
+        col("key").cast("string").alias("key"),
+        from_avro(
+            expr(f"substring(value, {len(HEADER) + 1})"), AVRO_SCHEMA_JSON, {"mode": "PERMISSIVE"}
+        ).alias("data"),
+        col("timestamp").alias("kafka_timestamp"),
+        *event_source_columns(df_stream),
+    )
+
+    df_typed = df_decoded.select(
+        "key",
+        col("data.user").cast("string").alias("User"),
+        col("data.card").cast("string").alias("Card"),
+        format_string("$%.2f", col("data.amount_cents") / 100).alias("Amount"),
+        use_chip_labels[col("data.use_chip")].alias("Use Chip"),
+        col("data.merchant_name").cast("string").alias("Merchant Name"),
+        col("data.merchant_city").alias("Merchant City"),
+        col("data.merchant_state").alias("Merchant State"),
+        col("data.zip").cast("string").alias("Zip"),
+        col("data.mcc").cast("string").alias("MCC"),
+        col("data.errors").alias("Errors?"),
+        when(col("data.is_fraud"), "Yes").otherwise("No").alias("Is Fraud?"),
+        timestamp_millis(col("data.processing_ts_ms")).alias("processing_timestamp"),
+        col("data.record_id").cast("string").alias("record_id"),
+        (col("data.amount_cents") / 100).alias("Amount_USD"),
+        # Event times are encoded as wall-clock UTC; shift back to the session-local wall clock
+        from_utc_timestamp(timestamp_millis(col("data.event_time_ms")), session_time_zone).alias(
+            "transaction_datetime"
         ),
+        "kafka_timestamp",
+        "_event_source",
+        "_event_position",
     )
+    return with_event_id(df_typed)
+
+
+def parse_kafka_events(df_stream, wire_format: str = WIRE_FORMAT):
+    """Decode Kafka records in ``wire_format`` into typed transaction rows."""
+    if wire_format == WIRE_FORMAT_AVRO:
+        session_time_zone = df_stream.sparkSession.conf.get("spark.sql.session.timeZone")
+        return parse_avro_events(df_stream, session_time_zone)
+    if wire_format == WIRE_FORMAT_JSON:
+        return parse_json_events(df_stream)
+    raise ValueError(f"Unknown wire format {wire_format!r}")
 
+
+def enrich_transactions(df_cleaned):
+    """Add date, analysis and category columns and drop rows with errors.
+
+    The exchange rate is not applied here; it is resolved once per micro-batch
+    on the driver and added with ``apply_exchange_rate``.
+    """
     # Format date and time columns as required (dd/mm/yyyy and hh:mm:ss)
     df_with_formatted_date = (
-        df_with_date
+        df_cleaned
         .withColumn("transaction_date", date_format(col("transaction_datetime"), "dd/MM/yyyy"))
         .withColumn("transaction_time", date_format(col("transaction_datetime"), "HH:mm:ss"))
         # Add analysis columns
@@ -186,95 +427,568 @@ def process_stream(spark: SparkSession):
 
     df_filtered = df_categorized.filter((col("Errors?").isNull()) | (col("Errors?") == ""))
 
-    df_final = df_filtered.withColumn("processed_at", current_timestamp()).withColumn("processing_date", current_date())
+    return df_filtered.withColumn("processed_at", current_timestamp()).withColumn("processing_date", current_date())
 
-    df_output = df_final.select(
-        "User",
-        "Card",
-        "transaction_date",
-        "transaction_time",
-        "transaction_datetime",
-        "transaction_year",
-        "transaction_month",
-        "transaction_day",
-        "transaction_hour",
-        "day_of_week",
-        "Amount",
-        "Amount_USD",
-        "Amount_VND",
-        "exchange_rate",
-        "Use Chip",
-        "Merchant Name",
-        "Merchant City",
-        "Merchant State",
-        "Zip",
-        "MCC",
-        "Is Fraud?",
-        "transaction_type",
-        "processed_at",
-        "processing_date",
+
+def with_velocity_features(df_output, timeout_seconds: int = VELOCITY_STATE_TIMEOUT):
+    """Project an enriched stream or batch to the sink columns and add per-card velocity features.
+
+    The rate columns are left out; they are added per micro-batch by the
+    fan-out writer. ``processing_timestamp`` is kept because the deduplication
+    watermark is defined on it.
+    """
+    columns = [name for name in OUTPUT_COLUMNS if name not in ("Amount_VND", "exchange_rate")]
+    columns.append("processing_timestamp")
+    return add_velocity_features(df_output.select(*columns), timeout_seconds)
+
+
+def drop_duplicate_events(df, event_time: str = "processing_timestamp", delay: str = DEDUP_WATERMARK):
+    """Define the watermark ``delay`` on ``event_time`` and keep the first row of each ``event_id`` within it.
+
+    Rows more than ``delay`` behind the latest ``event_time`` of earlier
+    batches are dropped as late, for every sink downstream including the
+    transactions archive. They are counted in the query progress, which
+    ``PipelineMetricsListener`` prints (see ``DEDUP_WATERMARK``). On a batch
+    frame every duplicate is dropped and nothing is late.
+    """
+    df = df.withWatermark(event_time, delay)
+    if df.isStreaming:
+        return df.dropDuplicatesWithinWatermark(["event_id"])
+    return df.dropDuplicates(["event_id"])
+
+
+def build_pipeline(df_output, velocity: bool = VELOCITY_FEATURES):
+    """Apply the query-level stages of the transaction pipeline to ``enrich_transactions`` output.
+
+    Works on streaming and batch frames alike (backfills use both); the
+    per-batch stages follow in ``enrich_batch``.
+    """
+    df_pipeline = drop_duplicate_events(df_output)
+    return with_velocity_features(df_pipeline) if velocity else df_pipeline
+
+
+def enrich_batch(spark: SparkSession, batch_df, scoring: bool = FRAUD_SCORING):
+    """Apply the per-batch stages: exchange rate, dimension tables and fraud score, then project to the sink schema.
+
+    Scoring runs here rather than on the stream because a pandas UDF placed
+    directly on top of the stateful velocity operator fails at runtime. It is
+    skipped while the model file is missing.
+    """
+    enriched = apply_exchange_rate(batch_df, resolve_exchange_rate(), load_rate_history(spark))
+    enriched = apply_dimensions(spark, enriched)
+    if scoring and FRAUD_MODEL_PATH.exists():
+        enriched = add_fraud_score(enriched)
+    return select_output(enriched)
+
+
+def select_output(df):
+    """Project a rate-enriched frame onto the sink schema (plus dimension, feature and score columns when present)."""
+    optional = [name for name in DIMENSION_COLUMNS + FEATURE_COLUMNS + FRAUD_COLUMNS if name in df.columns]
+    return df.select(*OUTPUT_COLUMNS, *optional)
+
+
+def output_path(name: str) -> str:
+    """Return the output location of a sink under OUTPUT_URI (HDFS) or OUTPUT_DIR."""
+    return (OUTPUT_URI + "/" + name) if OUTPUT_URI else str(OUTPUT_DIR / name)
+
+
+def checkpoint_path(name: str) -> str:
+    """Return the checkpoint location of a query under CHECKPOINT_URI or CHECKPOINT_DIR."""
+    return (CHECKPOINT_URI + "/" + name) if CHECKPOINT_URI else str(CHECKPOINT_DIR / name)
+
+
+def write_transactions_sink(batch_df, batch_id):
+    """Commit the batch to the partitioned, compressed Parquet transactions table.
+
+    The batch is repartitioned by the partition columns so each micro-batch
+    adds one file per partition value (split further by MAX_RECORDS_PER_FILE),
+    instead of one small file per task. A replayed batch replaces its own
+    files (see ``commit_batch``).
+    """
+    writer_df = batch_df.repartition(*PARTITION_BY) if PARTITION_BY else batch_df.coalesce(1)
+    writer = writer_df.write.option("compression", PARQUET_COMPRESSION).option(
+        "maxRecordsPerFile", MAX_RECORDS_PER_FILE
     )
+    if PARTITION_BY:
+        writer = writer.partitionBy(*PARTITION_BY)
+    commit_batch(batch_df.sparkSession, output_path("transactions"), batch_id, writer.parquet)
 
-    # Create local directories only when not using HDFS
-    if OUTPUT_URI is None:
-        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    if CHECKPOINT_URI is None:
-        CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Path for transactions data (no partitioning for easier Power BI access)
-    transactions_path = (OUTPUT_URI + "/transactions") if OUTPUT_URI else str(OUTPUT_DIR / "transactions")
-    transactions_ckpt = (
-        (CHECKPOINT_URI + "/transactions") if CHECKPOINT_URI else str(CHECKPOINT_DIR / "transactions")
+def write_csv_export_sink(batch_df, batch_id):
+    """Commit the batch as headered CSV (unpartitioned, for tools that need text files)."""
+    writer = batch_df.coalesce(1).write.option("header", "true")
+    commit_batch(batch_df.sparkSession, output_path("transactions_csv"), batch_id, writer.csv)
+
+
+def write_console_sink(batch_df, batch_id):
+    """Print the batch for monitoring."""
+    print(f"Batch: {batch_id}")
+    batch_df.show(20, truncate=False)
+
+
+def write_rollups_sink(batch_df, batch_id):
+    """Merge the batch into the daily rollup tables (see ``rollups``)."""
+    update_rollups(batch_df, batch_id, output_path("rollups"))
+
+
+SINK_WRITERS = {
+    "transactions": write_transactions_sink,
+    "csv_export": write_csv_export_sink,
+    "console": write_console_sink,
+    "rollups": write_rollups_sink,
+}
+
+
+def make_fanout_writer(spark: SparkSession, sinks):
+    """Return a ``foreachBatch`` function that writes each batch to all ``sinks``.
+
+    The exchange rate, the MCC/merchant dimensions (reloaded when their files
+    change) and the fraud score are applied once per batch (``enrich_batch``)
+    and, when there is more than
+    one sink, the enriched batch is persisted so the Kafka read and parsing are
+    not repeated for every sink.
+    """
+    unknown = [sink for sink in sinks if sink not in SINK_WRITERS]
+    if unknown:
+        raise ValueError(f"Unknown sinks {unknown}, expected a subset of {sorted(SINK_WRITERS)}")
+
+    def write_batch(batch_df, batch_id):
+        enriched = enrich_batch(spark, batch_df)
+        persisted = len(sinks) > 1
+        if persisted:
+            enriched = enriched.persist(StorageLevel.MEMORY_AND_DISK)
+        try:
+            for sink in sinks:
+                SINK_WRITERS[sink](enriched, batch_id)
+        finally:
+            if persisted:
+                enriched.unpersist()
+
+    return write_batch
+
+
+def build_user_stats(df_output):
+    """Per-user aggregates over event-time windows with a bounded state store.
+
+    Windows are keyed on ``transaction_datetime``; the watermark lets Spark emit
+    each window once it can no longer change and drop its state, so state
+    size and batch duration stay flat as uptime grows. Rows arriving later
+    than STATS_WATERMARK behind the newest event time are dropped, and so are
+    duplicate events within it (a duplicate carries its original event time).
+    Late rows are counted in the query's ``numRowsDroppedByWatermark``, which
+    ``PipelineMetricsListener`` exports and logs; see ``STATS_WATERMARK`` for
+    inputs ordered per card.
+
+    Amounts are kept in USD; ``rate_user_stats`` converts emitted windows to
+    VND when they are written.
+    """
+    return (
+        drop_duplicate_events(df_output, "transaction_datetime", STATS_WATERMARK)
+        .groupBy(window(col("transaction_datetime"), STATS_WINDOW), col("User"))
+        .agg(
+            count("*").alias("transaction_count"),
+            sum("Amount_USD").alias("total_amount_usd"),
+            avg("Amount_USD").alias("avg_amount_usd"),
+            sum(when(col("Is Fraud?") == "Yes", 1).otherwise(0)).alias("fraud_count"),
+        )
+        .select(
+            col("window.start").alias("window_start"),
+            col("window.end").alias("window_end"),
+            "User",
+            "transaction_count",
+            "total_amount_usd",
+            "avg_amount_usd",
+            "fraud_count",
+        )
+    )
+
+
+def rate_user_stats(spark: SparkSession, stats_df):
+    """Convert emitted ``build_user_stats`` windows to VND at the rate of the window's start date.
+
+    The live rate and the rate history are resolved for every batch, like
+    ``enrich_batch`` does for the transactions.
+    """
+    rated = with_exchange_rate(stats_df, resolve_exchange_rate(), load_rate_history(spark), "window_start")
+    return rated.select(
+        "window_start",
+        "window_end",
+        "User",
+        "transaction_count",
+        (col("total_amount_usd") * col("exchange_rate")).alias("total_amount_vnd"),
+        (col("avg_amount_usd") * col("exchange_rate")).alias("avg_amount_vnd"),
+        "fraud_count",
     )
 
-    query_transactions = (
-        df_output.writeStream.outputMode("append")
-        .format("csv")
-        .option("path", transactions_path)
-        .option("checkpointLocation", transactions_ckpt)
-        .option("header", "true")
-        .trigger(processingTime="30 seconds")
+
+def make_user_stats_writer(echo: bool = False):
+    """Return a ``foreachBatch`` function committing emitted windows to the user_stats table.
+
+    Windows are converted to VND with ``rate_user_stats`` as they are written.
+    In ``update`` mode a window can be emitted by several batches; the
+    ``batch_id`` column lets readers keep the latest version of each window.
+    A replayed batch replaces its own files.
+    """
+
+    def write_batch(batch_df, batch_id):
+        batch_df = rate_user_stats(batch_df.sparkSession, batch_df).withColumn("batch_id", lit(batch_id))
+        writer = batch_df.write.option("compression", PARQUET_COMPRESSION)
+        commit_batch(batch_df.sparkSession, output_path("user_stats"), batch_id, writer.parquet)
+        if echo:
+            batch_df.orderBy("window_start", "User").show(truncate=False)
+
+    return write_batch
+
+
+def start_pipeline_query(
+    spark: SparkSession,
+    df_output,
+    sinks,
+    checkpoint: str = "pipeline",
+    trigger: Optional[Dict] = None,
+    name: str = "transaction_pipeline",
+):
+    """Start the ``transaction_pipeline`` query: one Kafka read per trigger, fanned out to ``sinks``."""
+    if FRAUD_SCORING and not FRAUD_MODEL_PATH.exists():
+        print(f"Fraud model {FRAUD_MODEL_PATH} not found, scoring disabled until it appears")
+    return (
+        build_pipeline(df_output)
+        .writeStream.outputMode("append")
+        .foreachBatch(make_fanout_writer(spark, sinks))
+        .option("checkpointLocation", checkpoint_path(checkpoint))
+        .trigger(**(trigger or {"processingTime": TRIGGER_INTERVAL}))
+        .queryName(name)
         .start()
     )
 
-    query_console = (
-        df_output.writeStream.outputMode("append")
-        .format("console")
-        .option("truncate", "false")
-        .trigger(processingTime="30 seconds")
+
+def start_user_stats_query(
+    spark: SparkSession,
+    df_output,
+    echo: bool = False,
+    checkpoint: str = "user_statistics",
+    trigger: Optional[Dict] = None,
+    name: str = "user_statistics",
+):
+    """Start the stateful ``user_statistics`` query over event time.
+
+    It reads Kafka a second time, independently of ``transaction_pipeline``.
+    The state holds USD amounts; the writer converts each batch's windows at
+    the rates current when it runs.
+    """
+    df_user_stats = build_user_stats(df_output)
+    return (
+        df_user_stats.writeStream.outputMode(STATS_OUTPUT_MODE)
+        .foreachBatch(make_user_stats_writer(echo))
+        .option("checkpointLocation", checkpoint_path(checkpoint))
+        .trigger(**(trigger or {"processingTime": STATS_TRIGGER_INTERVAL}))
+        .queryName(name)
         .start()
     )
 
-    df_user_stats = df_output.groupBy(window(col("processed_at"), "1 minute"), col("User")).agg(
-        count("*").alias("transaction_count"),
-        sum("Amount_VND").alias("total_amount_vnd"),
-        avg("Amount_VND").alias("avg_amount_vnd"),
-        sum(when(col("Is Fraud?") == "Yes", 1).otherwise(0)).alias("fraud_count"),
+
+class LatencyTracker:
+    """Sliding window of end-to-end latencies (ms) with percentile summaries."""
+
+    def __init__(self, window: int = 10000):
+        self._values = deque(maxlen=window)
+        self.total = 0
+
+    def add(self, values: Iterable[float]) -> None:
+        values = list(values)
+        self._values.extend(values)
+        self.total += len(values)
+
+    def summary(self) -> Optional[Dict[str, float]]:
+        """Return count and p50/p95/p99/max over the window, or None when empty."""
+        if not self._values:
+            return None
+        values = np.fromiter(self._values, dtype=np.float64)
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {"count": self.total, "p50": p50, "p95": p95, "p99": p99, "max": values.max()}
+
+
+# End-to-end latency from producer processing_timestamp to alert publish
+alert_latency = LatencyTracker()
+
+METRICS = MetricsRegistry()
+ALERT_LATENCY = METRICS.histogram("alert_end_to_end_latency_ms", "Producer send to alert publish, per alert.")
+
+
+def build_alerts(df_output):
+    """Filter alert-worthy rows and encode them as compact Kafka records.
+
+    Rows qualify by ``transaction_type`` (ALERT_TYPES) or, when the frame has
+    been scored, by ``fraud_predicted``. The value is a small JSON document;
+    ``processing_ts_ms`` is kept beside it for latency measurement.
+    """
+    condition = col("transaction_type").isin(ALERT_TYPES)
+    fields = [
+        col("event_id"),
+        col("record_id"),
+        col("User").alias("user"),
+        col("Card").alias("card"),
+        col("transaction_type"),
+        col("Amount_USD").alias("amount_usd"),
+        col("Merchant Name").alias("merchant_name"),
+        col("Merchant City").alias("merchant_city"),
+        date_format(col("transaction_datetime"), "yyyy-MM-dd'T'HH:mm:ss").alias("transaction_datetime"),
+        unix_millis(col("processing_timestamp")).alias("processing_ts_ms"),
+        unix_millis(current_timestamp()).alias("alerted_at_ms"),
+    ]
+    if "fraud_predicted" in df_output.columns:
+        condition = condition | col("fraud_predicted")
+        fields.insert(4, col("fraud_score"))
+
+    return df_output.filter(condition).select(
+        concat_ws(":", col("User"), col("Card")).alias("key"),
+        to_json(struct(*fields)).alias("value"),
+        unix_millis(col("processing_timestamp")).alias("processing_ts_ms"),
     )
 
-    query_stats = (
-        df_user_stats.writeStream.outputMode("complete")
-        .format("console")
-        .option("truncate", "false")
-        .trigger(processingTime="1 minute")
-        .queryName("user_statistics")
+
+def make_alert_writer(tracker: LatencyTracker = alert_latency, topic: str = ALERTS_TOPIC):
+    """Return a ``foreachBatch`` function publishing alerts to ``topic`` and recording latency.
+
+    Latency is measured on the driver once the Kafka write of the batch has
+    returned, i.e. after the records were acknowledged by the broker.
+    """
+
+    def write_batch(batch_df, batch_id):
+        batch_df = batch_df.persist(StorageLevel.MEMORY_AND_DISK)
+        try:
+            (
+                batch_df.select("key", "value")
+                .write.format("kafka")
+                .option("kafka.bootstrap.servers", KAFKA_BROKER)
+                .option("topic", topic)
+                .save()
+            )
+            published_ms = time.time() * 1000
+            sent_ms = [row[0] for row in batch_df.select("processing_ts_ms").collect() if row[0] is not None]
+        finally:
+            batch_df.unpersist()
+
+        if not sent_ms:
+            return
+        latencies = [published_ms - value for value in sent_ms]
+        tracker.add(latencies)
+        for latency in latencies:
+            ALERT_LATENCY.observe(latency)
+        summary = tracker.summary()
+        status = "OK" if summary["p99"] <= ALERT_LATENCY_TARGET_MS else "ABOVE TARGET"
+        print(
+            f"[Alerts] batch {batch_id}: published {len(sent_ms)} alerts to {topic}; end-to-end latency "
+            f"p50={summary['p50']:.0f}ms p95={summary['p95']:.0f}ms p99={summary['p99']:.0f}ms "
+            f"(target {ALERT_LATENCY_TARGET_MS:.0f}ms, {status})"
+        )
+
+    return write_batch
+
+
+def start_alert_query(spark: SparkSession, df_output):
+    """Start the ``fraud_alerts`` query with a sub-second trigger.
+
+    It reads Kafka on its own, so the slow archival sinks never delay it, and
+    it skips the stateful stages; the fraud score is included when scoring is
+    enabled.
+    """
+    if FRAUD_SCORING and FRAUD_MODEL_PATH.exists():
+        df_output = add_fraud_score(df_output)
+    return (
+        build_alerts(df_output)
+        .writeStream.outputMode("append")
+        .foreachBatch(make_alert_writer())
+        .option("checkpointLocation", checkpoint_path("alerts"))
+        .trigger(processingTime=ALERT_TRIGGER_INTERVAL)
+        .queryName("fraud_alerts")
         .start()
     )
 
-    print("\nStreaming queries started:")
-    print("  - Transactions (CSV)")
-    print("  - Console monitoring")
-    print("  - User statistics")
+
+def progress_metrics(progress: Dict) -> Dict:
+    """Summarise a ``StreamingQueryProgress`` (as parsed JSON) into flat per-batch metrics.
+
+    Kafka lag is the worst ``maxOffsetsBehindLatest`` over the query's Kafka
+    sources; state figures are summed over its stateful operators.
+    """
+    lag = [
+        float(source["metrics"]["maxOffsetsBehindLatest"])
+        for source in progress.get("sources", [])
+        if (source.get("metrics") or {}).get("maxOffsetsBehindLatest") is not None
+    ]
+    operators = progress.get("stateOperators", [])
+    return {
+        "query": progress.get("name") or progress.get("id"),
+        "batch_id": progress.get("batchId"),
+        "num_input_rows": progress.get("numInputRows", 0),
+        "input_rows_per_second": progress.get("inputRowsPerSecond") or 0.0,
+        "processed_rows_per_second": progress.get("processedRowsPerSecond") or 0.0,
+        "duration_ms": progress.get("durationMs", {}),
+        "kafka_offsets_behind_latest": max(lag) if lag else None,
+        "state_rows": builtins.sum(operator.get("numRowsTotal", 0) for operator in operators),
+        "state_memory_bytes": builtins.sum(operator.get("memoryUsedBytes", 0) for operator in operators),
+        "state_rows_dropped_by_watermark": builtins.sum(
+            operator.get("numRowsDroppedByWatermark", 0) for operator in operators
+        ),
+    }
+
+
+class PipelineMetricsListener(StreamingQueryListener):
+    """Record every query's per-batch progress in ``registry`` and, optionally, a JSON-lines log.
+
+    Metrics are labelled by query name: batch duration (histogram, plus the
+    latest breakdown by phase such as ``addBatch`` and ``latestOffset``),
+    input and processed rows per second, Kafka offsets behind latest, and
+    state store rows and memory. Rows a stateful operator dropped as later
+    than its watermark are counted and printed, since nothing else reports
+    them. Callbacks run on the driver after each batch.
+    """
+
+    def __init__(self, registry: MetricsRegistry = METRICS, log: Optional[JsonLinesLog] = None):
+        self.log = log
+        self._names: Dict[str, str] = {}
+        self.active = registry.gauge("streaming_query_active", "1 while the query runs.")
+        self.batch_id = registry.gauge("streaming_batch_id", "Id of the last completed micro-batch.")
+        self.batch_duration = registry.histogram(
+            "streaming_batch_duration_ms", "Trigger execution time of each micro-batch."
+        )
+        self.phase_duration = registry.gauge(
+            "streaming_batch_phase_duration_ms", "Time spent per phase in the last micro-batch."
+        )
+        self.input_rows = registry.counter("streaming_input_rows_total", "Rows read from the sources.")
+        self.input_rate = registry.gauge("streaming_input_rows_per_second", "Arrival rate in the last batch.")
+        self.processed_rate = registry.gauge(
+            "streaming_processed_rows_per_second", "Processing rate in the last batch."
+        )
+        self.kafka_lag = registry.gauge(
+            "streaming_kafka_offsets_behind_latest", "Largest per-partition offset lag after the last batch."
+        )
+        self.state_rows = registry.gauge("streaming_state_rows", "Rows held by the state stores.")
+        self.state_memory = registry.gauge("streaming_state_memory_bytes", "Memory used by the state stores.")
+        self.state_dropped = registry.counter(
+            "streaming_state_rows_dropped_by_watermark_total", "Rows dropped as later than the watermark."
+        )
+
+    def onQueryStarted(self, event):
+        name = event.name or str(event.id)
+        self._names[str(event.id)] = name
+        self.active.set(1, query=name)
+
+    def onQueryProgress(self, event):
+        metrics = progress_metrics(json.loads(event.progress.json))
+        query = metrics["query"]
+        self.batch_id.set(metrics["batch_id"], query=query)
+        if "triggerExecution" in metrics["duration_ms"]:
+            self.batch_duration.observe(metrics["duration_ms"]["triggerExecution"], query=query)
+        for phase, duration in metrics["duration_ms"].items():
+            self.phase_duration.set(duration, query=query, phase=phase)
+        self.input_rows.inc(metrics["num_input_rows"], query=query)
+        self.input_rate.set(metrics["input_rows_per_second"], query=query)
+        self.processed_rate.set(metrics["processed_rows_per_second"], query=query)
+        if metrics["kafka_offsets_behind_latest"] is not None:
+            self.kafka_lag.set(metrics["kafka_offsets_behind_latest"], query=query)
+        self.state_rows.set(metrics["state_rows"], query=query)
+        self.state_memory.set(metrics["state_memory_bytes"], query=query)
+        self.state_dropped.inc(metrics["state_rows_dropped_by_watermark"], query=query)
+        if metrics["state_rows_dropped_by_watermark"]:
+            print(
+                f"[Metrics] {query} batch {metrics['batch_id']}: dropped "
+                f"{metrics['state_rows_dropped_by_watermark']:,} rows later than the watermark"
+            )
+        if self.log is not None:
+            self.log.write(metrics)
+
+    def onQueryIdle(self, event):
+        pass
+
+    def onQueryTerminated(self, event):
+        name = self._names.pop(str(event.id), str(event.id))
+        self.active.set(0, query=name)
+        if self.log is not None:
+            self.log.write({"query": name, "terminated": True, "exception": event.exception})
+
+
+def start_metrics(spark: SparkSession, port: int = METRICS_PORT, path: str = METRICS_FILE) -> PipelineMetricsListener:
+    """Register a ``PipelineMetricsListener`` and serve ``METRICS`` on ``port`` (0 = no endpoint)."""
+    listener = PipelineMetricsListener(METRICS, JsonLinesLog(Path(path)) if path else None)
+    spark.streams.addListener(listener)
+    if port:
+        METRICS.serve(port)
+    return listener
+
+
+def process_stream(spark: SparkSession):
+    """Consume the Kafka stream once, enrich each micro-batch, and fan it out to the sinks."""
+
+    print("=" * 80)
+    print("SPARK STREAMING - CREDIT CARD TRANSACTION PROCESSING")
+    print("=" * 80)
+    print(f"Connecting to Kafka: {KAFKA_BROKER}")
+    print(f"Topic: {KAFKA_TOPIC} (wire format: {WIRE_FORMAT})")
+    print(
+        f"Checkpoint: "
+        + (CHECKPOINT_URI if CHECKPOINT_URI else str(CHECKPOINT_DIR))
+    )
+    print(f"Output: " + (OUTPUT_URI if OUTPUT_URI else str(OUTPUT_DIR)))
+    print(
+        f"Parallelism: {spark.conf.get('spark.sql.shuffle.partitions')} shuffle partitions, "
+        f"min Kafka partitions: {KAFKA_MIN_PARTITIONS or 'per topic partition'}, "
+        f"max offsets per trigger: {MAX_OFFSETS_PER_TRIGGER or 'unlimited'}"
+    )
+    print("=" * 80)
+
+    start_metrics(spark)
+
+    df_stream = spark.readStream.format("kafka").options(**kafka_source_options()).load()
+
+    df_cleaned = parse_kafka_events(df_stream)
+
+    df_output = enrich_transactions(df_cleaned)
+
+    # Create local directories only when not using HDFS
+    if OUTPUT_URI is None:
+        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    if CHECKPOINT_URI is None:
+        CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+
+    # One Kafka read per trigger, enriched once and fanned out to every stateless sink
+    queries = []
+    batch_sinks = [sink for sink in SINKS if sink not in STREAM_SINKS]
+    if batch_sinks:
+        queries.append(start_pipeline_query(spark, df_output, batch_sinks))
+
+    # Windowed statistics keep state across batches, so they run as their own query
+    if "user_stats" in SINKS:
+        queries.append(start_user_stats_query(spark, df_output, echo="console" in SINKS))
+    if "alerts" in SINKS:
+        queries.append(start_alert_query(spark, df_output))
+
+    print("\nStreaming queries started, writing to:")
+    for sink in SINKS:
+        print(f"  - {sink}")
     print("\nProcessing stream... Press Ctrl+C to stop.")
 
     spark.streams.awaitAnyTermination()
 
-    for query in [query_transactions, query_console, query_stats]:
+    for query in queries:
         if query.isActive:
             query.stop()
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consume the transaction topic with Spark Structured Streaming.")
+    parser.add_argument(
+        "--fetch-jars",
+        metavar="DIR",
+        type=Path,
+        help="Download the connector jars into DIR for SPARK_JARS_DIR and exit.",
+    )
+    args = parser.parse_args(argv)
+    if args.fetch_jars:
+        fetch_connector_jars(args.fetch_jars)
+        return
+
     try:
         spark = create_spark_session()
         process_stream(spark)
@@ -0,0 +1,292 @@
+"""Synthetic credit card transactions in the sample CSV layout, for scale testing.
+
+``TransactionProfile.from_csv`` learns the column distributions of a
+transactions CSV (by default the one-user sample):
+
+* merchants, with their city, state, zip and MCC, drawn by frequency
+* amounts drawn from the observed amounts of the merchant's MCC
+* hour of day; the minute is uniform
+* chip usage for in-person merchants (``ONLINE`` merchants are always online)
+* error labels and the fraud rate
+* transactions per card per day, jittered per card
+
+``generate_chunks`` then yields ``users x cards`` card histories as pandas
+frames of at most about ``chunk_rows`` rows, built with vectorized numpy
+draws. Only one chunk is held at a time, so memory does not grow with the
+number of users. Chunk ``i`` draws from ``default_rng([seed, i])``, so the
+same seed and arguments reproduce the same rows.
+
+Run ``python -m src.synthetic_data {csv,parquet,kafka} ...``; ``csv`` and
+``parquet`` write one ``part-NNNNN`` file per chunk, ``kafka`` streams the
+rows through the producer.
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SAMPLE_CSV = BASE_DIR / "data" / "User0_credit_card_transactions.csv"
+
+CSV_COLUMNS = [
+    "User", "Card", "Year", "Month", "Day", "Time", "Amount", "Use Chip", "Merchant Name",
+    "Merchant City", "Merchant State", "Zip", "MCC", "Errors?", "Is Fraud?",
+]
+INTEGER_COLUMNS = ["User", "Card", "Year", "Month", "Day"]
+ONLINE_CITY = "ONLINE"
+ONLINE_CHIP = "Online Transaction"
+CHUNK_ROWS = 500_000
+# "HH:MM" for every minute of the day, indexed by minute
+TIME_LABELS = np.array([f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)], dtype=object)
+
+
+def _distribution(values: pd.Series):
+    counts = values.value_counts(dropna=False)
+    labels = np.array([None if pd.isna(label) else label for label in counts.index], dtype=object)
+    return labels, (counts.to_numpy() / counts.sum())
+
+
+class TransactionProfile:
+    """Column distributions learned from a transactions CSV."""
+
+    def __init__(self, frame: pd.DataFrame):
+        frame = frame.copy()
+        amounts = frame["Amount"].str.replace("$", "", regex=False).astype(float)
+
+        merchants = frame.groupby("Merchant Name", sort=True).agg(
+            city=("Merchant City", "first"),
+            state=("Merchant State", "first"),
+            zip=("Zip", "first"),
+            mcc=("MCC", "first"),
+            transactions=("MCC", "size"),
+        )
+        self.merchant_names = merchants.index.to_numpy(dtype=object)
+        self.merchant_cities = merchants["city"].to_numpy(dtype=object)
+        self.merchant_states = merchants["state"].where(merchants["state"].notna(), None).to_numpy(dtype=object)
+        self.merchant_zips = merchants["zip"].where(merchants["zip"].notna(), None).to_numpy(dtype=object)
+        self.merchant_mccs = merchants["mcc"].to_numpy(dtype=object)
+        self.merchant_weights = merchants["transactions"].to_numpy() / merchants["transactions"].sum()
+        self.merchant_online = self.merchant_cities == ONLINE_CITY
+
+        # Amounts grouped by MCC: those of MCC k are amount_values[amount_start[k]:][:amount_count[k]]
+        mcc_codes, mcc_index = np.unique(frame["MCC"].to_numpy(dtype=str), return_inverse=True)
+        order = np.argsort(mcc_index, kind="stable")
+        self.amount_values = amounts.to_numpy()[order]
+        self.amount_count = np.bincount(mcc_index, minlength=len(mcc_codes))
+        self.amount_start = np.concatenate([[0], np.cumsum(self.amount_count)[:-1]])
+        self.merchant_mcc_index = np.searchsorted(mcc_codes, self.merchant_mccs.astype(str))
+
+        hours = frame["Time"].str.slice(0, 2).astype(int)
+        self.hour_weights = np.bincount(hours, minlength=24) / len(hours)
+        in_person = frame[frame["Merchant City"] != ONLINE_CITY]
+        self.chip_labels, self.chip_weights = _distribution(in_person["Use Chip"])
+        self.error_labels, self.error_weights = _distribution(frame["Errors?"])
+        self.fraud_rate = float((frame["Is Fraud?"] == "Yes").mean())
+
+        # Transactions per active day of each card, over the days between its first and last
+        dates = pd.to_datetime(frame[["Year", "Month", "Day"]].astype(int))
+        spans = dates.groupby([frame["User"], frame["Card"]]).agg(["min", "max", "size"])
+        days = (spans["max"] - spans["min"]).dt.days + 1
+        self.daily_rates = (spans["size"] / days).to_numpy()
+
+    @classmethod
+    def from_csv(cls, path: Path = SAMPLE_CSV) -> "TransactionProfile":
+        return cls(pd.read_csv(path, dtype=str))
+
+    def mean_daily_rate(self) -> float:
+        return float(self.daily_rates.mean())
+
+    def describe(self) -> str:
+        return (
+            f"{len(self.merchant_names)} merchants, {len(self.amount_count)} MCCs, "
+            f"{len(self.daily_rates)} card histories ({self.mean_daily_rate():.2f} transactions/day), "
+            f"fraud rate {self.fraud_rate:.4%}"
+        )
+
+
+def generate_chunk(
+    profile: TransactionProfile,
+    rng: np.random.Generator,
+    first_user: int,
+    users: int,
+    cards: int,
+    start: np.datetime64,
+    days: int,
+) -> pd.DataFrame:
+    """Generate the transactions of ``users`` users with ``cards`` cards each, ordered by card and time."""
+    card_count = users * cards
+    rates = rng.choice(profile.daily_rates, card_count) * rng.lognormal(0.0, 0.25, card_count)
+    per_card = rng.poisson(rates * days)
+    rows = int(per_card.sum())
+    card_index = np.repeat(np.arange(card_count), per_card)
+
+    day = rng.integers(0, days, rows)
+    minute = rng.choice(24, rows, p=profile.hour_weights) * 60 + rng.integers(0, 60, rows)
+    order = np.lexsort((day * 1440 + minute, card_index))
+    day, minute = day[order], minute[order]
+    dates = pd.DatetimeIndex(start + day.astype("timedelta64[D]"))
+
+    merchant = rng.choice(len(profile.merchant_names), rows, p=profile.merchant_weights)
+    mcc = profile.merchant_mcc_index[merchant]
+    amount = profile.amount_values[
+        profile.amount_start[mcc] + (rng.random(rows) * profile.amount_count[mcc]).astype(np.int64)
+    ]
+    chip = profile.chip_labels[rng.choice(len(profile.chip_labels), rows, p=profile.chip_weights)]
+    chip[profile.merchant_online[merchant]] = ONLINE_CHIP
+    errors = profile.error_labels[rng.choice(len(profile.error_labels), rows, p=profile.error_weights)]
+    fraud = np.where(rng.random(rows) < profile.fraud_rate, "Yes", "No").astype(object)
+
+    return pd.DataFrame(
+        {
+            "User": first_user + card_index // cards,
+            "Card": card_index % cards,
+            "Year": dates.year.to_numpy(),
+            "Month": dates.month.to_numpy(),
+            "Day": dates.day.to_numpy(),
+            "Time": TIME_LABELS[minute],
+            "Amount": np.char.mod("$%.2f", amount).astype(object),
+            "Use Chip": chip,
+            "Merchant Name": profile.merchant_names[merchant],
+            "Merchant City": profile.merchant_cities[merchant],
+            "Merchant State": profile.merchant_states[merchant],
+            "Zip": profile.merchant_zips[merchant],
+            "MCC": profile.merchant_mccs[merchant],
+            "Errors?": errors,
+            "Is Fraud?": fraud,
+        },
+        columns=CSV_COLUMNS,
+    )
+
+
+def generate_chunks(
+    profile: TransactionProfile,
+    users: int,
+    cards: int = 3,
+    days: int = 365,
+    start_date: str = "2019-01-01",
+    seed: int = 0,
+    first_user: int = 1,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[pd.DataFrame]:
+    """Yield the transactions of ``users`` users, a bounded number of users per chunk."""
+    users_per_chunk = max(1, int(chunk_rows / max(cards * days * profile.mean_daily_rate(), 1e-9)))
+    start = np.datetime64(start_date, "D")
+    for chunk_index, chunk_first in enumerate(range(0, users, users_per_chunk)):
+        rng = np.random.default_rng([seed, chunk_index])
+        chunk_users = min(users_per_chunk, users - chunk_first)
+        yield generate_chunk(profile, rng, first_user + chunk_first, chunk_users, cards, start, days)
+
+
+def iter_rows(chunks: Iterator[pd.DataFrame]) -> Iterator[Dict[str, str]]:
+    """Turn chunks into the string row dicts ``csv.DictReader`` gives for the sample CSV."""
+    for chunk in chunks:
+        yield from chunk.astype(object).where(chunk.notna(), "").astype(str).to_dict("records")
+
+
+def write_csv(chunks: Iterator[pd.DataFrame], output_dir: Path) -> List[Path]:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index, chunk in enumerate(chunks):
+        path = output_dir / f"part-{index:05d}.csv"
+        chunk.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def write_parquet(chunks: Iterator[pd.DataFrame], output_dir: Path) -> List[Path]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [(name, pa.int64() if name in INTEGER_COLUMNS else pa.string()) for name in CSV_COLUMNS]
+    )
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index, chunk in enumerate(chunks):
+        path = output_dir / f"part-{index:05d}.parquet"
+        pq.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False), path)
+        paths.append(path)
+    return paths
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic transactions learned from a sample CSV.")
+    parser.add_argument("--profile-csv", type=Path, default=SAMPLE_CSV, help="CSV to learn distributions from.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--cards", type=int, default=3, help="Cards per user.")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--start-date", default="2019-01-01")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--first-user", type=int, default=1, help="First user id (the sample is user 0).")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Approximate rows per chunk and file.")
+    subparsers = parser.add_subparsers(dest="sink", required=True)
+    for sink in ("csv", "parquet"):
+        subparsers.add_parser(sink, help=f"Write one {sink} file per chunk.").add_argument("output_dir", type=Path)
+    kafka_parser = subparsers.add_parser("kafka", help="Send the rows through the producer.")
+    kafka_parser.add_argument("--rate", type=float, default=0, help="Records per second (0 = as fast as possible).")
+    kafka_parser.add_argument("--topic")
+    args = parser.parse_args(argv)
+
+    profile = TransactionProfile.from_csv(args.profile_csv)
+    print(f"[Synthetic] Profile from {args.profile_csv.name}: {profile.describe()}")
+    chunks = generate_chunks(
+        profile,
+        args.users,
+        cards=args.cards,
+        days=args.days,
+        start_date=args.start_date,
+        seed=args.seed,
+        first_user=args.first_user,
+        chunk_rows=args.chunk_rows,
+    )
+
+    started = time.perf_counter()
+    if args.sink == "kafka":
+        from . import kafka_producer
+
+        producer = kafka_producer.create_producer()
+        if producer is None:
+            print("Unable to start producer. Please verify the Kafka server.")
+            return
+        pacer = kafka_producer.ReplayPacer("rate", rate=args.rate) if args.rate else kafka_producer.ReplayPacer("max")
+        kafka_producer.send_rows(
+            producer,
+            iter_rows(chunks),
+            f"synthetic-seed{args.seed}",
+            pacer=pacer,
+            topic=args.topic or kafka_producer.TOPIC_NAME,
+        )
+        return
+
+    rows = 0
+
+    def counted(chunks):
+        nonlocal rows
+        for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+
+    paths = (write_csv if args.sink == "csv" else write_parquet)(counted(chunks), args.output_dir)
+    elapsed = time.perf_counter() - started
+    peak = _peak_rss_mb()
+    print(
+        f"[Synthetic] Wrote {rows:,} transactions for {args.users:,} users x {args.cards} cards "
+        f"to {len(paths)} files in {args.output_dir} in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)"
+        + (f", peak RSS {peak:,.0f} MB" if peak else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
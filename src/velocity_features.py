@@ -0,0 +1,173 @@
+"""Stateful per-card velocity features for fraud detection.
+
+``add_velocity_features`` groups the transaction stream by (User, Card) and
+keeps a small running state per card with ``applyInPandasWithState``. Each
+state holds the last event time, the running mean and variance of
+``Amount_USD`` (Welford's algorithm), the event times of the card's most
+recent transactions, and its most recently used merchants and cities. From
+this state every row gets:
+
+* ``seconds_since_last_txn``: gap to the card's previous transaction
+* ``card_txn_count_1h`` / ``card_txn_count_24h``: transactions in the trailing
+  hour / day, including this one
+* ``amount_zscore``: the amount against the card's history before this row
+* ``is_new_merchant`` / ``is_new_city``: not among the card's recent merchants
+  or cities
+
+Cards are evicted after ``VELOCITY_STATE_TIMEOUT`` seconds without a transaction, so
+state is bounded by the number of recently active cards, and each state is
+bounded by ``VELOCITY_MAX_RECENT`` and ``VELOCITY_MAX_PLACES``. The timeout runs
+on processing time rather than event time: replays send each card's history
+in turn, and with an event-time timeout Spark would drop every row behind the
+watermark.
+
+On a batch DataFrame (backfills) each card's whole history is one group and
+the same update function runs through ``applyInPandas`` from an empty state,
+so a backfill reproduces what the stream computed from the same rows.
+"""
+import functools
+import os
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.streaming.state import GroupState, GroupStateTimeout
+from pyspark.sql.types import BooleanType, DoubleType, IntegerType, StructField, StructType
+
+
+VELOCITY_STATE_TIMEOUT = int(os.getenv("VELOCITY_STATE_TIMEOUT", "3600"))
+# Upper bounds on the per-card state: event times kept for the 24h count, distinct merchants/cities remembered
+VELOCITY_MAX_RECENT = int(os.getenv("VELOCITY_MAX_RECENT", "256"))
+VELOCITY_MAX_PLACES = int(os.getenv("VELOCITY_MAX_PLACES", "64"))
+
+SHORT_WINDOW_MS = 3600 * 1000
+LONG_WINDOW_MS = 24 * 3600 * 1000
+
+STATE_SCHEMA = (
+    "last_event_ms long, txn_count long, amount_mean double, amount_m2 double, "
+    "recent_ms array<long>, merchants array<string>, cities array<string>"
+)
+
+FEATURE_FIELDS = [
+    StructField("seconds_since_last_txn", DoubleType(), True),
+    StructField("card_txn_count_1h", IntegerType(), True),
+    StructField("card_txn_count_24h", IntegerType(), True),
+    StructField("amount_zscore", DoubleType(), True),
+    StructField("is_new_merchant", BooleanType(), True),
+    StructField("is_new_city", BooleanType(), True),
+]
+FEATURE_COLUMNS = [field.name for field in FEATURE_FIELDS]
+
+
+def _remember(values: list, value, limit: int) -> list:
+    """Move ``value`` to the end of ``values`` (most recent last), keeping at most ``limit``."""
+    if value in values:
+        values.remove(value)
+    values.append(value)
+    return values[-limit:]
+
+
+def update_card_state(
+    key: Tuple, pdfs: Iterator[pd.DataFrame], state: GroupState, timeout_seconds: int = VELOCITY_STATE_TIMEOUT
+) -> Iterator[pd.DataFrame]:
+    """``applyInPandasWithState`` function: emit feature rows and update one card's state."""
+    if state.hasTimedOut:
+        state.remove()
+        return
+
+    if state.exists:
+        last_event_ms, txn_count, mean, m2, recent_ms, merchants, cities = state.get
+        recent_ms, merchants, cities = list(recent_ms), list(merchants), list(cities)
+    else:
+        last_event_ms, txn_count, mean, m2, recent_ms, merchants, cities = None, 0, 0.0, 0.0, [], [], []
+
+    chunks = list(pdfs)
+    pdf = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+    times = pdf["transaction_datetime"]
+    if not (times.is_monotonic_increasing and times.is_unique):
+        # Event times have minute resolution; break ties by amount and merchant so the order does not
+        # depend on how the rows were shuffled (a backfill then matches the stream)
+        pdf = pdf.sort_values(["transaction_datetime", "Amount_USD", "Merchant Name"], kind="stable")
+    # Groups are small (a card's rows in one micro-batch), so plain lists beat vectorised pandas here
+    event_ms = pdf["transaction_datetime"].to_numpy("datetime64[ms]").astype(np.int64).tolist()
+    amounts = pdf["Amount_USD"].fillna(0.0).tolist()
+    merchant_names = pdf["Merchant Name"].astype(str).tolist()
+    city_names = pdf["Merchant City"].astype(str).tolist()
+
+    since_last, count_short, count_long, zscore, new_merchant, new_city = [], [], [], [], [], []
+    for now_ms, amount, merchant, city in zip(event_ms, amounts, merchant_names, city_names):
+        # Out-of-order rows get a zero gap instead of a negative one
+        since_last.append(None if last_event_ms is None else max(0, now_ms - last_event_ms) / 1000.0)
+        recent_ms = [ts for ts in recent_ms if now_ms - ts < LONG_WINDOW_MS]
+        recent_ms.append(now_ms)
+        recent_ms = recent_ms[-VELOCITY_MAX_RECENT:]
+        count_long.append(len(recent_ms))
+        count_short.append(sum(1 for ts in recent_ms if now_ms - ts < SHORT_WINDOW_MS))
+
+        std = (m2 / (txn_count - 1)) ** 0.5 if txn_count >= 2 else 0.0
+        zscore.append((amount - mean) / std if std > 0 else None)
+        txn_count += 1
+        delta = amount - mean
+        mean += delta / txn_count
+        m2 += delta * (amount - mean)
+
+        new_merchant.append(txn_count > 1 and merchant not in merchants)
+        new_city.append(txn_count > 1 and city not in cities)
+        merchants = _remember(merchants, merchant, VELOCITY_MAX_PLACES)
+        cities = _remember(cities, city, VELOCITY_MAX_PLACES)
+        last_event_ms = now_ms if last_event_ms is None else max(now_ms, last_event_ms)
+
+    state.update((last_event_ms, txn_count, mean, m2, recent_ms, merchants, cities))
+    state.setTimeoutDuration(timeout_seconds * 1000)
+
+    yield pdf.assign(
+        seconds_since_last_txn=np.array(since_last, dtype=np.float64),
+        card_txn_count_1h=np.array(count_short, dtype=np.int32),
+        card_txn_count_24h=np.array(count_long, dtype=np.int32),
+        amount_zscore=np.array(zscore, dtype=np.float64),
+        is_new_merchant=np.array(new_merchant, dtype=bool),
+        is_new_city=np.array(new_city, dtype=bool),
+    )
+
+
+class _BatchGroupState:
+    """Stand-in for ``GroupState`` when a card's rows are processed in a single batch."""
+
+    exists = False
+    hasTimedOut = False
+
+    def update(self, value) -> None:
+        pass
+
+    def setTimeoutDuration(self, duration) -> None:
+        pass
+
+
+def _update_card_batch(key: Tuple, pdf: pd.DataFrame) -> pd.DataFrame:
+    """``applyInPandas`` function: the features of one card's full history, from an empty state."""
+    return next(update_card_state(key, iter([pdf]), _BatchGroupState()))
+
+
+def add_velocity_features(df, timeout_seconds: int = VELOCITY_STATE_TIMEOUT):
+    """Append the per-card velocity feature columns to a transaction stream.
+
+    ``df`` must contain ``User``, ``Card``, ``transaction_datetime``,
+    ``Amount_USD``, ``Merchant Name`` and ``Merchant City``; all of its columns
+    are passed through, so project it to what the sinks need first. Cards idle
+    for ``timeout_seconds`` of processing time are evicted.
+
+    Processing-time timeouts make every trigger a candidate batch, so a query
+    using this operator does not finish under ``Trigger.AvailableNow``; stop it
+    explicitly once its input is consumed. Batch frames are grouped per card
+    with ``applyInPandas`` instead, as the stateful operator is streaming only.
+    """
+    output_schema = StructType(df.schema.fields + FEATURE_FIELDS)
+    if not df.isStreaming:
+        return df.groupBy("User", "Card").applyInPandas(_update_card_batch, schema=output_schema)
+    return df.groupBy("User", "Card").applyInPandasWithState(
+        functools.partial(update_card_state, timeout_seconds=timeout_seconds),
+        outputStructType=output_schema,
+        stateStructType=STATE_SCHEMA,
+        outputMode="append",
+        timeoutConf=GroupStateTimeout.ProcessingTimeTimeout,
+    )
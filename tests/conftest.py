@@ -0,0 +1,23 @@
+"""Shared fixtures: one local Spark session for the run and per-test output locations."""
+import pytest
+
+
+@pytest.fixture(scope="session")
+def spark():
+    pytest.importorskip("pyspark")
+    from src.benchmarks import create_local_spark
+
+    session = create_local_spark("CreditCardTests")
+    session.conf.set("spark.sql.shuffle.partitions", "4")
+    yield session
+    session.stop()
+
+
+@pytest.fixture
+def output_uri(tmp_path, monkeypatch):
+    """Point the Spark consumer's sinks at a fresh directory for one test."""
+    from src import spark_streaming_consumer as consumer
+
+    uri = str(tmp_path / "output")
+    monkeypatch.setattr(consumer, "OUTPUT_URI", uri)
+    return uri
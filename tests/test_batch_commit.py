@@ -0,0 +1,65 @@
+"""Idempotent per-batch commits across a crash, a restart and a fresh checkpoint."""
+import csv
+
+from src import spark_streaming_consumer as consumer
+from src.backfill import read_csv_transactions
+from src.benchmarks import STREAM_CSV_COLUMNS, _write_replay_chunks
+
+
+def test_restart_replays_without_duplicates(spark, output_uri, tmp_path):
+    """The input repeats some rows (a producer retry) and the first attempt of
+    one batch fails after its files are committed but before Spark records
+    the batch, so the restarted query replays it. A query on a fresh
+    checkpoint then writes the same input again, numbering its batches from 0
+    anew, and must leave the first query's files alone.
+    """
+    crash_batch = 2
+    source = tmp_path / "source"
+    source.mkdir()
+    _write_replay_chunks(source, 1200, chunks=4, rounds=1)
+    # A retried send: the first 50 rows of part 1 arrive again in the same file
+    with (source / "part-00001.csv").open("r", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    with (source / "part-00001.csv").open("w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=STREAM_CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows + rows[:50])
+
+    write_batch = consumer.make_fanout_writer(spark, ["transactions"])
+    attempts = {}
+
+    def crashing_writer(batch_df, batch_id):
+        write_batch(batch_df, batch_id)
+        attempts[batch_id] = attempts.get(batch_id, 0) + 1
+        if batch_id == crash_batch and attempts[batch_id] == 1:
+            raise RuntimeError(f"simulated crash after committing batch {batch_id}")
+
+    def run(checkpoint: str = "checkpoint"):
+        df_output = consumer.enrich_transactions(read_csv_transactions(spark, str(source), True, 1))
+        query = (
+            consumer.build_pipeline(df_output, velocity=False)
+            .writeStream.outputMode("append")
+            .foreachBatch(crashing_writer)
+            .option("checkpointLocation", str(tmp_path / checkpoint))
+            .trigger(availableNow=True)
+            .start()
+        )
+        try:
+            query.awaitTermination()
+        except Exception:
+            pass
+
+    run()
+    run()
+    output = spark.read.parquet(consumer.output_path("transactions"))
+    total, distinct = output.count(), output.select("event_id").distinct().count()
+    expected = (
+        read_csv_transactions(spark, str(source)).filter("`Errors?` IS NULL OR `Errors?` = ''")
+        .select("event_id").distinct().count()
+    )
+    assert attempts.get(crash_batch) == 2, attempts
+    assert total == distinct == expected, (total, distinct, expected)
+
+    run("checkpoint_fresh")
+    after_fresh = spark.read.parquet(consumer.output_path("transactions")).count()
+    assert after_fresh == 2 * expected, (after_fresh, expected)
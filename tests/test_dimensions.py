@@ -0,0 +1,71 @@
+"""Dimension lookups never shuffle the stream side and reload without a restart."""
+import os
+import shutil
+
+import pandas as pd
+
+from src.benchmarks import STREAM_CSV_COLUMNS, load_sample_rows
+from src.dimensions import (
+    MCC_TABLE,
+    MCC_TABLE_PATH,
+    MERCHANT_TABLE,
+    DimensionTable,
+    apply_dimensions,
+    build_merchant_risk,
+)
+
+
+def test_dimension_join_plan(spark, tmp_path):
+    (tmp_path / "source").mkdir()
+    rows = load_sample_rows(400)
+    for index in range(2):
+        pd.DataFrame(rows[index * 200:(index + 1) * 200])[STREAM_CSV_COLUMNS].to_csv(
+            tmp_path / "source" / f"part-{index}.csv", index=False
+        )
+    mcc_path = tmp_path / "mcc_codes.csv"
+    merchant_path = tmp_path / "merchant_risk.csv"
+    shutil.copy(MCC_TABLE_PATH, mcc_path)
+    build_merchant_risk().to_csv(merchant_path, index=False)
+
+    # Map lookup for the MCC table, broadcast join for the merchant table
+    tables = [
+        DimensionTable(mcc_path, MCC_TABLE.key, MCC_TABLE.stream_key, MCC_TABLE.columns, map_max_rows=200),
+        DimensionTable(
+            merchant_path, MERCHANT_TABLE.key, MERCHANT_TABLE.stream_key, MERCHANT_TABLE.columns, map_max_rows=0
+        ),
+    ]
+    results = {}
+
+    def check_batch(batch_df, batch_id):
+        enriched = apply_dimensions(spark, batch_df, tables)
+        rows = enriched.select("MCC", "mcc_category", "merchant_risk_level").collect()
+        plan = enriched._jdf.queryExecution().executedPlan().toString()
+        results[batch_id] = {"rows": rows, "plan": plan}
+        if batch_id == 0:
+            # Recategorise groceries; the next batch must see it without a restart
+            table = pd.read_csv(mcc_path, dtype=str)
+            table.loc[table["mcc"] == "5411", "category"] = "Groceries (reloaded)"
+            table.to_csv(mcc_path, index=False)
+            os.utime(mcc_path, (os.path.getmtime(mcc_path) + 10,) * 2)
+
+    schema = ", ".join(f"`{name}` string" for name in STREAM_CSV_COLUMNS)
+    query = (
+        spark.readStream.schema(schema)
+        .option("header", "true")
+        .option("maxFilesPerTrigger", 1)
+        .csv(str(tmp_path / "source"))
+        .writeStream.foreachBatch(check_batch)
+        .option("checkpointLocation", str(tmp_path / "checkpoint"))
+        .trigger(availableNow=True)
+        .start()
+    )
+    query.awaitTermination()
+
+    assert sorted(results) == [0, 1], sorted(results)
+    for result in results.values():
+        plan = result["plan"]
+        assert "BroadcastHashJoin" in plan, plan
+        assert "SortMergeJoin" not in plan and "Exchange hashpartitioning" not in plan, plan
+        assert all(row["mcc_category"] for row in result["rows"]), "unmatched MCC codes"
+    categories = [{row["mcc_category"] for row in results[i]["rows"] if row["MCC"] == "5411"} for i in (0, 1)]
+    assert categories == [{"Food and Grocery"}, {"Groceries (reloaded)"}], categories
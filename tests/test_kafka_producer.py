@@ -0,0 +1,147 @@
+"""Offline tests of the sharded, checkpointed replay (no broker needed)."""
+from functools import partial
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Optional
+
+import pytest
+
+pytest.importorskip("kafka")
+
+from kafka.future import Future
+
+from src import kafka_producer
+from src.kafka_producer import (
+    BATCH_SIZE,
+    CSV_FILE_PATH,
+    LINGER_MS,
+    RECORD_ID_STRIDE,
+    SPEEDUP,
+    TARGET_RATE,
+    TOPIC_NAME,
+    _read_json,
+    build_line_index,
+    read_and_send_csv,
+    replay_files,
+    resolve_inputs,
+)
+
+
+class SimulatedCrash(BaseException):
+    """Raised by ``LocalProducer`` to stop a replay the way Ctrl-C would."""
+
+
+class LocalProducer:
+    """A ``KafkaProducer`` stand-in recording acknowledged record_ids.
+
+    Records are acknowledged in reverse batches, one of each batch held back
+    until the next, like acks arriving out of order from several partitions.
+    Sending ``crash_at`` raises ``SimulatedCrash`` and loses the records not
+    yet acknowledged.
+    """
+
+    def __init__(self, delivered: List[int], crash_at: Optional[int] = None, **config):
+        self.delivered = delivered
+        self.crash_at = crash_at
+        self._pending = []
+
+    def send(self, topic, key=None, value=None, headers=None):
+        if value["record_id"] == self.crash_at:
+            self._pending.clear()
+            raise SimulatedCrash(f"crashed sending record {self.crash_at}")
+        future = Future()
+        self._pending.append((future, value["record_id"]))
+        if len(self._pending) >= 8:
+            held = self._pending.pop(1)
+            self.flush()
+            self._pending.append(held)
+        return future
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        for future, record_id in reversed(pending):
+            self.delivered.append(record_id)
+            future.success(SimpleNamespace(
+                partition=0, offset=len(self.delivered), serialized_key_size=8, serialized_value_size=200
+            ))
+
+    def close(self):
+        pass
+
+
+OPTIONS = {
+    "linger_ms": LINGER_MS, "batch_size": BATCH_SIZE, "compression_type": None, "wire_format": "json",
+    "mode": "max", "rate": TARGET_RATE, "speedup": SPEEDUP, "max_in_flight": 50,
+    "key_strategy": "card", "topic": TOPIC_NAME, "log_every": 0,
+}
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    """Two replay files cut from the sample: a.csv with a blank line and no final newline, b.csv plain."""
+    with CSV_FILE_PATH.open("rb") as file:
+        header, *lines = file.read().splitlines(keepends=True)[:1202]
+    directory = tmp_path / "inputs"
+    directory.mkdir()
+    body = b"".join(lines[:333]) + b"\n" + b"".join(lines[333:700]).rstrip(b"\n")
+    (directory / "a.csv").write_bytes(header + body)
+    (directory / "b.csv").write_bytes(header + b"".join(lines[700:1200]))
+    return directory, lines[1200]
+
+
+def test_line_index_matches_a_line_by_line_read(inputs):
+    directory, _ = inputs
+    paths = resolve_inputs([str(directory)])
+    assert [path.name for path in paths] == ["a.csv", "b.csv"]
+    for path in paths:
+        with path.open("rb") as file:
+            starts, position = [], len(file.readline())
+            for raw in file:
+                starts.append(position)
+                position += len(raw)
+        offsets, count = build_line_index(path, 100)
+        assert count == len(starts) and offsets == starts[::100], (path, count, len(starts))
+
+
+def test_crashed_replay_resumes_at_the_first_unacknowledged_line(inputs, tmp_path: Path):
+    directory, extra_line = inputs
+    paths = resolve_inputs([str(directory)])
+    checkpoint = tmp_path / "checkpoint"
+    expected = set(range(0, 333)) | set(range(334, 701)) | {RECORD_ID_STRIDE + line for line in range(500)}
+
+    first: List[int] = []
+    with pytest.raises(SimulatedCrash):
+        replay_files(paths, OPTIONS, 1, 100, checkpoint, producer_factory=partial(LocalProducer, first, 450))
+    saved = _read_json(checkpoint / "0" / "shard-0000000400.json")
+    watermark = min(set(range(400, 500)) - set(first))
+    assert saved["next_line"] == watermark, (saved, watermark)
+
+    second: List[int] = []
+    replay_files(paths, OPTIONS, 1, 100, checkpoint, producer_factory=partial(LocalProducer, second))
+    resent = set(first) & set(second)
+    assert set(first) | set(second) == expected, len(set(first) | set(second) ^ expected)
+    assert len(second) == len(set(second)) and len(first) == len(set(first))
+    assert all(watermark < record_id < 500 for record_id in resent), sorted(resent)
+    assert min(record_id for record_id in second if record_id < RECORD_ID_STRIDE) == watermark
+
+    # A finished replay sends nothing; a changed file is replayed from the start
+    third: List[int] = []
+    replay_files(paths, OPTIONS, 1, 100, checkpoint, producer_factory=partial(LocalProducer, third))
+    assert not third, len(third)
+    with (directory / "b.csv").open("ab") as file:
+        file.write(extra_line)
+    replay_files(paths, OPTIONS, 1, 100, checkpoint, producer_factory=partial(LocalProducer, third))
+    assert sorted(third) == [RECORD_ID_STRIDE + line for line in range(501)], len(third)
+
+    totals = replay_files(
+        paths, OPTIONS, 2, 100, checkpoint, fresh=True, producer_factory=partial(LocalProducer, [])
+    )
+    assert totals["acked"] == totals["sent"] == len(expected) + 1 and totals["shards"] == 14, totals
+
+
+def test_read_and_send_csv_sends_the_file_through_send_rows(inputs, monkeypatch):
+    directory, _ = inputs
+    monkeypatch.setattr(kafka_producer, "CSV_FILE_PATH", directory / "b.csv")
+    delivered: List[int] = []
+    read_and_send_csv(LocalProducer(delivered), max_in_flight=50, log_every=0)
+    assert sorted(delivered) == list(range(500))
@@ -0,0 +1,81 @@
+"""The rate cache against a local stand-in for the VietcomBank endpoint."""
+import http.server
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import pytest
+
+from src.exchange_rate_scraper import ExchangeRateScraper
+from src.rate_cache import BASE_DIR, ExchangeRateCache
+
+
+FIXTURES_DIR = BASE_DIR / "data" / "fixtures"
+
+
+def serve_fixtures(directory: Path = FIXTURES_DIR, routes: Optional[Dict[str, str]] = None):
+    """Start a local stand-in for the VietcomBank endpoints on a free port.
+
+    ``routes`` maps request paths to fixture file names; the default serves the
+    recorded ``pXML.aspx`` response. Returns the running server; its base URL is
+    ``f"http://127.0.0.1:{server.server_port}"``.
+    """
+    routes = routes or {"/Usercontrols/TVPortal.TyGia/pXML.aspx": "vcb_exrates.xml"}
+
+    class FixtureHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = routes.get(self.path.split("?", 1)[0])
+            if not name:
+                self.send_error(404)
+                return
+            body = (Path(directory) / name).read_bytes()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml" if name.endswith(".xml") else "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def server():
+    server = serve_fixtures()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_rate_cache_serves_stale_rates_and_cold_starts_from_the_snapshot(server, tmp_path):
+    api_url = f"http://127.0.0.1:{server.server_port}/Usercontrols/TVPortal.TyGia/pXML.aspx"
+    scraper = ExchangeRateScraper(api_url=api_url)
+    snapshot = tmp_path / "rates.json"
+
+    cache = ExchangeRateCache(
+        fetcher=scraper.get_exchange_rate_api, ttl=1, refresh_interval=0.2, retry_interval=0.2,
+        snapshot_path=snapshot,
+    ).start()
+    assert cache.wait_ready(5), "cache never became ready"
+    usd = cache.get_rate("USD")
+    assert usd == 26080.0
+
+    # Outage: the rate source disappears, reads keep returning the last good value
+    server.shutdown()
+    server.server_close()
+    time.sleep(1.5)
+    started = time.perf_counter()
+    stale = cache.get_rate("USD")
+    assert (time.perf_counter() - started) < 0.1
+    assert stale == usd and cache.is_stale()
+    cache.stop()
+
+    # Cold start from the snapshot: no network needed
+    cold = ExchangeRateCache(fetcher=lambda: None, snapshot_path=snapshot)
+    assert cold.wait_ready(0), "snapshot was not loaded"
+    assert cold.get_rate("USD") == usd and cold.currencies()
@@ -0,0 +1,55 @@
+"""Rollups merged over several batches answer like the raw rows."""
+from pyspark.sql.functions import col, lit, pmod, round, xxhash64
+
+from src.backfill import read_csv_transactions
+from src.batch_commit import scoped_commits
+from src.benchmarks import SAMPLE_CSV
+from src.rollups import ROLLUP_TABLES, _generations, _list_months, query_totals, update_rollups
+from src.spark_streaming_consumer import build_pipeline, enrich_batch, enrich_transactions
+
+
+QUERIES = [
+    (["event_date", "User"], {}, None, None, "daily_user"),
+    (["transaction_year", "MCC"], {}, None, None, "daily_mcc"),
+    (["transaction_type"], {}, "2010-01-01", "2014-12-31", "daily_transaction_type"),
+    (["event_date"], {"Merchant State": "CA"}, None, None, "daily_merchant_state"),
+    (["User", "MCC"], {}, None, None, "transactions"),
+]
+
+
+def test_rollups_match_raw(spark, tmp_path):
+    """One batch is replayed after a crash, and the last one comes from a query
+    on a fresh checkpoint, whose batch ids start from 0 again.
+    """
+    batches = 4
+    raw = enrich_batch(spark, build_pipeline(enrich_transactions(read_csv_transactions(spark, str(SAMPLE_CSV)))))
+    raw.write.parquet(str(tmp_path / "raw"))
+    raw = spark.read.parquet(str(tmp_path / "raw"))
+    root = str(tmp_path / "rollups")
+    parts = [raw.filter(pmod(xxhash64(col("event_id")), lit(batches)) == part) for part in range(batches)]
+    with scoped_commits(spark, "test"):
+        for batch_id, batch in enumerate(parts[:-1]):
+            update_rollups(batch, batch_id, root)
+            if batch_id == 1:
+                update_rollups(batch, batch_id, root)  # replayed after a crash
+    # A query on a fresh checkpoint numbers its batches from 0 again
+    with scoped_commits(spark, "test"):
+        update_rollups(parts[-1], 0, root)
+
+    generations = [
+        len(_generations(files))
+        for table in ROLLUP_TABLES
+        for files in _list_months(spark, f"{root}/{table}").values()
+    ]
+    assert max(generations) <= 2, generations
+
+    for by, where, start, end, expected_source in QUERIES:
+        answer, source = query_totals(spark, by, start, end, where, root, str(tmp_path / "raw"))
+        expected, _ = query_totals(spark, by, start, end, where, root, str(tmp_path / "raw"), use_rollups=False)
+        assert source == expected_source, (by, where, source)
+        columns = [f"`{column}`" for column in by] + ["transaction_count", "fraud_count"]
+        # Sums are added in a different order, so amounts are compared in cents
+        answer = answer.select(*columns, round(col("amount_usd"), 2).alias("amount_usd"))
+        expected = expected.select(*columns, round(col("amount_usd"), 2).alias("amount_usd"))
+        mismatched = answer.exceptAll(expected).count() + expected.exceptAll(answer).count()
+        assert mismatched == 0, (by, where, mismatched)